@@ -1,11 +1,10 @@
-from django.db.models import Q
 from rest_framework import serializers, viewsets
 
-from brambling.api.v1.permissions import BaseOrderPermission
+from brambling.api.v1.permissions import BaseOrderPermission, filter_visible_orders
+from brambling.api.v1.serializers import SparseFieldsMixin, get_requested_fields, wants_field
 from brambling.models import (
     Attendee,
     EnvironmentalFactor,
-    Order,
 )
 
 
@@ -20,7 +19,7 @@ class AttendeePermission(BaseOrderPermission):
         return self._has_order_permission(request, attendee.order)
 
 
-class AttendeeSerializer(serializers.HyperlinkedModelSerializer):
+class AttendeeSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     ef_cause = serializers.SlugRelatedField(
         slug_field='name',
         queryset=EnvironmentalFactor.objects.all(),
@@ -46,6 +45,13 @@ class AttendeeSerializer(serializers.HyperlinkedModelSerializer):
             'other_needs', 'full_name',
         )
 
+    @classmethod
+    def setup_eager_loading(cls, queryset, prefix='', fields=None):
+        return queryset.prefetch_related(*[
+            prefix + field for field in ('ef_cause', 'ef_avoid', 'housing_prefer')
+            if wants_field(fields, field)
+        ])
+
     def get_full_name(self, obj):
         return obj.get_full_name()
 
@@ -56,24 +62,12 @@ class AttendeeViewSet(viewsets.ModelViewSet):
     permission_classes = [AttendeePermission]
 
     def get_queryset(self):
-        qs = self.queryset.all().distinct()
+        qs = self.get_serializer_class().setup_eager_loading(
+            self.queryset.all(),
+            fields=get_requested_fields(self.request),
+        )
 
         if 'order' in self.request.GET:
             qs = qs.filter(order=self.request.GET['order'])
 
-        # Superusers can see all the things.
-        if self.request.user.is_superuser:
-            return qs
-
-        # Otherwise, if you're authenticated, you can see them
-        # if the order is yours or you administer the related event.
-        if self.request.user.is_authenticated():
-            return qs.filter(
-                Q(order__person=self.request.user) |
-                Q(order__event__members=self.request.user) |
-                Q(order__event__organization__members=self.request.user)
-            )
-
-        # Otherwise, you can view for orders in your session.
-        session_orders = Order.objects._get_session(self.request)
-        return qs.filter(order__code__in=session_orders.values())
+        return filter_visible_orders(self.request, qs, 'order')
@@ -1,12 +1,13 @@
-from django.db.models import Q
 from django.utils import timezone
 from rest_framework import serializers, viewsets
 from rest_framework.fields import empty
 
-from brambling.api.v1.permissions import BaseOrderPermission
+from brambling.api.v1.permissions import BaseOrderPermission, filter_visible_orders
+from brambling.api.v1.serializers import SparseFieldsMixin, get_requested_fields, wants_field
 from brambling.models import (
     Attendee,
     BoughtItem,
+    ItemOption,
     Order,
 )
 
@@ -26,7 +27,7 @@ class BoughtItemPermission(BaseOrderPermission):
         return self._has_order_permission(request, boughtitem.order)
 
 
-class BoughtItemSerializer(serializers.HyperlinkedModelSerializer):
+class BoughtItemSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     status = serializers.ChoiceField(choices=(BoughtItem.STATUS_CHOICES), default=BoughtItem.RESERVED)
     order = serializers.HyperlinkedRelatedField(view_name='order-detail', queryset=Order.objects.all())
     attendee = serializers.HyperlinkedRelatedField(view_name='attendee-detail', queryset=Attendee.objects.all(), allow_null=True)
@@ -41,13 +42,27 @@ class BoughtItemSerializer(serializers.HyperlinkedModelSerializer):
 
         if self.instance is not None:
             # If this is not a creation, set various fields to read-only
-            self.fields['status'].read_only = True
-            # Workaround for https://github.com/tomchristie/django-rest-framework/issues/3565
-            self.fields['status'].default = empty
-            self.fields['order'].read_only = True
-            self.fields['item_option'].read_only = True
+            # (unless they were left out of a sparse fieldset).
+            if 'status' in self.fields:
+                self.fields['status'].read_only = True
+                # Workaround for https://github.com/tomchristie/django-rest-framework/issues/3565
+                self.fields['status'].default = empty
+            for name in ('order', 'item_option'):
+                if name in self.fields:
+                    self.fields[name].read_only = True
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, prefix='', fields=None):
+        # The other related fields are hyperlinked by pk, but the link's
+        # name includes the order code.
+        if wants_field(fields, 'link'):
+            queryset = queryset.select_related(prefix + 'order')
+        return queryset
 
     def create(self, validated_data):
+        order = validated_data['order']
+        if order.cart_is_expired():
+            order.delete_cart()
         item_option = validated_data['item_option']
         validated_data.update({
             'item_name': item_option.item.name,
@@ -55,7 +70,9 @@ class BoughtItemSerializer(serializers.HyperlinkedModelSerializer):
             'item_option_name': item_option.item.name,
             'price': item_option.price,
         })
-        instance = super(BoughtItemSerializer, self).create(validated_data)
+        instance = ItemOption.objects.reserve(**validated_data)
+        if instance is None:
+            raise serializers.ValidationError({'item_option': ['That item is sold out.']})
 
         if instance.order.cart_start_time is None:
             instance.order.cart_start_time = timezone.now()
@@ -77,7 +94,10 @@ class BoughtItemViewSet(viewsets.ModelViewSet):
     permission_classes = [BoughtItemPermission]
 
     def get_queryset(self):
-        qs = self.queryset.all().distinct()
+        qs = self.get_serializer_class().setup_eager_loading(
+            self.queryset.all(),
+            fields=get_requested_fields(self.request),
+        )
 
         if 'order' in self.request.GET:
             qs = qs.filter(order=self.request.GET['order'])
@@ -85,26 +105,10 @@ class BoughtItemViewSet(viewsets.ModelViewSet):
         if 'status[]' in self.request.GET:
             qs = qs.filter(status__in=self.request.GET.getlist('status[]'))
 
-        # Superusers can see all the things.
-        if self.request.user.is_superuser:
-            return qs
-
-        # Otherwise, if you're authenticated, you can see them
-        # if the order is yours or you administer the related event.
-        if self.request.user.is_authenticated():
-            return qs.filter(
-                Q(order__person=self.request.user) |
-                Q(order__event__members=self.request.user) |
-                Q(order__event__organization__members=self.request.user)
-            )
-
-        # Otherwise, you can view for orders in your session.
-        session_orders = Order.objects._get_session(self.request)
-        return qs.filter(order__code__in=session_orders.values())
+        return filter_visible_orders(self.request, qs, 'order')
 
     def perform_destroy(self, instance):
         order = instance.order
         instance.delete()
         if not order.has_cart():
-            order.cart_start_time = None
-            order.save()
+            order.delete_cart()
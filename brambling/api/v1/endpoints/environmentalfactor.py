@@ -1,10 +1,11 @@
 from rest_framework import serializers, viewsets
 
 from brambling.api.v1.permissions import IsAdminUserOrReadOnly
+from brambling.api.v1.serializers import SparseFieldsMixin
 from brambling.models import EnvironmentalFactor
 
 
-class EnvironmentalFactorSerializer(serializers.ModelSerializer):
+class EnvironmentalFactorSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     link = serializers.HyperlinkedIdentityField(view_name='environmentalfactor-detail')
 
     class Meta:
@@ -1,6 +1,7 @@
 from rest_framework import serializers, viewsets
 
 from brambling.api.v1.permissions import BaseEventPermission
+from brambling.api.v1.serializers import SparseFieldsMixin, get_requested_fields, wants_field
 from brambling.models import (
     DanceStyle,
     Event,
@@ -16,7 +17,7 @@ class EventPermission(BaseEventPermission):
         return self._has_event_permission(request, event)
 
 
-class EventSerializer(serializers.HyperlinkedModelSerializer):
+class EventSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     """Serializes public data for an event."""
     dance_styles = serializers.SlugRelatedField(
         slug_field='name',
@@ -36,8 +37,20 @@ class EventSerializer(serializers.HyperlinkedModelSerializer):
             'timezone', 'currency', 'cart_timeout'
         )
 
+    @classmethod
+    def setup_eager_loading(cls, queryset, prefix='', fields=None):
+        if wants_field(fields, 'dance_styles'):
+            queryset = queryset.prefetch_related(prefix + 'dance_styles')
+        return queryset
+
 
 class EventViewSet(viewsets.ModelViewSet):
     queryset = Event.objects.all()
     serializer_class = EventSerializer
     permission_classes = [EventPermission]
+
+    def get_queryset(self):
+        return self.get_serializer_class().setup_eager_loading(
+            self.queryset.all(),
+            fields=get_requested_fields(self.request),
+        )
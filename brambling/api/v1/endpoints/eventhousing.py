@@ -1,12 +1,11 @@
-from django.db.models import Q
 from rest_framework import serializers, viewsets
 
-from brambling.api.v1.permissions import BaseOrderPermission
+from brambling.api.v1.permissions import BaseOrderPermission, filter_visible_orders
+from brambling.api.v1.serializers import SparseFieldsMixin, get_requested_fields, wants_field
 from brambling.models import (
     EventHousing,
     EnvironmentalFactor,
     HousingCategory,
-    Order,
 )
 
 
@@ -24,7 +23,7 @@ class EventHousingPermission(BaseOrderPermission):
         return self._has_order_permission(request, eventhousing.order)
 
 
-class EventHousingSerializer(serializers.HyperlinkedModelSerializer):
+class EventHousingSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     ef_present = serializers.SlugRelatedField(
         slug_field='name',
         queryset=EnvironmentalFactor.objects.all(),
@@ -53,6 +52,13 @@ class EventHousingSerializer(serializers.HyperlinkedModelSerializer):
             'person_avoid', 'housing_categories',
         )
 
+    @classmethod
+    def setup_eager_loading(cls, queryset, prefix='', fields=None):
+        return queryset.prefetch_related(*[
+            prefix + field for field in ('ef_present', 'ef_avoid', 'housing_categories')
+            if wants_field(fields, field)
+        ])
+
 
 class EventHousingViewSet(viewsets.ModelViewSet):
     queryset = EventHousing.objects.all()
@@ -60,21 +66,9 @@ class EventHousingViewSet(viewsets.ModelViewSet):
     permission_classes = [EventHousingPermission]
 
     def get_queryset(self):
-        qs = self.queryset.all()
-
-        # Superusers can see all the things.
-        if self.request.user.is_superuser:
-            return qs
-
-        # Otherwise, if you're authenticated, you can see them
-        # if the order is yours or you administer the related event.
-        if self.request.user.is_authenticated():
-            return qs.filter(
-                Q(order__person=self.request.user) |
-                Q(order__event__members=self.request.user) |
-                Q(order__event__organization__members=self.request.user)
-            )
+        qs = self.get_serializer_class().setup_eager_loading(
+            self.queryset.all(),
+            fields=get_requested_fields(self.request),
+        )
 
-        # Otherwise, you can view for orders in your session.
-        session_orders = Order.objects._get_session(self.request)
-        return qs.filter(order__code__in=session_orders.values())
+        return filter_visible_orders(self.request, qs, 'order')
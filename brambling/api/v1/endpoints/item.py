@@ -1,9 +1,11 @@
+from django.db.models import Prefetch
 from rest_framework import serializers, viewsets
 
 from brambling.api.v1.permissions import BaseEventPermission
+from brambling.api.v1.serializers import SparseFieldsMixin, get_requested_fields, wants_field
 from brambling.api.v1.endpoints.itemoption import ItemOptionSerializer
 from brambling.api.v1.endpoints.itemimage import ItemImageSerializer
-from brambling.models import Item
+from brambling.models import Item, ItemOption
 
 
 class ItemPermission(BaseEventPermission):
@@ -11,7 +13,7 @@ class ItemPermission(BaseEventPermission):
         return self._has_event_permission(request, item.event)
 
 
-class ItemSerializer(serializers.HyperlinkedModelSerializer):
+class ItemSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     link = serializers.HyperlinkedIdentityField(view_name='item-detail')
     options = ItemOptionSerializer(many=True)
     images = ItemImageSerializer(many=True)
@@ -21,6 +23,16 @@ class ItemSerializer(serializers.HyperlinkedModelSerializer):
         fields = ('id', 'link', 'name', 'description', 'event', 'created',
                   'last_modified', 'options', 'images')
 
+    @classmethod
+    def setup_eager_loading(cls, queryset, prefix='', fields=None):
+        if wants_field(fields, 'options'):
+            queryset = queryset.prefetch_related(
+                Prefetch(prefix + 'options', queryset=ItemOption.objects.with_sales()),
+            )
+        if wants_field(fields, 'images'):
+            queryset = queryset.prefetch_related(prefix + 'images')
+        return queryset
+
 
 class ItemViewSet(viewsets.ModelViewSet):
     queryset = Item.objects.all()
@@ -28,7 +40,10 @@ class ItemViewSet(viewsets.ModelViewSet):
     permission_classes = [ItemPermission]
 
     def get_queryset(self):
-        qs = Item.objects.all()
+        qs = self.get_serializer_class().setup_eager_loading(
+            self.queryset.all(),
+            fields=get_requested_fields(self.request),
+        )
 
         if 'event' in self.request.GET:
             qs = qs.filter(event=self.request.GET['event'])
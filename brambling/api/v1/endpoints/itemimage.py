@@ -2,6 +2,7 @@ from django.core.urlresolvers import reverse
 from rest_framework import serializers, viewsets
 
 from brambling.api.v1.permissions import BaseEventPermission
+from brambling.api.v1.serializers import SparseFieldsMixin
 from brambling.models import ItemImage
 
 
@@ -10,7 +11,7 @@ class ItemImagePermission(BaseEventPermission):
         return self._has_event_permission(request, itemimage.item.event)
 
 
-class ItemImageSerializer(serializers.HyperlinkedModelSerializer):
+class ItemImageSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     link = serializers.HyperlinkedIdentityField(view_name='itemimage-detail')
     resize_endpoint = serializers.SerializerMethodField()
 
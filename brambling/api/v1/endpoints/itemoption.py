@@ -1,6 +1,7 @@
 from rest_framework import serializers, viewsets
 
 from brambling.api.v1.permissions import BaseEventPermission
+from brambling.api.v1.serializers import SparseFieldsMixin, get_requested_fields, wants_field
 from brambling.models import (
     BoughtItem,
     ItemOption,
@@ -12,7 +13,7 @@ class ItemOptionPermission(BaseEventPermission):
         return self._has_event_permission(request, itemoption.item.event)
 
 
-class ItemOptionSerializer(serializers.HyperlinkedModelSerializer):
+class ItemOptionSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     link = serializers.HyperlinkedIdentityField(view_name='itemoption-detail')
     taken = serializers.SerializerMethodField()
 
@@ -25,7 +26,9 @@ class ItemOptionSerializer(serializers.HyperlinkedModelSerializer):
     def get_taken(self, obj):
         if hasattr(obj, 'taken'):
             return obj.taken
-        return obj.boughtitem_set.exclude(status=BoughtItem.REFUNDED).count()
+        return obj.boughtitem_set.exclude(
+            status__in=(BoughtItem.REFUNDED, BoughtItem.TRANSFERRED),
+        ).count()
 
 
 class ItemOptionViewSet(viewsets.ModelViewSet):
@@ -34,13 +37,7 @@ class ItemOptionViewSet(viewsets.ModelViewSet):
     permission_classes = [ItemOptionPermission]
 
     def get_queryset(self):
-        qs = super(ItemOptionViewSet, self).get_queryset()
-        qs = qs.extra(select={
-            'taken': """
-SELECT COUNT(*) FROM brambling_boughtitem WHERE
-brambling_boughtitem.item_option_id = brambling_itemoption.id AND
-brambling_boughtitem.status != 'refunded' AND
-brambling_boughtitem.status != 'transferred'
-"""
-        })
-        return qs
+        # The sales counts are only needed for `taken`.
+        if wants_field(get_requested_fields(self.request), 'taken'):
+            return ItemOption.objects.with_sales()
+        return ItemOption.objects.all()
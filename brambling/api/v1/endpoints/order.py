@@ -1,8 +1,8 @@
-from django.db.models import Q
 from rest_framework import viewsets, serializers, status
 from rest_framework.response import Response
 
-from brambling.api.v1.permissions import BaseOrderPermission
+from brambling.api.v1.permissions import BaseOrderPermission, filter_visible_orders
+from brambling.api.v1.serializers import SparseFieldsMixin, get_requested_fields, wants_field
 from brambling.api.v1.endpoints.boughtitem import BoughtItemSerializer
 from brambling.api.v1.endpoints.eventhousing import EventHousingSerializer
 from brambling.models import (
@@ -20,7 +20,7 @@ class OrderPermission(BaseOrderPermission):
         return self._has_order_permission(request, obj)
 
 
-class OrderSerializer(serializers.HyperlinkedModelSerializer):
+class OrderSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     bought_items = BoughtItemSerializer(many=True)
     eventhousing = EventHousingSerializer()
     person = serializers.StringRelatedField()
@@ -38,10 +38,22 @@ class OrderSerializer(serializers.HyperlinkedModelSerializer):
             'notes', 'eventhousing',
         )
 
+    @classmethod
+    def setup_eager_loading(cls, queryset, prefix='', fields=None):
+        if wants_field(fields, 'person'):
+            queryset = queryset.select_related(prefix + 'person')
+        if wants_field(fields, 'bought_items'):
+            # Prefetching also fills in each bought item's order.
+            queryset = queryset.prefetch_related(prefix + 'bought_items')
+        if wants_field(fields, 'eventhousing'):
+            queryset = queryset.select_related(prefix + 'eventhousing')
+            queryset = EventHousingSerializer.setup_eager_loading(queryset, prefix=prefix + 'eventhousing__')
+        return queryset
+
     def to_representation(self, obj):
         data = super(OrderSerializer, self).to_representation(obj)
         # Workaround for https://github.com/SmileyChris/django-countries/issues/106
-        if data['send_flyers_country'] == '':
+        if data.get('send_flyers_country') == '':
             data['send_flyers_country'] = ''
         return data
 
@@ -52,28 +64,12 @@ class OrderViewSet(viewsets.ModelViewSet):
     permission_classes = [OrderPermission]
 
     def get_queryset(self):
-        qs = Order.objects.prefetch_related(
-            'bought_items',
-        ).select_related(
-            'event', 'person', 'eventhousing',
+        qs = self.get_serializer_class().setup_eager_loading(
+            self.queryset.all(),
+            fields=get_requested_fields(self.request),
         )
 
-        # Superusers can see all the things.
-        if self.request.user.is_superuser:
-            return qs
-
-        # Otherwise, if you're authenticated, you can see them
-        # if they are yours or you administer the related event.
-        if self.request.user.is_authenticated():
-            return qs.filter(
-                Q(person=self.request.user) |
-                Q(event__members=self.request.user) |
-                Q(event__organization__members=self.request.user)
-            )
-
-        # Otherwise, you can view orders in your session.
-        session_orders = Order.objects._get_session(self.request)
-        return qs.filter(code__in=session_orders.values())
+        return filter_visible_orders(self.request, qs)
 
     def create(self, request, *args, **kwargs):
         # Bypass the serializer altogether. This actually performs
@@ -2,7 +2,24 @@ from rest_framework import viewsets, filters
 from rest_framework.permissions import BasePermission
 
 from brambling.api.v1.endpoints.order import OrderSerializer
-from brambling.models import Order, Event
+from brambling.api.v1.serializers import get_requested_fields
+from brambling.models import Order, Event, SearchToken
+
+
+class OrderSearchFilter(filters.SearchFilter):
+    """
+    Filters orders using the event's search index, rather than
+    searching across fields.
+
+    """
+    def filter_queryset(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        if not search_terms:
+            return queryset
+        event = view.get_event()
+        for search_term in search_terms:
+            queryset = queryset.filter(SearchToken.objects.order_filter(event, search_term))
+        return queryset
 
 
 class OrderSearchPermission(BasePermission):
@@ -16,13 +33,8 @@ class OrderSearchViewSet(viewsets.ReadOnlyModelViewSet):
     "A ViewSet that filters orders based on a single search term."
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
-    filter_backends = (filters.SearchFilter,)
+    filter_backends = (OrderSearchFilter,)
     permission_classes = [OrderSearchPermission]
-    search_fields = (
-        "code", "person__first_name", "person__middle_name",
-        "person__last_name", "attendees__first_name",
-        "attendees__middle_name", "attendees__last_name"
-    )
 
     def get_event(self):
         event_id = self.request.query_params.get('event', None)
@@ -31,10 +43,9 @@ class OrderSearchViewSet(viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         "Filter orders down to those which are for the specific event provided."
 
-        qs = super(OrderSearchViewSet, self).get_queryset().prefetch_related(
-            'bought_items',
-        ).select_related(
-            'event', 'person', 'eventhousing',
+        qs = self.get_serializer_class().setup_eager_loading(
+            super(OrderSearchViewSet, self).get_queryset(),
+            fields=get_requested_fields(self.request),
         )
 
         event = self.get_event()
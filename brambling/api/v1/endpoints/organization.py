@@ -1,6 +1,7 @@
 from rest_framework import serializers, viewsets
 from rest_framework.permissions import BasePermission, SAFE_METHODS
 
+from brambling.api.v1.serializers import SparseFieldsMixin, get_requested_fields, wants_field
 from brambling.models import (
     DanceStyle,
     Organization,
@@ -30,7 +31,7 @@ class OrganizationPermission(BasePermission):
         return False
 
 
-class OrganizationSerializer(serializers.HyperlinkedModelSerializer):
+class OrganizationSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     """Serializes public data for an organization."""
     dance_styles = serializers.SlugRelatedField(
         slug_field='name',
@@ -47,8 +48,20 @@ class OrganizationSerializer(serializers.HyperlinkedModelSerializer):
             'dance_styles',
         )
 
+    @classmethod
+    def setup_eager_loading(cls, queryset, prefix='', fields=None):
+        if wants_field(fields, 'dance_styles'):
+            queryset = queryset.prefetch_related(prefix + 'dance_styles')
+        return queryset
+
 
 class OrganizationViewSet(viewsets.ModelViewSet):
     queryset = Organization.objects.all()
     serializer_class = OrganizationSerializer
     permission_classes = [OrganizationPermission]
+
+    def get_queryset(self):
+        return self.get_serializer_class().setup_eager_loading(
+            self.queryset.all(),
+            fields=get_requested_fields(self.request),
+        )
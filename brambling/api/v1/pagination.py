@@ -0,0 +1,28 @@
+from rest_framework import pagination
+
+
+class CursorPagination(pagination.CursorPagination):
+    """
+    Pages through lists by primary key, so pages stay stable while new
+    rows are inserted. Pagination is opt-in: lists are only paginated
+    if the request asks for a page size or passes a cursor, so existing
+    clients keep getting plain lists.
+
+    """
+    ordering = 'pk'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def get_page_size(self, request):
+        if self.page_size_query_param in request.query_params:
+            try:
+                page_size = int(request.query_params[self.page_size_query_param])
+            except ValueError:
+                return self.page_size
+            if page_size <= 0:
+                return self.page_size
+            return min(page_size, self.max_page_size)
+        if self.cursor_query_param in request.query_params:
+            return self.page_size
+        return None
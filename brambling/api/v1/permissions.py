@@ -1,6 +1,8 @@
+from django.db.models import Q
 from rest_framework.permissions import BasePermission, SAFE_METHODS
 
-from brambling.models import Order, BoughtItem
+from brambling.models import Order
+from brambling.utils.permissions import get_event_permissions
 
 
 class IsAdminUserOrReadOnly(BasePermission):
@@ -35,35 +37,73 @@ class BaseEventPermission(BasePermission):
         raise NotImplementedError
 
 
+def get_session_orders(request):
+    """
+    Returns a list of (event id, order code) pairs for the orders in
+    the request's session.
+
+    """
+    if not hasattr(request, 'session'):
+        return []
+    return [(int(event_id), code)
+            for event_id, code in Order.objects._get_session(request).items()]
+
+
+def filter_visible_orders(request, queryset, order_field=None):
+    """
+    Filters a queryset down to the objects whose orders the request
+    can see: the user's own orders, orders for events the user is a
+    member of, and unclaimed orders in the request's session.
+    Memberships are looked up ahead of time, so the filter doesn't
+    join the membership tables.
+
+    order_field is the path from the queryset's model to the order, if
+    it isn't the order itself.
+
+    """
+    if request.user.is_superuser:
+        return queryset
+
+    prefix = order_field + '__' if order_field else ''
+    visible = Q()
+    if request.user.is_authenticated():
+        visible |= Q(**{prefix + 'person': request.user})
+        event_ids = [event_id for event_id, perms in get_event_permissions(request.user).items()
+                     if 'view' in perms]
+        if event_ids:
+            visible |= Q(**{prefix + 'event__in': event_ids})
+    for event_id, code in get_session_orders(request):
+        visible |= Q(**{
+            prefix + 'event': event_id,
+            prefix + 'code': code,
+            prefix + 'person__isnull': True,
+        })
+
+    if not visible:
+        return queryset.none()
+    return queryset.filter(visible)
+
+
 class BaseOrderPermission(BasePermission):
     def _has_order_permission(self, request, order):
-        if request.user.has_perm('edit', order.event):
+        user = request.user
+        if user.is_superuser:
             return True
 
-        if order.person_id:
-            if request.user and request.user.is_authenticated() and order.person_id == request.user.id:
+        if user.is_authenticated():
+            # Memberships are loaded once per request rather than
+            # checked for each object.
+            if 'edit' in get_event_permissions(user).get(order.event_id, ()):
                 return True
-            return False
 
-        if request.user and request.user.is_authenticated():
-            # If this person already has an order for this event,
-            # this is not their order. Disallow.
-            if Order.objects.filter(person=request.user, event=order.event).exists():
-                return False
-
-            # If this person doesn't have an order for this event yet,
-            # and this order hasn't been checked out yet, claim it for the user!
-            if order.bought_items.filter(status__in=(BoughtItem.BOUGHT, BoughtItem.REFUNDED)).exists():
-                order.person = request.user
-                order.save()
-                return True
-        else:
-            # Allow if this order is in their session for this event.
-            code = Order.objects._get_session_code(request, order.event)
-            if code == order.code:
-                return True
+        if order.person_id:
+            return user.is_authenticated() and order.person_id == user.id
 
-        return False
+        # Unclaimed orders are only available to the session they were
+        # made in. Checking permissions doesn't claim them; that happens
+        # when the user next visits the event (see
+        # OrderManager.for_request).
+        return (order.event_id, order.code) in get_session_orders(request)
 
     def has_object_permission(self, request, view, obj):
         raise NotImplementedError
@@ -0,0 +1,45 @@
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+
+def get_requested_fields(request):
+    """
+    Returns the set of field names requested with the `fields` query
+    parameter, or None if the request wants every field. Only reads
+    can ask for a sparse fieldset.
+
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    value = request.GET.get('fields')
+    if not value:
+        return None
+    return set(name.strip() for name in value.split(',') if name.strip())
+
+
+def wants_field(fields, name):
+    return fields is None or name in fields
+
+
+class SparseFieldsMixin(object):
+    """
+    Drops the fields that weren't asked for with the `fields` query
+    parameter. Only applies to the top-level serializer; nested
+    serializers always render in full.
+
+    """
+    def get_fields(self):
+        fields = super(SparseFieldsMixin, self).get_fields()
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        if parent is not None:
+            return fields
+
+        requested = get_requested_fields(self.context.get('request'))
+        if requested is None:
+            return fields
+        for name in list(fields):
+            if name not in requested:
+                del fields[name]
+        return fields
@@ -1,8 +1,10 @@
 # encoding: utf-8
 from django.test import TestCase, RequestFactory
+from rest_framework import status
+from rest_framework.test import APITestCase
 
 from brambling.api.v1.endpoints.boughtitem import BoughtItemViewSet
-from brambling.models import EventMember
+from brambling.models import BoughtItem, EventMember
 from brambling.tests.factories import (
     EventFactory,
     OrderFactory,
@@ -62,3 +64,32 @@ class BoughtItemViewSetTestCase(TestCase):
         qs = viewset.get_queryset()
         self.assertEqual(len(qs), 2)
         self.assertEqual(set(qs), set(order.bought_items.all()))
+
+
+class BoughtItemCreateTestCase(APITestCase):
+    def setUp(self):
+        self.person = PersonFactory(password='password')
+        self.client.login(username=self.person.email, password='password')
+        event = EventFactory()
+        self.order = OrderFactory(event=event, person=self.person)
+        item = ItemFactory(event=event)
+        self.item_option = ItemOptionFactory(price=100, item=item, total_number=1)
+
+    def post(self):
+        return self.client.post('/api/v1/boughtitem/', {
+            'order': 'http://testserver/api/v1/order/{}/'.format(self.order.pk),
+            'item_option': 'http://testserver/api/v1/itemoption/{}/'.format(self.item_option.pk),
+            'attendee': '',
+        })
+
+    def test_create__sold_out(self):
+        response = self.post()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertEqual(response.data['status'], BoughtItem.RESERVED)
+        self.order.refresh_from_db()
+        self.assertIsNotNone(self.order.cart_start_time)
+
+        response = self.post()
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'item_option': ['That item is sold out.']})
+        self.assertEqual(self.order.bought_items.count(), 1)
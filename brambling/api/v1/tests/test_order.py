@@ -0,0 +1,127 @@
+# encoding: utf-8
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.test import TestCase, RequestFactory
+
+from brambling.api.v1.endpoints.order import OrderPermission, OrderViewSet
+from brambling.models import EventMember, Order, OrganizationMember
+from brambling.tests.factories import (
+    EventFactory,
+    OrderFactory,
+    OrganizationFactory,
+    PersonFactory,
+)
+
+
+class OrderViewSetTestCase(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.organization = OrganizationFactory()
+        self.event = EventFactory(collect_housing_data=False, organization=self.organization)
+        self.other_event = EventFactory(collect_housing_data=False)
+        self.order = OrderFactory(event=self.event)
+        self.other_order = OrderFactory(event=self.other_event)
+
+    def get_viewset(self, user):
+        viewset = OrderViewSet()
+        viewset.request = self.factory.get('/')
+        viewset.request.user = user
+        SessionMiddleware().process_request(viewset.request)
+        return viewset
+
+    def test_queryset__event_member(self):
+        person = PersonFactory()
+        EventMember.objects.create(person=person, event=self.event, role=EventMember.VIEW)
+        viewset = self.get_viewset(person)
+        self.assertEqual(list(viewset.get_queryset()), [self.order])
+
+    def test_queryset__organization_member(self):
+        person = PersonFactory()
+        OrganizationMember.objects.create(
+            person=person,
+            organization=self.organization,
+            role=OrganizationMember.EDIT,
+        )
+        viewset = self.get_viewset(person)
+        self.assertEqual(list(viewset.get_queryset()), [self.order])
+
+    def test_queryset__own_order(self):
+        person = PersonFactory()
+        order = OrderFactory(event=self.other_event, person=person)
+        viewset = self.get_viewset(person)
+        self.assertEqual(list(viewset.get_queryset()), [order])
+
+    def test_queryset__session(self):
+        viewset = self.get_viewset(AnonymousUser())
+        self.assertEqual(list(viewset.get_queryset()), [])
+        Order.objects._set_session_code(viewset.request, self.event, self.order.code)
+        self.assertEqual(list(viewset.get_queryset()), [self.order])
+
+    def test_queryset__no_membership_joins(self):
+        """
+        Memberships are resolved up front, so the query filters on
+        event ids and doesn't need to be made distinct.
+
+        """
+        person = PersonFactory()
+        EventMember.objects.create(person=person, event=self.event, role=EventMember.EDIT)
+        OrganizationMember.objects.create(
+            person=person,
+            organization=self.organization,
+            role=OrganizationMember.EDIT,
+        )
+        viewset = self.get_viewset(person)
+        sql = str(viewset.get_queryset().query)
+        self.assertNotIn('DISTINCT', sql)
+        self.assertNotIn(EventMember._meta.db_table, sql)
+        self.assertNotIn(OrganizationMember._meta.db_table, sql)
+
+    def test_object_permission__no_queries(self):
+        """
+        Checking each listed order doesn't look up memberships again.
+
+        """
+        person = PersonFactory()
+        EventMember.objects.create(person=person, event=self.event, role=EventMember.EDIT)
+        viewset = self.get_viewset(person)
+        viewset.request.method = 'PATCH'
+        orders = list(viewset.get_queryset())
+        permission = OrderPermission()
+        with self.assertNumQueries(0):
+            for order in orders:
+                self.assertTrue(permission.has_object_permission(viewset.request, viewset, order))
+
+    def test_object_permission__view_member(self):
+        person = PersonFactory()
+        EventMember.objects.create(person=person, event=self.event, role=EventMember.VIEW)
+        viewset = self.get_viewset(person)
+        viewset.request.method = 'PATCH'
+        permission = OrderPermission()
+        self.assertFalse(permission.has_object_permission(viewset.request, viewset, self.order))
+
+    def test_object_permission__session(self):
+        """
+        Unclaimed orders in the session are available, and checking
+        doesn't claim them or query anything besides the session.
+
+        """
+        person = PersonFactory()
+        viewset = self.get_viewset(person)
+        viewset.request.method = 'PATCH'
+        permission = OrderPermission()
+        self.assertFalse(permission.has_object_permission(viewset.request, viewset, self.order))
+
+        Order.objects._set_session_code(viewset.request, self.event, self.order.code)
+        self.assertEqual(list(viewset.get_queryset()), [self.order])
+        with self.assertNumQueries(0):
+            self.assertTrue(permission.has_object_permission(viewset.request, viewset, self.order))
+        self.assertIsNone(Order.objects.get(pk=self.order.pk).person_id)
+
+    def test_object_permission__claimed_session_order(self):
+        self.order.person = PersonFactory()
+        self.order.save()
+        viewset = self.get_viewset(AnonymousUser())
+        Order.objects._set_session_code(viewset.request, self.event, self.order.code)
+        self.assertEqual(list(viewset.get_queryset()), [])
+        permission = OrderPermission()
+        self.assertFalse(permission.has_object_permission(viewset.request, viewset, self.order))
@@ -2,6 +2,7 @@ from rest_framework import status
 from rest_framework.test import APITestCase
 
 from brambling.tests.factories import (
+    AttendeeFactory,
     EventFactory,
     OrderFactory,
     PersonFactory,
@@ -47,3 +48,16 @@ class OrderSearchTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
         self.assertEqual(response.data[0]['id'], self.order.pk)
+
+    def test_get__search(self):
+        order2 = OrderFactory(event=self.event)
+        AttendeeFactory(order=order2, first_name='Chewbacca')
+        response = self.client.get(
+            '/api/v1/ordersearch/', {
+                'event': self.event.pk,
+                'search': 'chew',
+            },
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([order['id'] for order in response.data], [order2.pk])
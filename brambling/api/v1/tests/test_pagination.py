@@ -0,0 +1,105 @@
+# encoding: utf-8
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+from brambling.models import BoughtItem, OrganizationMember
+from brambling.tests.factories import (
+    AttendeeFactory,
+    EnvironmentalFactorFactory,
+    EventFactory,
+    HousingCategoryFactory,
+    OrderFactory,
+    PersonFactory,
+)
+
+
+class ListPaginationTestCase(APITestCase):
+    def setUp(self):
+        self.event = EventFactory()
+        person = PersonFactory()
+        OrganizationMember.objects.create(
+            person=person,
+            organization=self.event.organization,
+            role=OrganizationMember.EDIT,
+        )
+        self.client.login(username=person.email, password='password')
+        self.orders = [OrderFactory(event=self.event) for i in range(5)]
+
+    def test_unpaginated(self):
+        response = self.client.get('/api/v1/order/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([order['id'] for order in response.data],
+                         [order.pk for order in self.orders])
+
+    def test_page_size(self):
+        response = self.client.get('/api/v1/order/', {'page_size': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([order['id'] for order in response.data['results']],
+                         [order.pk for order in self.orders[:2]])
+        self.assertIsNone(response.data['previous'])
+
+        # Pages stay stable when rows are added.
+        OrderFactory(event=self.event)
+        response = self.client.get(response.data['next'])
+        self.assertEqual([order['id'] for order in response.data['results']],
+                         [order.pk for order in self.orders[2:4]])
+
+    def test_page_size__invalid(self):
+        response = self.client.get('/api/v1/order/', {'page_size': 'all'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNone(response.data['next'])
+
+
+class SparseFieldsTestCase(APITestCase):
+    def setUp(self):
+        self.event = EventFactory()
+        person = PersonFactory()
+        OrganizationMember.objects.create(
+            person=person,
+            organization=self.event.organization,
+            role=OrganizationMember.EDIT,
+        )
+        self.client.login(username=person.email, password='password')
+        factor = EnvironmentalFactorFactory()
+        category = HousingCategoryFactory()
+        for i in range(3):
+            attendee = AttendeeFactory(order=OrderFactory(event=self.event))
+            attendee.ef_cause.add(factor)
+            attendee.ef_avoid.add(factor)
+            attendee.housing_prefer.add(category)
+
+    def get(self, url, data):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        return response, len(context.captured_queries)
+
+    def test_attendee(self):
+        response, full_queries = self.get('/api/v1/attendee/', {})
+        self.assertIn('ef_cause', response.data[0])
+
+        response, queries = self.get('/api/v1/attendee/', {'fields': 'id,first_name,last_name'})
+        self.assertEqual(len(response.data), 3)
+        self.assertEqual(set(response.data[0]), set(('id', 'first_name', 'last_name')))
+        # The many-to-many fields aren't prefetched.
+        self.assertEqual(queries, full_queries - 3)
+
+    def test_order__nested_in_full(self):
+        order = self.event.order_set.first()
+        BoughtItem.objects.create(order=order, item_name='Pass', item_option_name='Full', price=1)
+        response = self.client.get('/api/v1/order/{}/'.format(order.pk), {'fields': 'id,bought_items'})
+        self.assertEqual(set(response.data), set(('id', 'bought_items')))
+        self.assertEqual(response.data['bought_items'][0]['item_name'], 'Pass')
+        self.assertIn('link', response.data['bought_items'][0])
+
+    def test_paginated(self):
+        response = self.client.get('/api/v1/attendee/', {'fields': 'id', 'page_size': 2})
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(set(response.data['results'][0]), set(('id',)))
+
+    def test_detail(self):
+        order = self.event.order_set.first()
+        response = self.client.get('/api/v1/order/{}/'.format(order.pk), {'fields': 'code'})
+        self.assertEqual(response.data, {'code': order.code})
@@ -0,0 +1,118 @@
+# encoding: utf-8
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+from brambling.models import BoughtItem, DanceStyle, OrganizationMember
+from brambling.tests.factories import (
+    AttendeeFactory,
+    EnvironmentalFactorFactory,
+    EventFactory,
+    EventHousingFactory,
+    HousingCategoryFactory,
+    ItemFactory,
+    ItemImageFactory,
+    ItemOptionFactory,
+    OrderFactory,
+    OrganizationFactory,
+    PersonFactory,
+)
+
+
+class ListQueryCountTestCase(APITestCase):
+    """
+    List responses should take the same number of queries however
+    many objects they include.
+
+    """
+    def setUp(self):
+        self.organization = OrganizationFactory()
+        self.event = EventFactory(organization=self.organization)
+        self.item_option = ItemOptionFactory(item=ItemFactory(event=self.event))
+        self.factor = EnvironmentalFactorFactory()
+        self.category = HousingCategoryFactory()
+        self.dance_style = DanceStyle.objects.create(name='Blues')
+        person = PersonFactory()
+        OrganizationMember.objects.create(
+            person=person,
+            organization=self.organization,
+            role=OrganizationMember.EDIT,
+        )
+        self.client.login(username=person.email, password='password')
+
+    def get_list_queries(self, url, count):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), count)
+        return len(context.captured_queries)
+
+    def assertConstantQueries(self, url, create):
+        create()
+        queries = self.get_list_queries(url, 1)
+        for i in range(199):
+            create()
+        self.assertEqual(self.get_list_queries(url, 200), queries)
+
+    def create_order(self):
+        order = OrderFactory(event=self.event)
+        BoughtItem.objects.create(
+            order=order,
+            item_option=self.item_option,
+            item_name='Item',
+            item_option_name='Option',
+            price=1,
+        )
+        eventhousing = EventHousingFactory(event=self.event, order=order, country='US')
+        eventhousing.ef_present.add(self.factor)
+        eventhousing.ef_avoid.add(self.factor)
+        eventhousing.housing_categories.add(self.category)
+        return order
+
+    def create_attendee(self):
+        attendee = AttendeeFactory(order=OrderFactory(event=self.event))
+        attendee.ef_cause.add(self.factor)
+        attendee.ef_avoid.add(self.factor)
+        attendee.housing_prefer.add(self.category)
+
+    def create_item(self):
+        item = ItemFactory(event=self.event)
+        ItemOptionFactory(item=item)
+        ItemImageFactory(item=item)
+
+    def test_order(self):
+        self.assertConstantQueries('/api/v1/order/', self.create_order)
+
+    def test_boughtitem(self):
+        self.assertConstantQueries('/api/v1/boughtitem/', self.create_order)
+
+    def test_eventhousing(self):
+        self.assertConstantQueries('/api/v1/eventhousing/', self.create_order)
+
+    def test_attendee(self):
+        self.assertConstantQueries('/api/v1/attendee/', self.create_attendee)
+
+    def test_item(self):
+        self.item_option.item.delete()
+        self.assertConstantQueries('/api/v1/item/', self.create_item)
+
+    def test_itemoption(self):
+        self.item_option.delete()
+        self.assertConstantQueries('/api/v1/itemoption/', lambda: ItemOptionFactory(item=ItemFactory(event=self.event)))
+
+    def test_itemimage(self):
+        self.assertConstantQueries('/api/v1/itemimage/', lambda: ItemImageFactory(item=self.item_option.item))
+
+    def test_event(self):
+        self.event.delete()
+
+        def create_event():
+            EventFactory(organization=self.organization).dance_styles.add(self.dance_style)
+        self.assertConstantQueries('/api/v1/event/', create_event)
+
+    def test_organization(self):
+        self.organization.delete()
+
+        def create_organization():
+            OrganizationFactory().dance_styles.add(self.dance_style)
+        self.assertConstantQueries('/api/v1/organization/', create_organization)
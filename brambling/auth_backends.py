@@ -1,3 +1,8 @@
+from brambling.utils.permissions import (get_request_cache,
+                                         get_shared_permissions,
+                                         set_shared_permissions)
+
+
 class BramblingBackend(object):
     """
     Handles object-based permissions for brambling models.
@@ -16,16 +21,18 @@ class BramblingBackend(object):
         if not user_obj.is_authenticated() or not user_obj.is_active:
             return set()
 
-        if not hasattr(user_obj, '_brambling_perm_cache'):
-            user_obj._brambling_perm_cache = {}
-        perm_cache = user_obj._brambling_perm_cache
+        perm_cache = get_request_cache(user_obj)
 
         cls_name = obj.__class__.__name__
         if cls_name not in perm_cache:
             perm_cache[cls_name] = {}
 
         if obj.pk not in perm_cache[cls_name]:
-            perm_cache[cls_name][obj.pk] = set(obj.get_permissions(user_obj))
+            perms = get_shared_permissions(user_obj, [obj]).get(obj)
+            if perms is None:
+                perms = set(obj.get_permissions(user_obj))
+                set_shared_permissions(user_obj, {obj: perms})
+            perm_cache[cls_name][obj.pk] = perms
 
         return perm_cache[cls_name][obj.pk]
 
@@ -365,10 +365,11 @@ class AddCardForm(forms.Form):
 
 
 class BasePaymentForm(forms.Form):
-    def __init__(self, order, amount, *args, **kwargs):
+    def __init__(self, order, amount, idempotency_key=None, *args, **kwargs):
         self.api_type = order.event.api_type
         self.order = order
         self.amount = amount
+        self.idempotency_key = idempotency_key
         super(BasePaymentForm, self).__init__(*args, **kwargs)
 
     def save_payment(self, charge, creditcard):
@@ -397,6 +398,7 @@ class OneTimePaymentForm(BasePaymentForm, AddCardForm):
                 'amount': self.amount,
                 'event': self.order.event,
                 'order': self.order,
+                'idempotency_key': self.idempotency_key,
             }
             try:
                 if self.cleaned_data.get('save_card'):
@@ -447,7 +449,8 @@ class SavedCardPaymentForm(BasePaymentForm):
                 amount=self.amount,
                 event=self.order.event,
                 order=self.order,
-                customer=customer_id
+                customer=customer_id,
+                idempotency_key=self.idempotency_key,
             )
         except stripe.error.CardError, e:
             self.add_error(None, e.message)
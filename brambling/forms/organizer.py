@@ -1,6 +1,7 @@
 from django.core.exceptions import ValidationError
 from django.core.validators import EmailValidator
 from django.db.models import Q
+from django.db.transaction import atomic
 from django.utils.crypto import get_random_string
 import floppyforms.__future__ as forms
 
@@ -315,7 +316,8 @@ class EventRegistrationForm(forms.ModelForm):
         model = Event
         fields = ('privacy', 'cart_timeout', 'transfers_allowed',
                   'collect_housing_data', 'collect_survey_data',
-                  'liability_waiver', 'currency', 'check_postmark_cutoff')
+                  'liability_waiver', 'currency', 'check_postmark_cutoff',
+                  'waiting_room_enabled', 'waiting_room_admit_rate')
 
     def __init__(self, request, organization, *args, **kwargs):
         super(EventRegistrationForm, self).__init__(*args, **kwargs)
@@ -541,6 +543,12 @@ class ManualPaymentForm(forms.ModelForm):
         txn.is_confirmed = True
         txn.api_type = txn.event.api_type
 
+    @atomic
+    def save(self):
+        txn = super(ManualPaymentForm, self).save()
+        self.order.update_balance()
+        return txn
+
 
 class OrderNotesForm(forms.ModelForm):
     class Meta:
@@ -201,3 +201,54 @@ class InviteMailer(FancyMailer):
 
     def get_recipients(self):
         return [self.invite.email]
+
+
+MAILERS = {
+    mailer.__name__: mailer
+    for mailer in (
+        ConfirmationMailer,
+        OrderReceiptMailer,
+        OrderAlertMailer,
+        DailyDigestMailer,
+        InviteMailer,
+    )
+}
+
+
+class OutboxSite(object):
+    """
+    Stands in for the request's site when a queued mail is sent from
+    the outbox.
+
+    """
+    def __init__(self, domain, name):
+        self.domain = domain
+        self.name = name
+
+    def __str__(self):
+        return self.domain
+
+
+def outbox_enabled():
+    return getattr(settings, 'BACKGROUND_MAIL', False)
+
+
+def queue_mailer(mailer_class, site, secure=False, **kwargs):
+    """
+    Adds a mailer to the outbox to be sent by the send_outbox management
+    command. The message is saved with the current transaction, so it
+    is only sent if the transaction commits.
+
+    """
+    from brambling.models import OutboxMessage
+    return OutboxMessage.objects.enqueue(mailer_class.__name__, site, secure, **kwargs)
+
+
+def deliver_outbox_message(message):
+    mailer_class = MAILERS[message.mailer]
+    mailer = mailer_class(
+        site=OutboxSite(message.site_domain, message.site_name),
+        secure=message.secure,
+        **message.get_mailer_kwargs()
+    )
+    mailer.send()
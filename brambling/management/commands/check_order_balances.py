@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from brambling.models import Order
+
+
+class Command(BaseCommand):
+    help = ("Checks the denormalized balance fields on orders against "
+            "their transactions and items, and optionally repairs them.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'event_ids',
+            nargs='*',
+            type=int,
+            help="Only check the orders for these event ids.",
+        )
+        parser.add_argument(
+            '--repair',
+            action='store_true',
+            default=False,
+            help="Save the correct values for any orders which are out of date.",
+        )
+
+    def handle(self, *args, **options):
+        orders = Order.objects.order_by('pk')
+        if options['event_ids']:
+            orders = orders.filter(event__in=options['event_ids'])
+
+        mismatched = 0
+        for order in orders.iterator():
+            data = order.get_balance_data()
+            fields = [field for field in Order.BALANCE_FIELDS
+                      if getattr(order, field) != data[field]]
+            if not fields:
+                continue
+            mismatched += 1
+            self.stdout.write("Order {} ({}) is out of date: {}".format(
+                order.code, order.pk, ', '.join(fields)))
+            if options['repair']:
+                Order.objects.filter(pk=order.pk).update(**data)
+
+        if mismatched and options['repair']:
+            self.stdout.write("Repaired {} orders.".format(mismatched))
+        elif options['verbosity'] > 1 or mismatched:
+            self.stdout.write("{} orders out of date.".format(mismatched))
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from brambling.models import Order, WaitingRoomTicket
+
+
+class Command(BaseCommand):
+    help = "Deletes reserved items from expired carts, and admitted waiting room tickets."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            default=False,
+            help="Keep expiring carts instead of exiting after one pass.",
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=30,
+            help="Seconds to wait between passes when looping.",
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help="Number of orders whose carts are expired at a time.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            expired = Order.objects.expire_carts(batch_size=options['batch_size'])
+            if expired and options['verbosity'] > 1:
+                self.stdout.write("Expired {} cart(s)".format(expired))
+            pruned = WaitingRoomTicket.objects.prune()
+            if pruned and options['verbosity'] > 1:
+                self.stdout.write("Deleted {} waiting room ticket(s)".format(pruned))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from brambling.models import Event, EventSummary
+
+
+class Command(BaseCommand):
+    help = "Recalculates event summaries from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'event_ids',
+            nargs='*',
+            type=int,
+            help="Only rebuild the summaries for these event ids.",
+        )
+
+    def handle(self, *args, **options):
+        events = Event.objects.order_by('pk')
+        if options['event_ids']:
+            events = events.filter(pk__in=options['event_ids'])
+        for event in events.iterator():
+            EventSummary.objects.rebuild(event)
+            if options['verbosity'] > 1:
+                self.stdout.write("Rebuilt summary for {} ({})".format(event.name, event.pk))
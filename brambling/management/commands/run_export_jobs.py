@@ -0,0 +1,70 @@
+import datetime
+import time
+import traceback
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from brambling.models import ExportJob
+from brambling.utils.exports import render_export_job
+
+
+class Command(BaseCommand):
+    help = "Renders pending CSV / XLSX exports."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            default=False,
+            help="Keep polling for new jobs instead of exiting once the queue is empty.",
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help="Seconds to wait between polls when looping.",
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            default=30,
+            help="Minutes after which a running job is assumed to have died and is requeued.",
+        )
+
+    def requeue_stale_jobs(self, minutes):
+        cutoff = timezone.now() - datetime.timedelta(minutes=minutes)
+        return ExportJob.objects.filter(
+            status=ExportJob.RUNNING,
+            last_modified__lt=cutoff,
+        ).update(status=ExportJob.PENDING, last_modified=timezone.now())
+
+    def run_job(self, job):
+        try:
+            render_export_job(job)
+        except Exception:
+            error = traceback.format_exc()
+            self.stderr.write("Export job {pk} raised an error".format(pk=job.pk))
+            self.stderr.write(error)
+            ExportJob.objects.filter(pk=job.pk).update(
+                status=ExportJob.FAILED,
+                error=error,
+                last_modified=timezone.now(),
+            )
+
+    def run_pending(self):
+        count = 0
+        job = ExportJob.objects.claim()
+        while job is not None:
+            self.run_job(job)
+            count += 1
+            job = ExportJob.objects.claim()
+        return count
+
+    def handle(self, *args, **options):
+        while True:
+            self.requeue_stale_jobs(options['stale_after'])
+            self.run_pending()
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
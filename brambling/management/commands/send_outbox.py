@@ -0,0 +1,101 @@
+import datetime
+import time
+import traceback
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from brambling.mail import deliver_outbox_message
+from brambling.models import OutboxMessage
+
+
+class Command(BaseCommand):
+    help = "Sends mail queued in the outbox, retrying failures with backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            default=False,
+            help="Keep polling for new mail instead of exiting once the outbox is empty.",
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help="Seconds to wait between polls when looping.",
+        )
+        parser.add_argument(
+            '--max-attempts',
+            type=int,
+            default=5,
+            help="Attempts after which a message is marked as failed.",
+        )
+        parser.add_argument(
+            '--retry-delay',
+            type=int,
+            default=60,
+            help="Seconds to wait before the first retry; doubled for each further retry.",
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            default=10,
+            help="Minutes after which a sending message is assumed to have died and is requeued.",
+        )
+
+    def requeue_stale_messages(self, minutes):
+        cutoff = timezone.now() - datetime.timedelta(minutes=minutes)
+        return OutboxMessage.objects.filter(
+            status=OutboxMessage.SENDING,
+            last_modified__lt=cutoff,
+        ).update(status=OutboxMessage.PENDING, last_modified=timezone.now())
+
+    def get_retry_delay(self, attempts, options):
+        # Capped at a day so a long outage doesn't push retries out
+        # indefinitely.
+        seconds = options['retry_delay'] * 2 ** (attempts - 1)
+        return datetime.timedelta(seconds=min(seconds, 24 * 60 * 60))
+
+    def send_message(self, message, options):
+        attempts = message.attempts + 1
+        try:
+            deliver_outbox_message(message)
+        except Exception:
+            error = traceback.format_exc()
+            self.stderr.write("Outbox message {pk} raised an error".format(pk=message.pk))
+            self.stderr.write(error)
+            if attempts >= options['max_attempts']:
+                status = OutboxMessage.FAILED
+            else:
+                status = OutboxMessage.PENDING
+            OutboxMessage.objects.filter(pk=message.pk).update(
+                status=status,
+                attempts=attempts,
+                next_attempt_at=timezone.now() + self.get_retry_delay(attempts, options),
+                error=error,
+                last_modified=timezone.now(),
+            )
+        else:
+            OutboxMessage.objects.filter(pk=message.pk).update(
+                status=OutboxMessage.SENT,
+                attempts=attempts,
+                last_modified=timezone.now(),
+            )
+
+    def send_pending(self, options):
+        count = 0
+        message = OutboxMessage.objects.claim()
+        while message is not None:
+            self.send_message(message, options)
+            count += 1
+            message = OutboxMessage.objects.claim()
+        return count
+
+    def handle(self, *args, **options):
+        while True:
+            self.requeue_stale_messages(options['stale_after'])
+            self.send_pending(options)
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,113 @@
+from collections import Counter
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils.crypto import get_random_string
+
+from brambling.models import Event, WaitingRoomTicket
+
+
+class Command(BaseCommand):
+    help = ("Simulates a rush of visitors arriving at an event's waiting "
+            "room and reports how many are admitted each second. The "
+            "visitors queue for a temporary, unpublished copy of the "
+            "event, so the event's real queue isn't affected.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('event_id', type=int)
+        parser.add_argument(
+            '--visitors',
+            type=int,
+            default=1000,
+            help="Number of visitors arriving at once.",
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=20,
+            help="Number of visitors arriving at the same time, each in "
+                 "its own thread and database connection.",
+        )
+        parser.add_argument(
+            '--admit-rate',
+            type=int,
+            default=None,
+            help="Visitors admitted per second. Defaults to the event's setting.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            event = Event.objects.get(pk=options['event_id'])
+        except Event.DoesNotExist:
+            raise CommandError("Event {} does not exist.".format(options['event_id']))
+        if options['admit_rate'] is not None:
+            if options['admit_rate'] < 1:
+                raise CommandError("--admit-rate must be at least 1.")
+            event.waiting_room_admit_rate = options['admit_rate']
+        if options['concurrency'] < 1:
+            raise CommandError("--concurrency must be at least 1.")
+
+        # Queue for a copy of the event, which is deleted afterwards
+        # along with its waiting room and tickets.
+        event.pk = None
+        event.slug = 'waiting-room-simulation-{}'.format(get_random_string(8).lower())
+        event.is_published = False
+        event.waiting_room_enabled = True
+        event.save()
+
+        tickets = []
+        errors = []
+        started = time.time()
+        try:
+            if options['concurrency'] == 1:
+                for i in range(options['visitors']):
+                    tickets.append(WaitingRoomTicket.objects.issue(event))
+            else:
+                self.run_threads(event, options['visitors'], options['concurrency'],
+                                 tickets, errors)
+            elapsed = time.time() - started
+        finally:
+            event.delete()
+
+        if errors:
+            raise CommandError("{} visitors failed to queue, e.g. {!r}".format(
+                len(errors), errors[0]))
+        if not tickets:
+            return
+        first = min(ticket.admit_at for ticket in tickets)
+        admitted = Counter(
+            int((ticket.admit_at - first).total_seconds())
+            for ticket in tickets
+        )
+        self.stdout.write("Issued {} tickets in {:.2f}s.".format(len(tickets), elapsed))
+        self.stdout.write("Second  Admitted")
+        for second in range(max(admitted) + 1):
+            self.stdout.write("{:>6}  {:>8}".format(second, admitted[second]))
+
+    def run_threads(self, event, visitors, concurrency, tickets, errors):
+        remaining = [visitors]
+        lock = threading.Lock()
+
+        def visit():
+            try:
+                while True:
+                    with lock:
+                        if not remaining[0]:
+                            return
+                        remaining[0] -= 1
+                    ticket = WaitingRoomTicket.objects.issue(event)
+                    with lock:
+                        tickets.append(ticket)
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=visit) for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 16:09
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brambling', '0060_exportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('confirmed_purchases', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('pending_purchases', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('refunds', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('net_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('application_fees', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('processing_fees', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('attendee_count', models.PositiveIntegerField(default=0)),
+                ('attendee_need_count', models.PositiveIntegerField(default=0)),
+                ('attendee_have_count', models.PositiveIntegerField(default=0)),
+                ('attendee_home_count', models.PositiveIntegerField(default=0)),
+                ('last_rebuilt', models.DateTimeField(default=django.utils.timezone.now)),
+                ('event', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='summary', to='brambling.Event')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ItemOptionSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bought_count', models.PositiveIntegerField(default=0)),
+                ('item_option', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='summary', to='brambling.ItemOption')),
+            ],
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 16:27
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brambling', '0061_eventsummary_itemoptionsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(db_index=True, max_length=100)),
+                ('attendee', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='brambling.Attendee')),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='brambling.Event')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='brambling.Order')),
+            ],
+        ),
+    ]
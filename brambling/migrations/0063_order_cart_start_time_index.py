@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 16:39
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brambling', '0062_searchtoken'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='cart_start_time',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 16:43
+from __future__ import unicode_literals
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brambling', '0063_order_cart_start_time_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitingRoomTicket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('admit_at', models.DateTimeField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='waiting_room_admit_rate',
+            field=models.PositiveSmallIntegerField(default=10, help_text='Number of visitors admitted from the waiting room per second.', validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='waiting_room_enabled',
+            field=models.BooleanField(default=False, help_text='Send visitors through a queue before they can register. Use this when registration opens for a large event.'),
+        ),
+        migrations.AddField(
+            model_name='waitingroomticket',
+            name='event',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='brambling.Event'),
+        ),
+        migrations.AlterIndexTogether(
+            name='waitingroomticket',
+            index_together=set([('event', 'admit_at')]),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from decimal import Decimal
+
+from django.db import migrations
+
+
+# Copied from the models, since historical models don't have them.
+RESERVED = 'reserved'
+REFUND = 'refund'
+TRANSFER = 'transfer'
+FLAT = 'flat'
+
+BATCH_SIZE = 500
+
+
+def get_savings(discount, price):
+    if discount.discount_type == FLAT:
+        savings = discount.amount
+    else:
+        savings = discount.amount / 100 * price
+    return min(savings, price)
+
+
+def get_balance_data(order):
+    transactions = list(order.transactions.all())
+    data = {
+        'total_paid': sum(txn.amount for txn in transactions
+                          if txn.transaction_type != REFUND),
+        'total_refunded': sum(txn.amount for txn in transactions
+                              if txn.transaction_type == REFUND),
+        'first_transaction_time': min([txn.timestamp for txn in transactions] or [None]),
+        'last_transaction_time': max([txn.timestamp for txn in transactions] or [None]),
+        'transaction_count': len(transactions),
+    }
+
+    net_cost = 0
+    for item in order.bought_items.all():
+        if item.status == RESERVED:
+            continue
+        cost = item.price - sum(get_savings(discount, item.price)
+                                for discount in item.discounts.all())
+        for txn in item.transactions.all() or [None]:
+            if txn is None:
+                net_cost += cost
+            elif txn.transaction_type == REFUND:
+                net_cost -= cost
+            elif txn.transaction_type != TRANSFER:
+                net_cost += cost
+    # Percent discounts can leave fractions of a cent.
+    data['net_cost'] = Decimal(net_cost).quantize(Decimal('0.01'))
+    data['balance'] = data['net_cost'] - (data['total_paid'] + data['total_refunded'])
+    return data
+
+
+def backfill_order_balances(apps, schema_editor):
+    Order = apps.get_model('brambling', 'Order')
+
+    pks = list(Order.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(pks), BATCH_SIZE):
+        orders = Order.objects.filter(
+            pk__in=pks[start:start + BATCH_SIZE],
+        ).prefetch_related(
+            'transactions',
+            'bought_items__discounts',
+            'bought_items__transactions',
+        )
+        for order in orders:
+            Order.objects.filter(pk=order.pk).update(**get_balance_data(order))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brambling', '0067_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_order_balances, lambda *a, **k: None)
+    ]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 18:13
+from __future__ import unicode_literals
+
+import brambling.utils.storage
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+
+def remove_public_exports(apps, schema_editor):
+    """
+    Deletes exports rendered to the public media storage. Their jobs
+    are rendered again, to private storage, the next time they're
+    requested.
+
+    """
+    ExportJob = apps.get_model('brambling', 'ExportJob')
+    for job in ExportJob.objects.exclude(file=''):
+        if default_storage.exists(job.file.name):
+            default_storage.delete(job.file.name)
+    ExportJob.objects.exclude(file='').update(file='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brambling', '0068_backfill_order_balance'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='exportjob',
+            name='file',
+            field=models.FileField(blank=True, storage=brambling.utils.storage.PrivateStorage(), upload_to='exports'),
+        ),
+        migrations.RunPython(remove_public_exports, lambda *a, **k: None),
+    ]
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+# Copied from the models, since historical models don't have them.
+MAX_LENGTH = 100
+
+
+def get_search_tokens(*values):
+    tokens = set()
+    for value in values:
+        for word in (value or '').lower().split():
+            tokens.add(word[:MAX_LENGTH])
+            if '@' in word:
+                tokens.update(part[:MAX_LENGTH]
+                              for part in word.split('@') if part)
+    return tokens
+
+
+def build_search_index(apps, schema_editor):
+    """
+    Indexes the orders and attendees which existed before the search
+    index, so that searching them keeps working without a manual
+    rebuild_search_index.
+
+    """
+    Event = apps.get_model('brambling', 'Event')
+    Order = apps.get_model('brambling', 'Order')
+    Attendee = apps.get_model('brambling', 'Attendee')
+    SearchToken = apps.get_model('brambling', 'SearchToken')
+
+    for event_id in Event.objects.order_by('pk').values_list('pk', flat=True):
+        SearchToken.objects.filter(event=event_id).delete()
+        tokens = []
+        for order in Order.objects.filter(event=event_id).select_related('person'):
+            values = [order.code, order.email]
+            if order.person is not None:
+                person = order.person
+                values += [person.first_name, person.middle_name, person.last_name, person.email]
+            tokens.extend(
+                SearchToken(event_id=event_id, order_id=order.pk, token=token)
+                for token in get_search_tokens(*values)
+            )
+        for attendee in Attendee.objects.filter(order__event=event_id):
+            values = [attendee.first_name, attendee.middle_name, attendee.last_name, attendee.email]
+            tokens.extend(
+                SearchToken(event_id=event_id, order_id=attendee.order_id,
+                            attendee_id=attendee.pk, token=token)
+                for token in get_search_tokens(*values)
+            )
+        SearchToken.objects.bulk_create(tokens, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brambling', '0069_exportjob_private_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(build_search_index, lambda *a, **k: None)
+    ]
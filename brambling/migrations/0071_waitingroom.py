@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Max
+import django.db.models.deletion
+
+
+def create_waiting_rooms(apps, schema_editor):
+    """
+    Starts each waiting room after the places already given out, so
+    that visitors queueing during the deploy aren't admitted early.
+
+    """
+    WaitingRoom = apps.get_model('brambling', 'WaitingRoom')
+    WaitingRoomTicket = apps.get_model('brambling', 'WaitingRoomTicket')
+    Event = apps.get_model('brambling', 'Event')
+    last_admit_ats = WaitingRoomTicket.objects.values_list('event').annotate(Max('admit_at')).order_by()
+    admit_rates = dict(Event.objects.filter(
+        pk__in=[event_id for event_id, admit_at in last_admit_ats],
+    ).values_list('pk', 'waiting_room_admit_rate'))
+    WaitingRoom.objects.bulk_create([
+        WaitingRoom(
+            event_id=event_id,
+            next_admit_at=admit_at + timedelta(microseconds=-(-10 ** 6 // admit_rates[event_id])),
+        )
+        for event_id, admit_at in last_admit_ats
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brambling', '0070_build_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitingRoom',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('next_admit_at', models.DateTimeField(blank=True, null=True)),
+                ('event', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='waiting_room', to='brambling.Event')),
+            ],
+        ),
+        migrations.RunPython(create_waiting_rooms, lambda *a, **k: None),
+    ]
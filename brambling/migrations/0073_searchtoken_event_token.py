@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+INDEX_NAME = 'brambling_searchtoken_event_id_token_like'
+
+
+def create_like_index(apps, schema_editor):
+    # Prefix searches can only use btree indexes on PostgreSQL if they
+    # use the pattern operator class (unless the collation is "C").
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX {} ON brambling_searchtoken (event_id, token varchar_pattern_ops)'.format(INDEX_NAME)
+    )
+
+
+def drop_like_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS {}'.format(INDEX_NAME))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brambling', '0072_eventsummary_last_rebuilt_null'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='searchtoken',
+            name='token',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AlterIndexTogether(
+            name='searchtoken',
+            index_together=set([('event', 'token')]),
+        ),
+        migrations.RunPython(create_like_index, drop_like_index),
+    ]
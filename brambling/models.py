@@ -1,12 +1,15 @@
 # encoding: utf8
 from __future__ import unicode_literals
 
-from collections import OrderedDict
+from collections import defaultdict, OrderedDict
+from contextlib import contextmanager
 from datetime import date as dtdate, timedelta
 from decimal import Decimal
+import hashlib
 import itertools
 import json
 
+from django.apps import apps
 from django.contrib.auth.models import (AbstractBaseUser, PermissionsMixin,
                                         BaseUserManager)
 from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
@@ -15,8 +18,11 @@ from django.core.urlresolvers import reverse
 from django.core.validators import (MaxValueValidator, MinValueValidator,
                                     RegexValidator)
 from django.dispatch import receiver
-from django.db import models
-from django.db.models import signals, Sum
+from django.db import IntegrityError, connections, models
+from django.db.models import (signals, Case, Count, ExpressionWrapper, F,
+                              IntegerField, Max, Min, Sum, Value, When)
+from django.db.models.functions import Least
+from django.db.transaction import atomic
 from django.template.defaultfilters import date
 from django.utils import timezone
 from django.utils.crypto import get_random_string
@@ -32,6 +38,7 @@ from brambling.payment.stripe.core import (
     stripe_test_settings_valid,
     stripe_live_settings_valid,
 )
+from brambling.utils.storage import private_storage
 
 
 DEFAULT_DANCE_STYLES = (
@@ -77,6 +84,28 @@ DEFAULT_HOUSING_CATEGORIES = (
 
 UNAMBIGUOUS_CHARS = 'abcdefghijkmnpqrstuvwxyzABCDEFGHJKLMNPQRSTUVWXYZ23456789'
 
+# Number of random codes to try before giving up on creating a row
+# with a unique code.
+CODE_ATTEMPTS = 10
+
+
+def savepoint_if_needed(using):
+    """
+    Returns a savepoint when a transaction is open, so that an insert
+    which fails can be retried without breaking the transaction. In
+    autocommit mode, a failed insert doesn't affect anything else, so
+    no extra queries are made.
+
+    """
+    if connections[using].in_atomic_block:
+        return atomic(using=using)
+    return _no_savepoint()
+
+
+@contextmanager
+def _no_savepoint():
+    yield
+
 
 class AbstractNamedModel(models.Model):
     "A base model for any model which needs a human name."
@@ -278,13 +307,18 @@ class Organization(models.Model):
         except OrganizationMember.DoesNotExist:
             return ()
 
-        if member.role == OrganizationMember.OWNER:
+        return self.get_role_permissions(member.role)
+
+    @staticmethod
+    def get_role_permissions(role):
+        "Returns the organization permissions for a member's role."
+        if role == OrganizationMember.OWNER:
             return ('view', 'edit', 'change_permissions')
 
-        if member.role == OrganizationMember.EDIT:
+        if role == OrganizationMember.EDIT:
             return ('view', 'edit')
 
-        if member.role == OrganizationMember.VIEW:
+        if role == OrganizationMember.VIEW:
             return ('view',)
 
         return ()
@@ -402,6 +436,15 @@ class Event(models.Model):
     # Time in minutes.
     cart_timeout = models.PositiveSmallIntegerField(default=15,
                                                     help_text="Minutes before a user's cart expires.")
+    waiting_room_enabled = models.BooleanField(
+        default=False,
+        help_text="Send visitors through a queue before they can register. Use this when registration opens for a large event.",
+    )
+    waiting_room_admit_rate = models.PositiveSmallIntegerField(
+        default=10,
+        validators=[MinValueValidator(1)],
+        help_text="Number of visitors admitted from the waiting room per second.",
+    )
 
     # This is a secret value set by admins
     application_fee_percent = models.DecimalField(max_digits=5, decimal_places=2, default=Decimal('2.5'),
@@ -432,37 +475,37 @@ class Event(models.Model):
         if person.is_superuser:
             return ('view', 'edit', 'change_permissions')
 
-        default_perms = ()
-        try:
-            member = OrganizationMember.objects.get(
-                organization=self.organization,
-                person=person,
-            )
-        except OrganizationMember.DoesNotExist:
-            pass
-        else:
-            if member.role in (OrganizationMember.OWNER, OrganizationMember.EDIT):
-                # Return here because event perms can't give more.
-                return ('view', 'edit', 'change_permissions')
-
-            if member.role == OrganizationMember.VIEW:
-                default_perms = ('view',)
+        organization_role = OrganizationMember.objects.filter(
+            organization_id=self.organization_id,
+            person=person,
+        ).values_list('role', flat=True).first()
+        if organization_role in (OrganizationMember.OWNER, OrganizationMember.EDIT):
+            # Return here because event perms can't give more.
+            return self.get_role_permissions(organization_role, None)
+
+        event_role = EventMember.objects.filter(
+            event=self,
+            person=person,
+        ).values_list('role', flat=True).first()
+        return self.get_role_permissions(organization_role, event_role)
+
+    @staticmethod
+    def get_role_permissions(organization_role, event_role):
+        """
+        Returns the event permissions for a person with the given roles
+        (or None) in the event's organization and in the event itself.
 
-        try:
-            member = EventMember.objects.get(
-                event=self,
-                person=person,
-            )
-        except EventMember.DoesNotExist:
-            return default_perms
+        """
+        if organization_role in (OrganizationMember.OWNER, OrganizationMember.EDIT):
+            return ('view', 'edit', 'change_permissions')
 
-        if member.role == EventMember.EDIT:
+        if event_role == EventMember.EDIT:
             return ('view', 'edit')
 
-        if member.role == EventMember.VIEW:
+        if event_role == EventMember.VIEW or organization_role == OrganizationMember.VIEW:
             return ('view',)
 
-        return default_perms
+        return ()
 
     def viewable_by(self, user):
         if user.has_perm('view', self):
@@ -530,6 +573,110 @@ class ItemImage(models.Model):
     image = models.ImageField()
 
 
+def _get_cart_cutoff(using, cart_timeout):
+    """
+    Returns an expression for the time before which carts with the
+    given timeout (an expression for a number of minutes) have expired.
+
+    """
+    now = Value(timezone.now(), output_field=models.DateTimeField())
+    if connections[using].features.has_native_duration_field:
+        minute = Value(timedelta(minutes=1), output_field=models.DurationField())
+    else:
+        # Durations are stored as microseconds.
+        minute = Value(60 * 10 ** 6)
+    timeout = ExpressionWrapper(cart_timeout * minute, output_field=models.DurationField())
+    return ExpressionWrapper(now - timeout, output_field=models.DateTimeField())
+
+
+def _get_reserved_filter(cutoff, prefix=''):
+    """
+    Returns a filter for reserved items whose carts haven't expired;
+    items in carts which started before the cutoff are left for the
+    expire_carts command to delete.
+
+    """
+    return models.Q(**{prefix + 'status': BoughtItem.RESERVED}) & (
+        models.Q(**{prefix + 'order__cart_start_time__isnull': True}) |
+        models.Q(**{prefix + 'order__cart_start_time__gt': cutoff})
+    )
+
+
+def _get_taken_filter(cutoff, prefix=''):
+    """
+    Returns a filter for bought items which count against their item
+    option's total_number.
+
+    """
+    statuses = [status for status in BoughtItem.TAKEN_STATUSES
+                if status != BoughtItem.RESERVED]
+    return (models.Q(**{prefix + 'status__in': statuses}) |
+            _get_reserved_filter(cutoff, prefix))
+
+
+class ItemOptionManager(models.Manager):
+    def with_sales(self, event=None):
+        """
+        Annotates item options with the number of their bought items in
+        each status, in a single grouped query. `taken` is the number
+        of items which count against the option's total_number.
+        Reserved items in expired carts aren't counted.
+
+        """
+        qs = self.get_queryset()
+        if event is not None:
+            qs = qs.filter(item__event=event)
+        cutoff = _get_cart_cutoff(qs.db, F('item__event__cart_timeout'))
+
+        def count(condition):
+            return Sum(Case(
+                When(condition, then=1),
+                default=0,
+                output_field=IntegerField(),
+            ))
+
+        def status(status):
+            return models.Q(boughtitem__status=status)
+
+        return qs.annotate(
+            reserved_count=count(_get_reserved_filter(cutoff, 'boughtitem__')),
+            unpaid_count=count(status(BoughtItem.UNPAID)),
+            bought_count=count(status(BoughtItem.BOUGHT)),
+            refunded_count=count(status(BoughtItem.REFUNDED)),
+            transferred_count=count(status(BoughtItem.TRANSFERRED)),
+            taken=count(_get_taken_filter(cutoff, 'boughtitem__')),
+        )
+
+    def reserve(self, item_option, **kwargs):
+        """
+        Creates a bought item for the item option and returns it, or
+        returns None if the item option is sold out. kwargs are passed
+        on to the new bought item.
+
+        The item option's row is locked while its taken items are
+        counted, so that concurrent reservations can't oversell it.
+
+        """
+        kwargs.setdefault('status', BoughtItem.RESERVED)
+        kwargs.setdefault('item_name', item_option.item.name)
+        kwargs.setdefault('item_description', item_option.item.description)
+        kwargs.setdefault('item_option_name', item_option.name)
+        kwargs.setdefault('price', item_option.price)
+        if (item_option.total_number is None or
+                kwargs['status'] not in BoughtItem.TAKEN_STATUSES):
+            return BoughtItem.objects.create(item_option=item_option, **kwargs)
+        with atomic():
+            total_number = self.select_for_update().filter(
+                pk=item_option.pk,
+            ).values_list('total_number', flat=True).get()
+            taken_items = BoughtItem.objects.filter(item_option=item_option)
+            cutoff = _get_cart_cutoff(taken_items.db, F('order__event__cart_timeout'))
+            taken = taken_items.filter(_get_taken_filter(cutoff)).count()
+            if total_number is not None and taken >= total_number:
+                return None
+            return BoughtItem.objects.create(item_option=item_option, **kwargs)
+
+
 class ItemOption(models.Model):
     TOTAL_AND_REMAINING = 'both'
     TOTAL = 'total'
@@ -550,6 +697,8 @@ class ItemOption(models.Model):
     remaining_display = models.CharField(max_length=9, default=TOTAL_AND_REMAINING, choices=REMAINING_DISPLAY_CHOICES)
     order = models.PositiveSmallIntegerField()
 
+    objects = ItemOptionManager()
+
     class Meta:
         ordering = ('order',)
 
@@ -559,7 +708,9 @@ class ItemOption(models.Model):
     @property
     def remaining(self):
         if not hasattr(self, 'taken'):
-            self.taken = self.boughtitem_set.exclude(status__in=(BoughtItem.REFUNDED, BoughtItem.TRANSFERRED)).count()
+            self.taken = ItemOption.objects.with_sales().values_list(
+                'taken', flat=True,
+            ).get(pk=self.pk)
         return self.total_number - self.taken
 
 
@@ -728,6 +879,7 @@ class CreditCard(models.Model):
 
 class OrderManager(models.Manager):
     _session_key = '_brambling_order_code'
+    _request_cache_attr = '_brambling_orders'
 
     def _get_session(self, request):
         return request.session.get(self._session_key, {})
@@ -770,6 +922,18 @@ class OrderManager(models.Manager):
         return True
 
     def for_request(self, event, request, create=True):
+        # The order is looked up once per request and event.
+        orders = vars(request).setdefault(self._request_cache_attr, {})
+        if event.pk in orders:
+            return orders[event.pk], False
+        order, created = self._for_request(event, request, create)
+        # Save fetching the event again; the order's checks (e.g.
+        # cart_is_expired) need it.
+        order.event = event
+        orders[event.pk] = order
+        return order, created
+
+    def _for_request(self, event, request, create):
         order = None
         created = False
 
@@ -783,6 +947,8 @@ class OrderManager(models.Manager):
                 )
             except Order.DoesNotExist:
                 pass
+            else:
+                order.person = request.user
 
         # Next, check if there's a session-stored order. Assign it
         # if the order hasn't checked out yet and the user is authenticated.
@@ -808,13 +974,7 @@ class OrderManager(models.Manager):
             # Okay, then create for this user.
             created = True
             person = request.user if request.user and request.user.is_authenticated() else None
-            while True:
-                code = get_random_string(8, UNAMBIGUOUS_CHARS)
-
-                if not Order.objects.filter(event=event, code=code).exists():
-                    break
-
-            order = Order.objects.create(event=event, code=code, person=person)
+            order = self.create_with_code(event=event, person=person)
 
             if not request.user.is_authenticated():
                 self._set_session_code(request, event, order.code)
@@ -822,11 +982,61 @@ class OrderManager(models.Manager):
         if order is None:
             raise Order.DoesNotExist
 
-        if order.cart_is_expired():
-            order.delete_cart()
-
         return order, created
 
+    def create_with_code(self, **kwargs):
+        """
+        Creates an order with a new random code. Rather than checking
+        that a code is unused first, this relies on the unique
+        constraint on event and code, and tries a fresh code if the
+        insert collides.
+
+        """
+        for attempt in range(CODE_ATTEMPTS):
+            code = get_random_string(8, UNAMBIGUOUS_CHARS)
+            try:
+                with savepoint_if_needed(self.db):
+                    return self.create(code=code, **kwargs)
+            except IntegrityError:
+                if attempt == CODE_ATTEMPTS - 1:
+                    raise
+
+    def expire_carts(self, batch_size=500):
+        """
+        Deletes the reserved items in expired carts across all events,
+        and clears their orders' cart start times. Orders are handled
+        batch_size at a time. Returns the number of carts expired.
+
+        """
+        now = timezone.now()
+        timeouts = Event.objects.filter(
+            order__cart_start_time__isnull=False,
+        ).values_list('cart_timeout', flat=True).distinct().order_by()
+        expired = 0
+        for timeout in set(timeouts):
+            cutoff = now - timedelta(minutes=timeout)
+            orders = self.filter(
+                event__cart_timeout=timeout,
+                cart_start_time__lte=cutoff,
+            )
+            while True:
+                order_ids = list(orders.values_list('pk', flat=True)[:batch_size])
+                if not order_ids:
+                    break
+                with atomic():
+                    # Lock the orders, and leave alone any carts restarted
+                    # since their ids were selected.
+                    order_ids = list(orders.select_for_update().filter(
+                        pk__in=order_ids,
+                    ).values_list('pk', flat=True))
+                    BoughtItem.objects.filter(
+                        order__in=order_ids,
+                        order__cart_start_time__lte=cutoff,
+                        status=BoughtItem.RESERVED,
+                    ).delete()
+                    expired += orders.filter(pk__in=order_ids).update(cart_start_time=None)
+        return expired
+
 
 class Order(models.Model):
     """
@@ -861,7 +1071,17 @@ class Order(models.Model):
     email = models.EmailField(blank=True)
     code = models.CharField(max_length=8, db_index=True)
 
-    cart_start_time = models.DateTimeField(blank=True, null=True)
+    cart_start_time = models.DateTimeField(blank=True, null=True, db_index=True)
+
+    # Denormalized balance data. Kept up to date by update_balance();
+    # the check_order_balances command verifies and repairs it.
+    net_cost = models.DecimalField(max_digits=9, decimal_places=2, default=0)
+    total_paid = models.DecimalField(max_digits=9, decimal_places=2, default=0)
+    total_refunded = models.DecimalField(max_digits=9, decimal_places=2, default=0)
+    balance = models.DecimalField(max_digits=9, decimal_places=2, default=0)
+    first_transaction_time = models.DateTimeField(blank=True, null=True)
+    last_transaction_time = models.DateTimeField(blank=True, null=True)
+    transaction_count = models.PositiveIntegerField(default=0)
 
     # "Survey" questions for Order
     survey_completed = models.BooleanField(default=False)
@@ -894,70 +1114,48 @@ class Order(models.Model):
         Add a discount to all items in the order that don't already have that discount.
         Return True if any discounts are added and False otherwise.
         """
-        if discount.event_id != self.event_id:
-            raise ValueError("Discount is not for the correct event")
-
-        bought_items = BoughtItem.objects.filter(
-            order=self,
-            item_option__discount=discount,
-            status__in=(
-                BoughtItem.UNPAID,
-                BoughtItem.RESERVED,
-            ),
-        ).exclude(
-            discounts__discount=discount,
-        ).distinct()
-
-        created = bool(bought_items)
-
-        if created:
-            BoughtItemDiscount.objects.bulk_create([
-                BoughtItemDiscount(
-                    discount=discount,
-                    bought_item=bought_item,
-                    name=discount.name,
-                    code=discount.code,
-                    discount_type=discount.discount_type,
-                    amount=discount.amount,
-                )
-                for bought_item in bought_items
-            ])
-        return created
+        return bool(BoughtItemDiscount.objects.apply(self, [discount]))
 
     def add_to_cart(self, item_option):
+        """
+        Reserve the item option for this order. Return the reserved
+        item, or None if the item option is sold out.
+        """
         if self.cart_is_expired():
             self.delete_cart()
 
-        BoughtItem.objects.create(
-            item_option=item_option,
-            order=self,
-            status=BoughtItem.RESERVED,
-            item_name=item_option.item.name,
-            item_description=item_option.item.description,
-            item_option_name=item_option.name,
-            price=item_option.price,
-        )
+        bought_item = ItemOption.objects.reserve(item_option, order=self)
+        if bought_item is None:
+            return None
 
         if self.cart_start_time is None:
             self.cart_start_time = timezone.now()
             self.save()
+        return bought_item
 
     def remove_from_cart(self, bought_item):
         if bought_item.order.id == self.id:
             bought_item.delete()
         if not self.has_cart():
-            self.cart_start_time = None
-            self.save()
+            # Clears out the rest of the cart too, if it has expired.
+            self.delete_cart()
 
     def mark_cart_paid(self, payment):
-        bought_items = self.bought_items.filter(
-            status__in=(BoughtItem.RESERVED, BoughtItem.UNPAID)
-        )
-        payment.bought_items = bought_items
-        bought_items.update(status=BoughtItem.BOUGHT)
-        if self.cart_start_time is not None:
-            self.cart_start_time = None
-            self.save()
+        with atomic():
+            if self.cart_is_expired():
+                # The payment doesn't cover the expired cart's items.
+                self.delete_cart()
+            bought_items = self.bought_items.filter(
+                status__in=(BoughtItem.RESERVED, BoughtItem.UNPAID)
+            )
+            bought_counts = list(bought_items.values_list('item_option', 'attendee').annotate(Count('id')).order_by())
+            payment.bought_items = bought_items
+            bought_items.update(status=BoughtItem.BOUGHT)
+            EventSummary.objects.update_sales(self.event_id, bought_counts)
+            if self.cart_start_time is not None:
+                self.cart_start_time = None
+                self.save()
+            self.update_balance()
 
     def cart_expire_time(self):
         if self.cart_start_time is None:
@@ -969,9 +1167,9 @@ class Order(models.Model):
                 timezone.now() > self.cart_expire_time())
 
     def has_cart(self):
-        if self.cart_is_expired():
-            self.delete_cart()
+        # Expired carts are deleted by the expire_carts command.
         return (self.cart_start_time is not None and
+                not self.cart_is_expired() and
                 self.bought_items.filter(status=BoughtItem.RESERVED).exists())
 
     def delete_cart(self):
@@ -981,21 +1179,68 @@ class Order(models.Model):
             self.save()
 
     def get_groupable_cart(self):
+        if self.cart_is_expired():
+            return self.bought_items.none()
         return self.bought_items.filter(
             status=BoughtItem.RESERVED
         ).order_by('item_name', 'item_option_name', '-added')
 
-    def get_summary_data(self):
-        if self.cart_is_expired():
-            self.delete_cart()
+    def _get_summary_totals(self, exclude_reserved=False):
+        """
+        Returns a dictionary mapping transaction ids (or None, for items
+        without a transaction) to the gross cost and discount savings of
+        their items, computed with one grouped query each.
+
+        """
+        bought_items = self.bought_items.order_by()
+        discounts = BoughtItemDiscount.objects.filter(
+            bought_item__order=self,
+        ).order_by()
+        if exclude_reserved:
+            bought_items = bought_items.exclude(status=BoughtItem.RESERVED)
+            discounts = discounts.exclude(bought_item__status=BoughtItem.RESERVED)
+
+        totals = defaultdict(lambda: {'gross_cost': 0, 'savings': 0})
+        for row in bought_items.values('transactions').annotate(gross_cost=Sum('price')):
+            totals[row['transactions']]['gross_cost'] = row['gross_cost']
+
+        # Percent savings are summed as hundredths and divided afterwards,
+        # since databases don't agree on how to divide decimal columns.
+        price = F('bought_item__price')
+        discounts = discounts.values('bought_item__transactions').annotate(
+            flat=Sum(Case(
+                When(discount_type=BoughtItemDiscount.FLAT,
+                     then=Least('amount', price)),
+                default=Value(0),
+                output_field=models.DecimalField(max_digits=14, decimal_places=2),
+            )),
+            percent=Sum(Case(
+                When(discount_type=BoughtItemDiscount.PERCENT,
+                     then=Least(F('amount') * price, price * 100)),
+                default=Value(0),
+                output_field=models.DecimalField(max_digits=16, decimal_places=4),
+            )),
+        )
+        for row in discounts:
+            savings = row['flat'] + row['percent'] / 100
+            totals[row['bought_item__transactions']]['savings'] = savings
+        return totals
 
+    def get_summary_data(self):
+        exclude_reserved = self.cart_is_expired()
         # First, fetch all transactions
         transactions_qs = self.transactions.order_by('-timestamp')
-        # First fetch BoughtItems and group by transaction.
-        bought_items_qs = self.bought_items.prefetch_related(
+        # Items are only loaded for display; the totals come from
+        # grouped queries. Each item is loaded once per transaction it
+        # belongs to (or once, without a transaction.)
+        bought_items_qs = self.bought_items.annotate(
+            transaction_id=F('transactions'),
+        ).prefetch_related(
             'discounts',
-            'transactions',
         ).order_by('-added')
+        if exclude_reserved:
+            # Expired reservations haven't been deleted yet.
+            bought_items_qs = bought_items_qs.exclude(status=BoughtItem.RESERVED)
 
         transactions = OrderedDict()
 
@@ -1008,24 +1253,24 @@ class Order(models.Model):
                 'total_savings': 0,
                 'net_cost': 0,
             }
+        transactions_by_id = {txn.pk: txn for txn in transactions if txn}
 
-        def add_item(txn, item):
+        for item in bought_items_qs:
+            txn = transactions_by_id.get(item.transaction_id)
             txn_dict = transactions[txn]
             txn_dict['items'].append(item)
-            multiplier = -1 if txn and txn.transaction_type == Transaction.REFUND else 1
             if not txn or txn.transaction_type != Transaction.TRANSFER:
-                txn_dict['gross_cost'] += multiplier * item.price
-                for discount in item.discounts.all():
-                    txn_dict['discounts'].append(discount)
-                    txn_dict["total_savings"] -= multiplier * discount.savings()
-                txn_dict['net_cost'] = txn_dict['gross_cost'] + txn_dict['total_savings']
+                txn_dict['discounts'].extend(item.discounts.all())
 
-        for item in bought_items_qs:
-            if not item.transactions.all():
-                add_item(None, item)
-            else:
-                for txn in item.transactions.all():
-                    add_item(txn, item)
+        totals = self._get_summary_totals(exclude_reserved)
+        for txn, txn_dict in transactions.items():
+            if txn and txn.transaction_type == Transaction.TRANSFER:
+                continue
+            multiplier = -1 if txn and txn.transaction_type == Transaction.REFUND else 1
+            txn_totals = totals[txn.pk if txn else None]
+            txn_dict['gross_cost'] = multiplier * txn_totals['gross_cost']
+            txn_dict['total_savings'] = -multiplier * txn_totals['savings']
+            txn_dict['net_cost'] = txn_dict['gross_cost'] + txn_dict['total_savings']
 
         if not transactions[None]['items']:
             del transactions[None]
@@ -1060,6 +1305,72 @@ class Order(models.Model):
             'unconfirmed_check_payments': unconfirmed_check_payments
         }
 
+    #: Fields kept up to date by update_balance().
+    BALANCE_FIELDS = (
+        'net_cost', 'total_paid', 'total_refunded', 'balance',
+        'first_transaction_time', 'last_transaction_time',
+        'transaction_count',
+    )
+
+    def get_balance_data(self):
+        """
+        Computes the values of the order's balance fields from its
+        transactions and items. They match the totals from
+        get_summary_data, except that items still in the cart don't
+        count towards the net cost.
+
+        """
+        transactions = self.transactions.order_by()
+        amount = models.DecimalField(max_digits=9, decimal_places=2)
+        data = transactions.aggregate(
+            total_paid=Sum(Case(
+                When(transaction_type=Transaction.REFUND, then=Value(0)),
+                default='amount',
+                output_field=amount,
+            )),
+            total_refunded=Sum(Case(
+                When(transaction_type=Transaction.REFUND, then='amount'),
+                default=Value(0),
+                output_field=amount,
+            )),
+            first_transaction_time=Min('timestamp'),
+            last_transaction_time=Max('timestamp'),
+            transaction_count=Count('id'),
+        )
+        data['total_paid'] = data['total_paid'] or 0
+        data['total_refunded'] = data['total_refunded'] or 0
+
+        transaction_types = dict(transactions.values_list('pk', 'transaction_type'))
+        net_cost = 0
+        for txn_id, totals in self._get_summary_totals(exclude_reserved=True).items():
+            transaction_type = transaction_types.get(txn_id)
+            if transaction_type == Transaction.TRANSFER:
+                continue
+            multiplier = -1 if transaction_type == Transaction.REFUND else 1
+            net_cost += multiplier * (totals['gross_cost'] - totals['savings'])
+        # Percent discounts can leave fractions of a cent.
+        data['net_cost'] = Decimal(net_cost).quantize(Decimal('0.01'))
+        data['balance'] = net_cost - (data['total_paid'] + data['total_refunded'])
+        return data
+
+    def update_balance(self):
+        """
+        Recomputes the order's balance fields and saves them. Callers
+        which change the order's transactions or items should call this
+        in the same database transaction.
+
+        """
+        with atomic():
+            # Lock the order so that concurrent changes to its
+            # transactions or items can't save stale totals.
+            list(Order.objects.select_for_update().filter(pk=self.pk).values_list('pk'))
+            data = self.get_balance_data()
+            Order.objects.filter(pk=self.pk).update(**data)
+        for field, value in data.items():
+            setattr(self, field, value)
+
+    update_balance.alters_data = True
+
     def get_eventhousing(self):
         # Workaround for DNE exceptions on nonexistant reverse relations.
         if not hasattr(self, '_eventhousing'):
@@ -1242,18 +1553,30 @@ class Transaction(models.Model):
                 )
                 txn = Transaction.from_stripe_refund(refund, **refund_kwargs)
 
-        # If no payment processor was involved, just make a transaction
-        if amount == 0 or self.method != Transaction.STRIPE:
-            txn = Transaction.objects.create(
-                transaction_type=Transaction.REFUND,
-                amount=-1 * amount,
-                is_confirmed=True,
-                remote_id='',
-                method=self.method,
-                **refund_kwargs
+        with atomic():
+            # If no payment processor was involved, just make a transaction
+            if amount == 0 or self.method != Transaction.STRIPE:
+                txn = Transaction.objects.create(
+                    transaction_type=Transaction.REFUND,
+                    amount=-1 * amount,
+                    is_confirmed=True,
+                    remote_id='',
+                    method=self.method,
+                    **refund_kwargs
+                )
+            txn.bought_items = bought_items
+            bought_counts = list(BoughtItem.objects.filter(
+                pk__in=[item.pk for item in bought_items],
+                status=BoughtItem.BOUGHT,
+            ).values_list('item_option', 'attendee').annotate(Count('id')).order_by())
+            bought_items.update(status=BoughtItem.REFUNDED)
+            EventSummary.objects.update_sales(
+                self.event_id,
+                [(item_option_id, attendee_id, -count)
+                 for item_option_id, attendee_id, count in bought_counts],
             )
-        txn.bought_items = bought_items
-        bought_items.update(status=BoughtItem.REFUNDED)
+            if self.order is not None:
+                self.order.update_balance()
         return txn
 
     refund.alters_data = True
@@ -1277,6 +1600,8 @@ class BoughtItem(models.Model):
         (REFUNDED, _('Refunded')),
         (TRANSFERRED, _('Transferred')),
     )
+    #: Statuses which count against an item option's total_number.
+    TAKEN_STATUSES = (RESERVED, UNPAID, BOUGHT)
     item_option = models.ForeignKey(ItemOption, blank=True, null=True, on_delete=models.SET_NULL)
     order = models.ForeignKey(Order, related_name='bought_items')
     added = models.DateTimeField(auto_now_add=True)
@@ -1315,6 +1640,80 @@ class BoughtItem(models.Model):
         )
 
 
+class BoughtItemDiscountManager(models.Manager):
+    def get_applicable(self, order, discounts):
+        """
+        Works out which of the discounts apply to which of the order's
+        unpaid items, from a single snapshot of the order. Returns
+        unsaved BoughtItemDiscounts with their bought items already
+        attached, so computing their savings doesn't need a query.
+
+        Items get each discount at most once, and never two discounts
+        with the same code.
+
+        """
+        discounts = list(discounts)
+        if any(discount.event_id != order.event_id for discount in discounts):
+            raise ValueError("Discount is not for the correct event")
+        if not discounts:
+            return []
+
+        bought_items = list(order.bought_items.filter(
+            status__in=(BoughtItem.UNPAID, BoughtItem.RESERVED),
+            item_option__isnull=False,
+        ).order_by('pk'))
+        if not bought_items:
+            return []
+
+        discounts_by_option = defaultdict(list)
+        discounts_by_id = {discount.pk: discount for discount in discounts}
+        options = Discount.item_options.through.objects.filter(
+            discount__in=discounts,
+            itemoption__in={item.item_option_id for item in bought_items},
+        ).values_list('itemoption', 'discount')
+        for item_option_id, discount_id in options:
+            discounts_by_option[item_option_id].append(discounts_by_id[discount_id])
+
+        applied = defaultdict(set)
+        for bought_item_id, discount_id, code in self.filter(
+                bought_item__in=bought_items,
+        ).values_list('bought_item', 'discount', 'code'):
+            applied[bought_item_id].update((discount_id, code))
+
+        applicable = []
+        for bought_item in bought_items:
+            for discount in discounts_by_option[bought_item.item_option_id]:
+                if applied[bought_item.pk] & {discount.pk, discount.code}:
+                    continue
+                applied[bought_item.pk].update((discount.pk, discount.code))
+                applicable.append(self.model(
+                    discount=discount,
+                    bought_item=bought_item,
+                    name=discount.name,
+                    code=discount.code,
+                    discount_type=discount.discount_type,
+                    amount=discount.amount,
+                ))
+        return applicable
+
+    def apply(self, order, discounts):
+        """
+        Adds the applicable discounts to the order's unpaid items with
+        a single insert. Returns the new BoughtItemDiscounts.
+
+        """
+        applicable = self.get_applicable(order, discounts)
+        if applicable:
+            with atomic():
+                self.bulk_create(applicable)
+                # Unpaid items have been checked out, so they count
+                # towards the balance.
+                if any(bought_item_discount.bought_item.status == BoughtItem.UNPAID
+                       for bought_item_discount in applicable):
+                    order.update_balance()
+        return applicable
+
+
 class BoughtItemDiscount(models.Model):
     """"Tracks whether an item has had a discount applied to it."""
     PERCENT = 'percent'
@@ -1338,6 +1737,8 @@ class BoughtItemDiscount(models.Model):
     amount = models.DecimalField(max_digits=6, decimal_places=2,
                                  validators=[MinValueValidator(0)])
 
+    objects = BoughtItemDiscountManager()
+
     class Meta:
         unique_together = ('bought_item', 'code')
 
@@ -1586,19 +1987,23 @@ class HousingAssignment(models.Model):
 
 class InviteManager(models.Manager):
     def get_or_create_invite(self, email, user, kind, content_id):
-        while True:
+        for attempt in range(CODE_ATTEMPTS):
             code = get_random_string(
                 length=20,
                 allowed_chars='abcdefghijkmnpqrstuvwxyz'
                               'ABCDEFGHJKLMNPQRSTUVWXYZ23456789-~'
             )
-            if not Invite.objects.filter(code=code).exists():
-                break
-        defaults = {
-            'user': user,
-            'code': code,
-        }
-        return self.get_or_create(email=email, content_id=content_id, kind=kind, defaults=defaults)
+            defaults = {
+                'user': user,
+                'code': code,
+            }
+            try:
+                return self.get_or_create(email=email, content_id=content_id, kind=kind, defaults=defaults)
+            except IntegrityError:
+                # get_or_create has already checked for an existing
+                # invite, so the code was taken.
+                if attempt == CODE_ATTEMPTS - 1:
+                    raise
 
 
 class Invite(models.Model):
@@ -1766,12 +2171,16 @@ class CustomFormEntry(models.Model):
     def set_value(self, value):
         self.value = json.dumps(value)
 
-    def get_value(self):
+    @staticmethod
+    def decode_value(value):
         try:
-            return json.loads(self.value)
+            return json.loads(value)
         except Exception:
             return ''
 
+    def get_value(self):
+        return self.decode_value(self.value)
+
 
 class SavedReport(models.Model):
     ATTENDEE = 'attendee'
@@ -1787,6 +2196,738 @@ class SavedReport(models.Model):
     querystring = models.TextField()
 
 
+class ExportJobManager(models.Manager):
+    def get_key(self, event, report_type, format, querystring):
+        return hashlib.sha1('|'.join((
+            str(event.pk), report_type, format, querystring,
+        )).encode('utf-8')).hexdigest()
+
+    def enqueue(self, event, report_type, format, querystring):
+        """
+        Returns the export job for the given report, (re)queueing it
+        if it hasn't been rendered for the event's current state.
+
+        """
+        job, created = self.get_or_create(
+            key=self.get_key(event, report_type, format, querystring),
+            defaults={
+                'event': event,
+                'report_type': report_type,
+                'format': format,
+                'querystring': querystring,
+            },
+        )
+        if not created and job.status not in (ExportJob.PENDING, ExportJob.RUNNING) and not job.is_fresh(event):
+            # Only requeue if no other request beat us to it.
+            self.filter(pk=job.pk, status=job.status).update(
+                status=ExportJob.PENDING,
+                last_modified=timezone.now(),
+            )
+            job.status = ExportJob.PENDING
+        return job
+
+    def claim(self):
+        """
+        Marks the oldest pending job as running and returns it, or
+        returns None if there are no pending jobs. Safe to call from
+        several workers at once.
+
+        """
+        pending = self.filter(status=ExportJob.PENDING).order_by('last_modified')
+        for job in pending[:10]:
+            claimed = self.filter(pk=job.pk, status=ExportJob.PENDING).update(
+                status=ExportJob.RUNNING,
+                last_modified=timezone.now(),
+            )
+            if claimed:
+                job.status = ExportJob.RUNNING
+                return job
+        return None
+
+
+class ExportJob(models.Model):
+    """
+    A CSV / XLSX export of an organizer report, rendered outside the
+    request by the run_export_jobs management command. The rendered
+    file is served for identical requests until the event's
+    last_modified changes.
+
+    """
+    ATTENDEE = 'attendee'
+    ORDER = 'order'
+    FINANCE = 'finance'
+    REPORT_TYPE_CHOICES = (
+        (ATTENDEE, _('Attendee')),
+        (ORDER, _('Order')),
+        (FINANCE, _('Finance')),
+    )
+
+    CSV = 'csv'
+    XLSX = 'xlsx'
+    FORMAT_CHOICES = (
+        (CSV, 'CSV'),
+        (XLSX, 'XLSX'),
+    )
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, _('Pending')),
+        (RUNNING, _('Running')),
+        (DONE, _('Done')),
+        (FAILED, _('Failed')),
+    )
+
+    event = models.ForeignKey(Event)
+    report_type = models.CharField(max_length=8, choices=REPORT_TYPE_CHOICES)
+    format = models.CharField(max_length=4, choices=FORMAT_CHOICES)
+    querystring = models.TextField(blank=True)
+    # Hash of event, report type, format and querystring.
+    key = models.CharField(max_length=40, unique=True)
+
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default=PENDING)
+    # Exports contain personal data, so they're kept in private storage
+    # and only served through the organizer views.
+    file = models.FileField(upload_to='exports', blank=True, storage=private_storage)
+    # The event's last_modified value at the time the file was rendered.
+    event_last_modified = models.DateTimeField(blank=True, null=True)
+    error = models.TextField(blank=True)
+
+    # Internal tracking fields.
+    created = models.DateTimeField(auto_now_add=True)
+    last_modified = models.DateTimeField(auto_now=True)
+
+    objects = ExportJobManager()
+
+    def is_fresh(self, event=None):
+        event = event or self.event
+        return (self.status == ExportJob.DONE and bool(self.file) and
+                self.event_last_modified == event.last_modified)
+
+
+class OutboxMessageManager(models.Manager):
+    def enqueue(self, mailer, site, secure=False, **kwargs):
+        """
+        Queues a mailer to be sent by the send_outbox management
+        command. Model instances in kwargs are stored by primary key
+        and fetched again when the message is sent; other values must
+        be JSON-serializable.
+
+        """
+        encoded = {}
+        for name, value in kwargs.items():
+            if isinstance(value, models.Model):
+                value = {'model': value._meta.label_lower, 'pk': value.pk}
+            encoded[name] = value
+        return self.create(
+            mailer=mailer,
+            kwargs=json.dumps(encoded),
+            site_domain=site.domain,
+            site_name=site.name,
+            secure=secure,
+        )
+
+    def claim(self):
+        """
+        Marks the oldest message that is due as sending and returns it,
+        or returns None if no messages are due. Safe to call from
+        several workers at once.
+
+        """
+        now = timezone.now()
+        due = self.filter(
+            status=OutboxMessage.PENDING,
+            next_attempt_at__lte=now,
+        ).order_by('next_attempt_at')
+        for message in due[:10]:
+            claimed = self.filter(pk=message.pk, status=OutboxMessage.PENDING).update(
+                status=OutboxMessage.SENDING,
+                last_modified=now,
+            )
+            if claimed:
+                message.status = OutboxMessage.SENDING
+                return message
+        return None
+
+
+class OutboxMessage(models.Model):
+    """
+    A mail queued to be sent outside the request by the send_outbox
+    management command, so that it can be saved in the same database
+    transaction as the change it's about.
+
+    """
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, _('Pending')),
+        (SENDING, _('Sending')),
+        (SENT, _('Sent')),
+        (FAILED, _('Failed')),
+    )
+
+    # Name of the mailer class in brambling.mail, and its JSON-encoded
+    # keyword arguments.
+    mailer = models.CharField(max_length=50)
+    kwargs = models.TextField()
+    site_domain = models.CharField(max_length=100)
+    site_name = models.CharField(max_length=50)
+    secure = models.BooleanField(default=False)
+
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    error = models.TextField(blank=True)
+
+    # Internal tracking fields.
+    created = models.DateTimeField(auto_now_add=True)
+    last_modified = models.DateTimeField(auto_now=True)
+
+    objects = OutboxMessageManager()
+
+    class Meta:
+        index_together = ('status', 'next_attempt_at')
+
+    def get_mailer_kwargs(self):
+        """
+        Returns the keyword arguments stored for the mailer, with model
+        instances fetched from the database.
+
+        """
+        kwargs = {}
+        for name, value in json.loads(self.kwargs).items():
+            if isinstance(value, dict) and set(value) == {'model', 'pk'}:
+                value = apps.get_model(value['model'])._default_manager.get(pk=value['pk'])
+            kwargs[str(name)] = value
+        return kwargs
+
+
+class EventSummaryManager(models.Manager):
+    def for_event(self, event):
+        """
+        Returns the event's summary, building it from scratch if it
+        doesn't exist yet.
+
+        """
+        try:
+            summary = self.get(event=event)
+        except EventSummary.DoesNotExist:
+            return self.rebuild(event)
+        if summary.last_rebuilt is None:
+            # Another request is building the summary; wait for it to
+            # finish rather than returning its empty row.
+            with atomic():
+                summary = self.select_for_update().get(event=event)
+            if summary.last_rebuilt is None:
+                return self.rebuild(event)
+        return summary
+
+    def rebuild(self, event):
+        """
+        Recalculates the event's summary and item option sales counts
+        from scratch.
+
+        """
+        # Create the summary before locking it, so that changes saved
+        # during the rebuild wait for the lock instead of being lost.
+        # It isn't marked as rebuilt until it's filled in, so readers
+        # know to wait for the lock.
+        self.get_or_create(event=event, defaults={'last_rebuilt': None})
+        with atomic():
+            summary_id = self.select_for_update().filter(event=event).values_list('pk', flat=True).get()
+            summary = self.model(pk=summary_id, event=event)
+            txn_sums = Transaction.objects.filter(event=event).values(
+                'transaction_type', 'is_confirmed',
+            ).annotate(
+                amount=Sum('amount'),
+                application_fee=Sum('application_fee'),
+                processing_fee=Sum('processing_fee'),
+            ).order_by()
+            for sums in txn_sums:
+                deltas = EventSummary.get_transaction_deltas(
+                    sums['transaction_type'],
+                    sums['is_confirmed'],
+                    sums['amount'] or 0,
+                    sums['application_fee'] or 0,
+                    sums['processing_fee'] or 0,
+                )
+                for field, delta in deltas.items():
+                    setattr(summary, field, getattr(summary, field) + delta)
+            summary.set_attendee_counts()
+            summary.save()
+
+            bought_counts = ItemOption.objects.with_sales(event).values_list('pk', 'bought_count')
+            ItemOptionSummary.objects.filter(item_option__item__event=event).delete()
+            ItemOptionSummary.objects.bulk_create([
+                ItemOptionSummary(item_option_id=item_option_id, bought_count=bought_count)
+                for item_option_id, bought_count in bought_counts
+            ])
+        return summary
+
+    def _lock(self, event_id):
+        # Changes are made while holding the summary's row lock, so
+        # that they're serialized with each other and with rebuilds.
+        list(self.select_for_update().filter(event=event_id).values_list('pk'))
+
+    def _add(self, event_id, deltas):
+        deltas = {field: F(field) + delta for field, delta in deltas.items() if delta}
+        if deltas:
+            self.filter(event=event_id).update(**deltas)
+
+    def update_transaction(self, event_id, old_state, new_state):
+        """
+        Adjusts the event's summary for a transaction which changed
+        from old_state to new_state. Either state may be None.
+
+        """
+        deltas = {}
+        for state, sign in ((old_state, -1), (new_state, 1)):
+            if state is None:
+                continue
+            for field, delta in EventSummary.get_transaction_deltas(*state).items():
+                deltas[field] = deltas.get(field, 0) + sign * delta
+        # The update takes the summary's row lock itself.
+        self._add(event_id, deltas)
+
+    def update_sales(self, event_id, bought_counts):
+        """
+        Adjusts item option sales counts and the event's attendee
+        counts once bought items have been bought, refunded or moved.
+        bought_counts is an iterable of (item option id, attendee id,
+        change in the number of bought items).
+
+        """
+        option_counts = {}
+        attendee_counts = {}
+        for item_option_id, attendee_id, delta in bought_counts:
+            if item_option_id is not None:
+                option_counts[item_option_id] = option_counts.get(item_option_id, 0) + delta
+            if attendee_id is not None:
+                attendee_counts[attendee_id] = attendee_counts.get(attendee_id, 0) + delta
+        option_counts = {pk: delta for pk, delta in option_counts.items() if delta}
+        attendee_counts = {pk: delta for pk, delta in attendee_counts.items() if delta}
+        if not option_counts and not attendee_counts:
+            return
+
+        with atomic():
+            self._lock(event_id)
+            for item_option_id, delta in option_counts.items():
+                ItemOptionSummary.objects.add_bought_count(item_option_id, delta)
+            if not attendee_counts:
+                return
+            # An attendee is counted while they have at least one
+            # bought item, so only the attendees whose number of bought
+            # items went to or from zero change the counts.
+            attendees = Attendee.objects.filter(pk__in=attendee_counts).annotate(
+                bought_count=Sum(Case(
+                    When(bought_items__status=BoughtItem.BOUGHT, then=1),
+                    default=0,
+                    output_field=IntegerField(),
+                )),
+            ).values_list('pk', 'housing_status', 'bought_count')
+            deltas = {}
+            for attendee_id, housing_status, bought_count in attendees:
+                was_counted = bought_count - attendee_counts[attendee_id] > 0
+                if was_counted == (bought_count > 0):
+                    continue
+                sign = -1 if was_counted else 1
+                for field, delta in EventSummary.get_attendee_deltas(housing_status).items():
+                    deltas[field] = deltas.get(field, 0) + sign * delta
+            self._add(event_id, deltas)
+
+    def update_housing_status(self, event_id, attendee_id, old_status, new_status):
+        """
+        Adjusts the event's attendee counts for an attendee whose
+        housing status changed.
+
+        """
+        with atomic():
+            self._lock(event_id)
+            if not BoughtItem.objects.filter(attendee=attendee_id, status=BoughtItem.BOUGHT).exists():
+                return
+            deltas = {}
+            for status, sign in ((old_status, -1), (new_status, 1)):
+                for field, delta in EventSummary.get_attendee_deltas(status).items():
+                    deltas[field] = deltas.get(field, 0) + sign * delta
+            self._add(event_id, deltas)
+
+    def update_attendee_counts(self, event_id):
+        """
+        Recounts the event's attendees. Used where the change can't be
+        worked out from a single row, such as deletions.
+
+        """
+        with atomic():
+            try:
+                summary = self.select_for_update().get(event=event_id)
+            except EventSummary.DoesNotExist:
+                return
+            summary.set_attendee_counts()
+            self.filter(pk=summary.pk).update(
+                attendee_count=summary.attendee_count,
+                attendee_need_count=summary.attendee_need_count,
+                attendee_have_count=summary.attendee_have_count,
+                attendee_home_count=summary.attendee_home_count,
+            )
+
+
+class EventSummary(models.Model):
+    """
+    Sales totals for an event's summary page, maintained as transactions,
+    bought items and attendees are saved. Use the rebuild_event_summaries
+    management command to recalculate them from scratch.
+
+    """
+    event = models.OneToOneField(Event, related_name='summary')
+
+    confirmed_purchases = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    pending_purchases = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    refunds = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Sum of all transaction amounts, before fees.
+    net_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    application_fees = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    processing_fees = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    # Attendees with at least one bought item.
+    attendee_count = models.PositiveIntegerField(default=0)
+    attendee_need_count = models.PositiveIntegerField(default=0)
+    attendee_have_count = models.PositiveIntegerField(default=0)
+    attendee_home_count = models.PositiveIntegerField(default=0)
+
+    # Null while the summary is first being built.
+    last_rebuilt = models.DateTimeField(default=timezone.now, blank=True, null=True)
+
+    objects = EventSummaryManager()
+
+    @staticmethod
+    def get_transaction_deltas(transaction_type, is_confirmed, amount,
+                               application_fee, processing_fee):
+        deltas = {
+            'net_amount': amount,
+            'application_fees': application_fee,
+            'processing_fees': processing_fee,
+        }
+        if transaction_type == Transaction.PURCHASE:
+            if is_confirmed:
+                deltas['confirmed_purchases'] = amount
+            else:
+                deltas['pending_purchases'] = amount
+        elif transaction_type == Transaction.REFUND:
+            deltas['refunds'] = amount
+        return deltas
+
+    @staticmethod
+    def get_attendee_deltas(housing_status):
+        deltas = {'attendee_count': 1}
+        if housing_status == Attendee.NEED:
+            deltas['attendee_need_count'] = 1
+        elif housing_status == Attendee.HAVE:
+            deltas['attendee_have_count'] = 1
+        elif housing_status == Attendee.HOME:
+            deltas['attendee_home_count'] = 1
+        return deltas
+
+    def set_attendee_counts(self):
+        counts = dict(Attendee.objects.filter(
+            order__event=self.event_id,
+            bought_items__status=BoughtItem.BOUGHT,
+        ).values_list('housing_status').annotate(Count('id', distinct=True)).order_by())
+        self.attendee_count = sum(counts.values())
+        self.attendee_need_count = counts.get(Attendee.NEED, 0)
+        self.attendee_have_count = counts.get(Attendee.HAVE, 0)
+        self.attendee_home_count = counts.get(Attendee.HOME, 0)
+
+    @property
+    def fees(self):
+        return self.application_fees + self.processing_fees
+
+
+class ItemOptionSummaryManager(models.Manager):
+    def add_bought_count(self, item_option_id, delta):
+        updated = self.filter(item_option=item_option_id).update(
+            bought_count=F('bought_count') + delta,
+        )
+        if not updated:
+            # The item option was created after the event summary was
+            # built, or the summary hasn't been built yet.
+            bought_count = BoughtItem.objects.filter(
+                item_option=item_option_id,
+                status=BoughtItem.BOUGHT,
+            ).count()
+            try:
+                with atomic():
+                    self.create(item_option_id=item_option_id, bought_count=bought_count)
+            except IntegrityError:
+                # Created concurrently, with our change already counted.
+                pass
+
+
+class ItemOptionSummary(models.Model):
+    item_option = models.OneToOneField(ItemOption, related_name='summary')
+    bought_count = models.PositiveIntegerField(default=0)
+
+    objects = ItemOptionSummaryManager()
+
+
+class WaitingRoom(models.Model):
+    """
+    The next free place in an event's waiting room. Issuing a ticket
+    locks this row, so that the queue doesn't contend with everything
+    else which writes to the event.
+
+    """
+    event = models.OneToOneField(Event, related_name='waiting_room')
+    next_admit_at = models.DateTimeField(blank=True, null=True)
+
+
+class WaitingRoomTicketManager(models.Manager):
+    def issue(self, event):
+        """
+        Creates a ticket for the next place in the event's waiting room.
+        Tickets are admitted at the event's admit rate, one after
+        another; if nobody is waiting, the ticket is admitted right away.
+
+        """
+        # Round up so that rounding never admits more than the rate.
+        interval = timedelta(microseconds=-(-10 ** 6 // event.waiting_room_admit_rate))
+        WaitingRoom.objects.get_or_create(event=event)
+        with atomic():
+            # Lock the event's waiting room so that visitors arriving
+            # together are given places one after another rather than
+            # the same one. The event's own row isn't locked, since
+            # checkouts write to it.
+            room = WaitingRoom.objects.select_for_update().get(event=event)
+            now = timezone.now()
+            admit_at = now
+            if room.next_admit_at is not None:
+                admit_at = max(now, room.next_admit_at)
+            room.next_admit_at = admit_at + interval
+            room.save(update_fields=['next_admit_at'])
+            return self.create(event=event, admit_at=admit_at)
+
+    def prune(self, older_than=timedelta(hours=1)):
+        """
+        Deletes tickets admitted more than older_than ago. Admitted
+        tickets no longer affect anyone's place in the queue, and
+        visitors keep theirs in their signed session token. Returns
+        the number of tickets deleted.
+
+        """
+        return self.filter(admit_at__lt=timezone.now() - older_than).delete()[0]
+
+    def get_position(self, event, admit_at):
+        """
+        Returns the number of visitors who are still waiting ahead of a
+        ticket with the given admission time.
+
+        """
+        return self.filter(
+            event=event,
+            admit_at__gt=timezone.now(),
+            admit_at__lt=admit_at,
+        ).count()
+
+
+class WaitingRoomTicket(models.Model):
+    event = models.ForeignKey(Event)
+    admit_at = models.DateTimeField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    objects = WaitingRoomTicketManager()
+
+    class Meta:
+        index_together = ('event', 'admit_at')
+
+
+class CheckoutAttemptManager(models.Manager):
+    #: Pending attempts are assumed to have died after this long.
+    STALE_AFTER = timedelta(minutes=2)
+
+    def claim(self, order, key):
+        """
+        Returns the attempt for the order and key, and whether this
+        request should process it. New attempts are always claimed;
+        failed and stale pending attempts are claimed by the first
+        request to retry them.
+
+        """
+        attempt, created = self.get_or_create(order=order, key=key)
+        if created:
+            return attempt, True
+        now = timezone.now()
+        claimed = self.filter(
+            models.Q(status=CheckoutAttempt.FAILED) |
+            models.Q(status=CheckoutAttempt.PENDING, last_modified__lt=now - self.STALE_AFTER),
+            pk=attempt.pk,
+        ).update(status=CheckoutAttempt.PENDING, last_modified=now)
+        if claimed:
+            attempt.status = CheckoutAttempt.PENDING
+        return attempt, bool(claimed)
+
+
+class CheckoutAttempt(models.Model):
+    """
+    Records a payment submitted from the order summary, keyed by a
+    token rendered into the payment forms. A retried submission finds
+    the original attempt instead of paying again, and the key is also
+    sent to Stripe so that charges can't be duplicated.
+
+    """
+    PENDING = 'pending'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = (
+        (PENDING, _('Pending')),
+        (SUCCEEDED, _('Succeeded')),
+        (FAILED, _('Failed')),
+    )
+
+    order = models.ForeignKey(Order, related_name='checkout_attempts')
+    key = models.CharField(max_length=40)
+    status = models.CharField(max_length=9, choices=STATUS_CHOICES, default=PENDING)
+    transaction = models.ForeignKey(Transaction, blank=True, null=True,
+                                    on_delete=models.SET_NULL)
+    created = models.DateTimeField(auto_now_add=True)
+    last_modified = models.DateTimeField(auto_now=True)
+
+    objects = CheckoutAttemptManager()
+
+    class Meta:
+        unique_together = ('order', 'key')
+
+    def get_idempotency_key(self):
+        return 'checkout-{}-{}'.format(self.order_id, self.key)
+
+    def succeed(self, transaction):
+        self.status = CheckoutAttempt.SUCCEEDED
+        self.transaction = transaction
+        self.save()
+
+    succeed.alters_data = True
+
+    def fail(self):
+        self.status = CheckoutAttempt.FAILED
+        self.save()
+
+    fail.alters_data = True
+
+
+def get_search_tokens(*values):
+    """
+    Splits values into lowercase words for the search index. Email
+    addresses are also split into their local part and domain, so that
+    either can be searched for.
+
+    """
+    tokens = set()
+    for value in values:
+        for word in (value or '').lower().split():
+            tokens.add(word[:SearchToken.MAX_LENGTH])
+            if '@' in word:
+                tokens.update(part[:SearchToken.MAX_LENGTH]
+                              for part in word.split('@') if part)
+    return tokens
+
+
+class SearchTokenManager(models.Manager):
+    def _get_order_tokens(self, order, person=None):
+        values = [order.code, order.email]
+        if person is not None:
+            values += [person.first_name, person.middle_name, person.last_name, person.email]
+        return [
+            SearchToken(event_id=order.event_id, order_id=order.pk, token=token)
+            for token in get_search_tokens(*values)
+        ]
+
+    def _get_attendee_tokens(self, attendee, event_id):
+        values = [attendee.first_name, attendee.middle_name, attendee.last_name, attendee.email]
+        return [
+            SearchToken(event_id=event_id, order_id=attendee.order_id,
+                        attendee_id=attendee.pk, token=token)
+            for token in get_search_tokens(*values)
+        ]
+
+    @atomic
+    def index_order(self, order):
+        "Replaces the order's own tokens; its attendees' are left alone."
+        self.filter(order=order, attendee__isnull=True).delete()
+        self.bulk_create(self._get_order_tokens(order, order.person))
+
+    @atomic
+    def index_attendee(self, attendee):
+        self.filter(attendee=attendee).delete()
+        event_id = _get_order_event_id(attendee.order_id)
+        self.bulk_create(self._get_attendee_tokens(attendee, event_id))
+
+    @atomic
+    def rebuild(self, event):
+        self.filter(event=event).delete()
+        tokens = []
+        for order in Order.objects.filter(event=event).select_related('person'):
+            tokens.extend(self._get_order_tokens(order, order.person))
+        for attendee in Attendee.objects.filter(order__event=event):
+            tokens.extend(self._get_attendee_tokens(attendee, event.pk))
+        self.bulk_create(tokens)
+
+    def matching(self, event, term):
+        """
+        Returns the tokens in the event which start with the search term.
+
+        """
+        return self.filter(
+            event=event,
+            token__startswith=term.lower()[:SearchToken.MAX_LENGTH],
+        )
+
+    def order_filter(self, event, term):
+        """
+        Returns a filter for orders which match the search term, either
+        themselves or through one of their attendees.
+
+        """
+        return models.Q(pk__in=self.matching(event, term).values('order'))
+
+    def attendee_filter(self, event, term):
+        """
+        Returns a filter for attendees who match the search term, either
+        themselves or through their order.
+
+        """
+        matching = self.matching(event, term)
+        return (
+            models.Q(pk__in=matching.filter(attendee__isnull=False).values('attendee')) |
+            models.Q(order__in=matching.filter(attendee__isnull=True).values('order'))
+        )
+
+
+class SearchToken(models.Model):
+    """
+    A word from an order's code, names or emails, or from one of its
+    attendees' names or emails, which can be prefix-searched within
+    an event. Order tokens have no attendee.
+
+    """
+    MAX_LENGTH = 100
+
+    event = models.ForeignKey(Event)
+    order = models.ForeignKey(Order)
+    attendee = models.ForeignKey(Attendee, blank=True, null=True)
+    token = models.CharField(max_length=MAX_LENGTH)
+
+    objects = SearchTokenManager()
+
+    class Meta:
+        # Tokens are always searched within an event. On PostgreSQL,
+        # migrations add a varchar_pattern_ops version of this index so
+        # that prefix searches can use it.
+        index_together = ('event', 'token')
+
+
 class ProcessedStripeEvent(models.Model):
     LIVE = LIVE
     TEST = TEST
@@ -1814,8 +2955,216 @@ def update_event_and_org_last_modified(sender, instance, **kwargs):
     Organization.objects.filter(event=event_id).update(last_modified=now)
 
 
+def _get_transaction_summary_state(instance):
+    return (
+        instance.transaction_type,
+        instance.is_confirmed,
+        Decimal(instance.amount),
+        Decimal(instance.application_fee),
+        Decimal(instance.processing_fee),
+    )
+
+
+def _get_bought_item_summary_state(instance):
+    return (instance.status, instance.item_option_id, instance.attendee_id)
+
+
+def _get_attendee_summary_state(instance):
+    return (instance.housing_status,)
+
+
+_SUMMARY_STATE_FIELDS = {
+    Transaction: ('event', 'transaction_type', 'is_confirmed', 'amount',
+                  'application_fee', 'processing_fee'),
+    BoughtItem: ('order', 'status', 'item_option', 'attendee'),
+    Attendee: ('order', 'housing_status'),
+}
+
+
+def _get_summary_state(sender, instance):
+    if sender is Transaction:
+        return (instance.event_id, _get_transaction_summary_state(instance))
+    if sender is BoughtItem:
+        return (instance.order_id, _get_bought_item_summary_state(instance))
+    return (instance.order_id, _get_attendee_summary_state(instance))
+
+
+# Keep track of the saved values of fields which affect event summaries,
+# so that they can be updated by the difference when an instance is
+# saved. They're only loaded when saving, so that instances which are
+# only read don't pay for it. Deleted instances use their own values.
+@receiver(signals.pre_save, sender=Transaction)
+@receiver(signals.pre_save, sender=BoughtItem)
+@receiver(signals.pre_save, sender=Attendee)
+def record_summary_state(sender, instance, raw=False, **kwargs):
+    instance._summary_state = None
+    if instance.pk is not None and not raw:
+        saved = sender._default_manager.filter(pk=instance.pk).only(
+            *_SUMMARY_STATE_FIELDS[sender]).first()
+        if saved is not None:
+            instance._summary_state = _get_summary_state(sender, saved)
+
+
+@receiver(signals.post_save, sender=Transaction)
+@receiver(signals.post_delete, sender=Transaction)
+def update_event_summary_for_transaction(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if 'created' in kwargs:
+        old = getattr(instance, '_summary_state', None)
+        new = _get_summary_state(sender, instance)
+    else:
+        old = _get_summary_state(sender, instance)
+        new = None
+    if old == new:
+        return
+    if old is not None and (new is None or old[0] != new[0]):
+        EventSummary.objects.update_transaction(old[0], old[1], None)
+        old = None
+    if new is not None:
+        EventSummary.objects.update_transaction(
+            new[0], old[1] if old else None, new[1])
+
+
+def _get_order_event_id(order_id):
+    return Order.objects.filter(pk=order_id).values_list('event', flat=True).first()
+
+
+@receiver(signals.post_save, sender=BoughtItem)
+@receiver(signals.post_delete, sender=BoughtItem)
+def update_event_summary_for_bought_item(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if 'created' in kwargs:
+        old = getattr(instance, '_summary_state', None)
+        new = _get_summary_state(sender, instance)
+    else:
+        old = _get_summary_state(sender, instance)
+        new = None
+    if old == new:
+        return
+    # Only bought items count towards the summary.
+    states = [state for state in (old, new)
+              if state is not None and state[1][0] == BoughtItem.BOUGHT]
+    if not states:
+        return
+    event_id = _get_order_event_id(states[-1][0])
+    if new is None:
+        # Deletions may cascade from the attendee or the order, in
+        # which case the attendee's other bought items are already
+        # gone, so recount the attendees instead.
+        EventSummary.objects.update_sales(event_id, [(old[1][1], None, -1)])
+        if event_id is not None:
+            EventSummary.objects.update_attendee_counts(event_id)
+        return
+    EventSummary.objects.update_sales(event_id, [
+        (state[1][1], state[1][2], 1 if state is new else -1)
+        for state in states
+    ])
+
+
+@receiver(signals.post_save, sender=Attendee)
+@receiver(signals.post_delete, sender=Attendee)
+def update_event_summary_for_attendee(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if 'created' in kwargs:
+        old = getattr(instance, '_summary_state', None)
+        new = _get_summary_state(sender, instance)
+    else:
+        old = _get_summary_state(sender, instance)
+        new = None
+    if old == new or old is None:
+        # New attendees don't have any bought items yet.
+        return
+    if new is not None and old[0] == new[0]:
+        event_id = _get_order_event_id(new[0])
+        if event_id is not None:
+            EventSummary.objects.update_housing_status(
+                event_id, instance.pk, old[1][0], new[1][0])
+        return
+    # Attendees which were deleted or moved to another order are rare,
+    # so recount the attendees of the events involved.
+    order_ids = set(state[0] for state in (old, new) if state is not None)
+    for event_id in Order.objects.filter(pk__in=order_ids).values_list('event', flat=True).distinct():
+        EventSummary.objects.update_attendee_counts(event_id)
+
+
+def _get_order_search_state(instance):
+    return (instance.code, instance.email, instance.person_id)
+
+
+def _get_attendee_search_state(instance):
+    return (instance.order_id, instance.first_name, instance.middle_name,
+            instance.last_name, instance.email)
+
+
+def _get_person_search_state(instance):
+    return (instance.first_name, instance.middle_name, instance.last_name,
+            instance.email)
+
+
+SEARCH_STATE_GETTERS = {
+    Order: _get_order_search_state,
+    Attendee: _get_attendee_search_state,
+    Person: _get_person_search_state,
+}
+
+
+# Keep track of the saved values of searchable fields, so that the
+# search index is only rebuilt when one of them changes.
+@receiver(signals.post_init, sender=Order)
+@receiver(signals.post_init, sender=Attendee)
+@receiver(signals.post_init, sender=Person)
+def record_search_state(sender, instance, **kwargs):
+    if instance.pk is None:
+        instance._search_state = None
+    else:
+        instance._search_state = SEARCH_STATE_GETTERS[sender](instance)
+
+
+@receiver(signals.post_save, sender=Order)
+@receiver(signals.post_save, sender=Attendee)
+@receiver(signals.post_save, sender=Person)
+def update_search_index(sender, instance, **kwargs):
+    state = SEARCH_STATE_GETTERS[sender](instance)
+    if state == getattr(instance, '_search_state', None):
+        return
+    instance._search_state = state
+    if sender is Order:
+        SearchToken.objects.index_order(instance)
+    elif sender is Attendee:
+        SearchToken.objects.index_attendee(instance)
+    else:
+        for order in Order.objects.filter(person=instance):
+            order.person = instance
+            SearchToken.objects.index_order(order)
+
+
 @receiver(signals.post_save, sender=Event)
 def update_org_last_modified(sender, instance, **kwargs):
     now = timezone.now()
     org_id = instance.organization_id
     Organization.objects.filter(pk=org_id).update(last_modified=now)
+
+
+@receiver(signals.post_save, sender=OrganizationMember)
+@receiver(signals.post_delete, sender=OrganizationMember)
+@receiver(signals.post_save, sender=EventMember)
+@receiver(signals.post_delete, sender=EventMember)
+def invalidate_member_permissions(sender, instance, **kwargs):
+    from brambling.utils.permissions import invalidate_permissions
+    invalidate_permissions(instance.person_id)
+
+
+@receiver(signals.post_init, sender=Person)
+def record_superuser_state(sender, instance, **kwargs):
+    instance._was_superuser = instance.is_superuser
+
+
+@receiver(signals.post_save, sender=Person)
+def invalidate_superuser_permissions(sender, instance, created, **kwargs):
+    if not created and instance.is_superuser != instance._was_superuser:
+        from brambling.utils.permissions import invalidate_permissions
+        invalidate_permissions(instance.pk)
+    instance._was_superuser = instance.is_superuser
@@ -39,7 +39,8 @@ def stripe_delete_card(customer, card_id):
     customer.sources.retrieve(card_id).delete()
 
 
-def stripe_charge(source, amount, order, event, customer=None):
+def stripe_charge(source, amount, order, event, customer=None,
+                  idempotency_key=None):
     if amount < 0:
         raise InvalidAmountException('Cannot charge an amount less than zero.')
     stripe_prep(event.api_type)
@@ -48,11 +49,15 @@ def stripe_charge(source, amount, order, event, customer=None):
     else:
         stripe_account = event.organization.stripe_test_user_id
 
+    # Stripe returns the original response for a repeated idempotency
+    # key, so a retried checkout can't charge twice.
     if customer is not None:
         source = stripe.Token.create(
             customer=customer,
             card=source,
             stripe_account=stripe_account,
+            idempotency_key=(idempotency_key + '-token'
+                             if idempotency_key is not None else None),
         )
     return stripe.Charge.create(
         amount=int(amount * 100),
@@ -65,6 +70,7 @@ def stripe_charge(source, amount, order, event, customer=None):
             'event': event.name,
         },
         stripe_account=stripe_account,
+        idempotency_key=idempotency_key,
     )
 
 
@@ -7,3 +7,9 @@ class StaticS3Storage(S3Boto3Storage):
 
 class MediaS3Storage(S3Boto3Storage):
     location = 'media'
+
+
+class PrivateMediaS3Storage(S3Boto3Storage):
+    location = 'private'
+    default_acl = 'private'
+    querystring_auth = True
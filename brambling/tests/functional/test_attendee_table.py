@@ -6,9 +6,10 @@ from django.utils import timezone
 
 from brambling.utils.model_tables import (
     AttendeeTable,
+    PAGE_FIELD,
     TABLE_COLUMN_FIELD,
 )
-from brambling.models import CustomFormEntry
+from brambling.models import BoughtItemDiscount, CustomFormEntry
 from brambling.tests.factories import (
     AttendeeFactory,
     CustomFormFactory,
@@ -64,6 +65,7 @@ class AttendeeTableTestCase(TestCase):
 
         attendee_form = CustomFormFactory(event=self.event, form_type='attendee')
         f1 = CustomFormFieldFactory(form=attendee_form, name='favorite color')
+        self.custom_field1 = f1
         self.custom_key1 = f1.key
         entry1 = CustomFormEntry.objects.create(
             related_ct=ContentType.objects.get(model='attendee'),
@@ -173,3 +175,226 @@ class AttendeeTableTestCase(TestCase):
         rows = list(table)
         self.assertEqual(rows[0]['pk'].value, self.attendee.pk)
         self.assertEqual(rows[1]['pk'].value, attendee2.pk)
+
+    def test_pending_and_confirmed(self):
+        order2 = OrderFactory(event=self.event)
+        transaction = TransactionFactory(event=self.event, order=order2, is_confirmed=True)
+        item_option2 = ItemOptionFactory(price=30, item=self.item)
+        order2.add_to_cart(self.item_option)
+        order2.add_to_cart(self.item_option)
+        order2.add_to_cart(item_option2)
+        order2.mark_cart_paid(transaction)
+        attendee2 = AttendeeFactory(order=order2, bought_items=order2.bought_items.all())
+
+        item1, item2, item3 = order2.bought_items.order_by('pk')
+        discounts = (
+            (item1, BoughtItemDiscount.FLAT, 10),
+            (item1, BoughtItemDiscount.PERCENT, 25),
+            (item2, BoughtItemDiscount.PERCENT, 33.33),
+            (item3, BoughtItemDiscount.FLAT, 50),
+            (self.attendee.bought_items.get(), BoughtItemDiscount.PERCENT, 12.5),
+        )
+        for i, (bought_item, discount_type, amount) in enumerate(discounts):
+            BoughtItemDiscount.objects.create(
+                bought_item=bought_item,
+                name='Discount {}'.format(i),
+                code=str(i),
+                discount_type=discount_type,
+                amount=amount,
+            )
+
+        table = AttendeeTable(
+            event=self.event,
+            data={TABLE_COLUMN_FIELD: ['pk', 'pending', 'confirmed']},
+        )
+        rows = {row['pk'].value: row for row in table}
+        # 100 - 12.50
+        self.assertEqual(rows[self.attendee.pk]['pending'].value, '$87.50')
+        self.assertEqual(rows[self.attendee.pk]['confirmed'].value, '$0.00')
+        # (100 - 10 - 25) + (100 - 33.33) + (30 - 30)
+        self.assertEqual(rows[attendee2.pk]['pending'].value, '$0.00')
+        self.assertEqual(rows[attendee2.pk]['confirmed'].value, '$131.67')
+
+    def test_custom_data__queries(self):
+        self.attendee.housing_status = 'need'
+        self.attendee.save()
+        data = {TABLE_COLUMN_FIELD: ['pk', self.custom_key1, self.custom_key2]}
+        attendee_ct = ContentType.objects.get_for_model(self.attendee)
+        attendees = self._add_attendees(4)
+        for attendee in attendees[1:]:
+            CustomFormEntry.objects.create(
+                related_ct=attendee_ct,
+                related_id=attendee.pk,
+                form_field=self.custom_field1,
+                value='"teal"',
+            )
+
+        table = AttendeeTable(event=self.event, data=data)
+        table.get_custom_fields()
+        # Attendees, then all of their custom data.
+        with self.assertNumQueries(2):
+            rows = [row for row in table]
+        self.assertEqual(len(rows), 5)
+        values = {row['pk'].value: (row[1].value, row[2].value) for row in rows}
+        self.assertEqual(values[self.attendee.pk], ('ochre', 'bed'))
+        for attendee in attendees[1:]:
+            self.assertEqual(values[attendee.pk], ('teal', ''))
+
+    def _add_attendees(self, count):
+        attendees = [self.attendee]
+        for i in range(count):
+            order = OrderFactory(event=self.event)
+            transaction = TransactionFactory(event=self.event, order=order)
+            order.add_to_cart(self.item_option)
+            order.mark_cart_paid(transaction)
+            attendees.append(AttendeeFactory(
+                order=order,
+                bought_items=order.bought_items.all(),
+                last_name='Solo {}'.format(i),
+            ))
+        return attendees
+
+    def test_chunked_iteration(self):
+        attendees = self._add_attendees(4)
+        data = {TABLE_COLUMN_FIELD: ['pk', 'get_full_name', 'confirmed']}
+        unchunked = [
+            [cell.value for cell in row]
+            for row in AttendeeTable(event=self.event, data=data)
+        ]
+        chunked = [
+            [cell.value for cell in row]
+            for row in AttendeeTable(event=self.event, data=data, chunk_size=2)
+        ]
+        self.assertEqual(
+            sorted(row[0] for row in chunked),
+            [attendee.pk for attendee in attendees],
+        )
+        self.assertEqual(chunked, unchunked)
+
+    def test_chunked_iteration__ordered(self):
+        self._add_attendees(4)
+        data = {
+            'o': '-last_name',
+            TABLE_COLUMN_FIELD: ['pk', 'last_name'],
+        }
+        unchunked = [
+            [cell.value for cell in row]
+            for row in AttendeeTable(event=self.event, data=data)
+        ]
+        chunked = [
+            [cell.value for cell in row]
+            for row in AttendeeTable(event=self.event, data=data, chunk_size=2)
+        ]
+        self.assertEqual(len(chunked), 5)
+        self.assertEqual(chunked, unchunked)
+
+    def test_chunked_iteration__purchase_date(self):
+        attendees = self._add_attendees(4)
+        for i, attendee in enumerate(attendees):
+            attendee.order.transactions.update(
+                timestamp=timezone.now() - datetime.timedelta(days=i % 2),
+            )
+        data = {
+            'o': '-purchase_date',
+            TABLE_COLUMN_FIELD: ['pk', 'purchase_date'],
+        }
+        unchunked = [
+            [cell.value for cell in row]
+            for row in AttendeeTable(event=self.event, data=data)
+        ]
+        chunked = [
+            [cell.value for cell in row]
+            for row in AttendeeTable(event=self.event, data=data, chunk_size=2)
+        ]
+        self.assertEqual(len(chunked), 5)
+        self.assertEqual(sorted(chunked), sorted(unchunked))
+        self.assertEqual(
+            [row[1] for row in chunked],
+            sorted([row[1] for row in chunked], reverse=True),
+        )
+
+    def test_chunked_iteration__queries_per_chunk(self):
+        self._add_attendees(3)
+        data = {TABLE_COLUMN_FIELD: ['pk', 'housing_nights', 'pending', 'confirmed']}
+        table = AttendeeTable(event=self.event, data=data, chunk_size=2)
+        with self.assertNumQueries(2):
+            # Custom fields and the count for list()'s length hint.
+            table.get_custom_fields()
+            len(table)
+        iterator = iter(table)
+        # Each chunk is loaded lazily, with its own prefetch query for
+        # nights. Money columns are computed in the main query.
+        with self.assertNumQueries(2):
+            next(iterator)
+        with self.assertNumQueries(0):
+            next(iterator)
+        # The second chunk, plus one empty query for the end of the
+        # rows. The ordering field can't be null, so there's no query
+        # for null rows.
+        with self.assertNumQueries(2 + 1):
+            rows = list(iterator)
+        self.assertEqual(len(rows), 2)
+
+    def _get_pages(self, data, page_size):
+        pages = []
+        after = None
+        while True:
+            page_data = dict(data)
+            if after is not None:
+                page_data[PAGE_FIELD] = str(after)
+            table = AttendeeTable(event=self.event, data=page_data, page_size=page_size)
+            pages.append([[cell.value for cell in row] for row in table])
+            after = table.next_cursor
+            if after is None:
+                return pages
+
+    def test_pagination(self):
+        attendees = self._add_attendees(4)
+        # Ties are broken by pk.
+        attendees[2].last_name = attendees[3].last_name
+        attendees[2].save()
+        for ordering in ('last_name', '-last_name', '-purchase_date'):
+            data = {
+                'o': ordering,
+                TABLE_COLUMN_FIELD: ['pk', 'last_name', 'purchase_date'],
+            }
+            unpaginated = [
+                [cell.value for cell in row]
+                for row in AttendeeTable(event=self.event, data=data)
+            ]
+            pages = self._get_pages(data, page_size=2)
+            self.assertEqual([len(page) for page in pages], [2, 2, 1])
+            rows = [row for page in pages for row in page]
+            if ordering == '-purchase_date':
+                # Only the order of ties differs.
+                self.assertEqual(sorted(rows), sorted(unpaginated))
+            else:
+                self.assertEqual(rows, unpaginated)
+
+    def test_pagination__unknown_cursor(self):
+        self._add_attendees(2)
+        data = {TABLE_COLUMN_FIELD: ['pk'], PAGE_FIELD: 'nope'}
+        table = AttendeeTable(event=self.event, data=data, page_size=2)
+        self.assertEqual(len(list(table)), 2)
+        self.assertIsNotNone(table.next_cursor)
+
+    def test_pagination__queries(self):
+        """Later pages take as many queries as the first one."""
+        self._add_attendees(5)
+        data = {TABLE_COLUMN_FIELD: ['pk', 'housing_nights', 'pending', 'confirmed']}
+        table = AttendeeTable(event=self.event, data=data, page_size=2)
+        table.get_custom_fields()
+        # The page, then its nights.
+        with self.assertNumQueries(2):
+            rows = [row for row in table]
+        self.assertEqual(len(rows), 2)
+        data[PAGE_FIELD] = str(table.next_cursor)
+        table = AttendeeTable(event=self.event, data=data, page_size=2)
+        table.get_custom_fields()
+        # The cursor's row, the page, then its nights.
+        with self.assertNumQueries(3):
+            rows = [row for row in table]
+        self.assertEqual(len(rows), 2)
+        # Counting doesn't add any of the columns' data.
+        with self.assertNumQueries(1):
+            self.assertEqual(table.count(), 6)
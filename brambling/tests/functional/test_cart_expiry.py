@@ -0,0 +1,127 @@
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.db.transaction import atomic
+from django.test import TestCase
+from django.utils import timezone
+from mock import patch
+
+from brambling.models import BoughtItem, ItemOption, Order
+from brambling.tests.factories import (
+    EventFactory,
+    ItemFactory,
+    ItemOptionFactory,
+    OrderFactory,
+    TransactionFactory,
+)
+
+
+class CartExpiryTestCase(TestCase):
+    def setUp(self):
+        self.event = EventFactory(cart_timeout=15)
+        item = ItemFactory(event=self.event)
+        self.item_option = ItemOptionFactory(price=100, item=item)
+
+    def make_cart(self, minutes_ago, event=None):
+        event = event or self.event
+        item_option = self.item_option
+        if event != self.event:
+            item_option = ItemOptionFactory(price=100, item=ItemFactory(event=event))
+        order = OrderFactory(event=event)
+        order.add_to_cart(item_option)
+        Order.objects.filter(pk=order.pk).update(
+            cart_start_time=timezone.now() - timedelta(minutes=minutes_ago),
+        )
+        return Order.objects.get(pk=order.pk)
+
+    def test_expire_carts(self):
+        expired = self.make_cart(20)
+        active = self.make_cart(10)
+        # Longer timeouts are respected.
+        other_active = self.make_cart(20, event=EventFactory(cart_timeout=30))
+        other_expired = self.make_cart(40, event=other_active.event)
+        # Bought items in expired carts are kept.
+        transaction = TransactionFactory(event=self.event, order=expired)
+        BoughtItem.objects.filter(order=expired).update(status=BoughtItem.BOUGHT)
+        expired.add_to_cart(self.item_option)
+        transaction.bought_items = expired.bought_items.filter(status=BoughtItem.BOUGHT)
+        Order.objects.filter(pk=expired.pk).update(
+            cart_start_time=timezone.now() - timedelta(minutes=20),
+        )
+
+        self.assertEqual(Order.objects.expire_carts(batch_size=1), 2)
+
+        self.assertEqual(
+            list(expired.bought_items.values_list('status', flat=True)),
+            [BoughtItem.BOUGHT],
+        )
+        self.assertFalse(other_expired.bought_items.exists())
+        for order in (expired, other_expired):
+            order.refresh_from_db()
+            self.assertIsNone(order.cart_start_time)
+        for order in (active, other_active):
+            order.refresh_from_db()
+            self.assertIsNotNone(order.cart_start_time)
+            self.assertTrue(order.bought_items.exists())
+
+    def test_expire_carts__restarted(self):
+        order = self.make_cart(20)
+
+        def restart_cart(*args, **kwargs):
+            # The cart is restarted after its id was selected.
+            Order.objects.filter(pk=order.pk).update(cart_start_time=timezone.now())
+            return atomic(*args, **kwargs)
+
+        with patch('brambling.models.atomic', side_effect=restart_cart):
+            self.assertEqual(Order.objects.expire_carts(), 0)
+        order.refresh_from_db()
+        self.assertIsNotNone(order.cart_start_time)
+        self.assertTrue(order.bought_items.exists())
+
+    def test_command(self):
+        order = self.make_cart(20)
+        call_command('expire_carts')
+        self.assertFalse(order.bought_items.exists())
+
+    def test_request_path_doesnt_write(self):
+        order = self.make_cart(20)
+        order.event = self.event
+        with self.assertNumQueries(0):
+            self.assertFalse(order.has_cart())
+            self.assertEqual(list(order.get_groupable_cart()), [])
+        summary_data = order.get_summary_data()
+        self.assertNotIn(None, summary_data['transactions'])
+        self.assertEqual(summary_data['net_cost'], 0)
+        self.assertTrue(order.bought_items.exists())
+
+    def test_expired_items_not_taken(self):
+        self.item_option.total_number = 1
+        self.item_option.save()
+        self.make_cart(20)
+        item_option = ItemOption.objects.with_sales(self.event).get()
+        self.assertEqual(item_option.reserved_count, 0)
+        self.assertEqual(item_option.taken, 0)
+        self.assertEqual(ItemOption.objects.get(pk=self.item_option.pk).remaining, 1)
+
+        # The expired cart's item can be reserved again.
+        active = self.make_cart(10)
+        self.assertEqual(active.bought_items.count(), 1)
+        item_option = ItemOption.objects.with_sales().get(pk=self.item_option.pk)
+        self.assertEqual(item_option.taken, 1)
+        self.assertIsNone(OrderFactory(event=self.event).add_to_cart(self.item_option))
+
+    def test_expired_items_not_taken__timeouts(self):
+        """Each event's own cart timeout is used."""
+        other_event = EventFactory(cart_timeout=30)
+        self.make_cart(20)
+        self.make_cart(20, event=other_event)
+        taken = dict(ItemOption.objects.with_sales().values_list('item__event', 'taken'))
+        self.assertEqual(taken, {self.event.pk: 0, other_event.pk: 1})
+
+    def test_paid_expired_cart(self):
+        """Paying for an order doesn't buy the items in its expired cart."""
+        order = self.make_cart(20)
+        transaction = TransactionFactory(event=self.event, order=order)
+        order.mark_cart_paid(transaction)
+        self.assertFalse(order.bought_items.exists())
+        self.assertIsNone(order.cart_start_time)
@@ -0,0 +1,247 @@
+from decimal import Decimal
+import threading
+from unittest import skipIf
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, RequestFactory
+from mock import patch
+
+from brambling.models import (
+    Attendee,
+    BoughtItem,
+    EventSummary,
+    ItemOptionSummary,
+    Transaction,
+)
+from brambling.tests.factories import (
+    AttendeeFactory,
+    EventFactory,
+    ItemFactory,
+    ItemOptionFactory,
+    OrderFactory,
+    TransactionFactory,
+)
+from brambling.views.organizer import EventSummaryView
+
+
+SUMMARY_FIELDS = (
+    'confirmed_purchases', 'pending_purchases', 'refunds', 'net_amount',
+    'application_fees', 'processing_fees', 'attendee_count',
+    'attendee_need_count', 'attendee_have_count', 'attendee_home_count',
+)
+
+
+class EventSummaryTestCase(TestCase):
+    def setUp(self):
+        self.event = EventFactory(collect_housing_data=True)
+        item = ItemFactory(event=self.event)
+        self.item_option1 = ItemOptionFactory(price=100, item=item)
+        self.item_option2 = ItemOptionFactory(price=50, item=item)
+
+    def buy(self, item_options, housing_status=Attendee.NEED, is_confirmed=True,
+            amount=100):
+        order = OrderFactory(event=self.event)
+        transaction = TransactionFactory(
+            event=self.event,
+            order=order,
+            amount=amount,
+            application_fee=1,
+            processing_fee=2,
+            is_confirmed=is_confirmed,
+        )
+        for item_option in item_options:
+            order.add_to_cart(item_option)
+        order.mark_cart_paid(transaction)
+        attendee = AttendeeFactory(order=order, housing_status=housing_status)
+        for bought_item in order.bought_items.all():
+            bought_item.attendee = attendee
+            bought_item.save()
+        return order, transaction, attendee
+
+    def get_summary_values(self):
+        summary = EventSummary.objects.get(event=self.event)
+        values = {field: getattr(summary, field) for field in SUMMARY_FIELDS}
+        values['bought_counts'] = dict(ItemOptionSummary.objects.filter(
+            item_option__item__event=self.event,
+        ).values_list('item_option', 'bought_count'))
+        return values
+
+    def test_rebuild(self):
+        self.buy([self.item_option1, self.item_option2], amount=150)
+        self.buy([self.item_option1], housing_status=Attendee.HOME, is_confirmed=False)
+        # Carts don't count.
+        OrderFactory(event=self.event).add_to_cart(self.item_option2)
+
+        summary = EventSummary.objects.rebuild(self.event)
+        self.assertEqual(summary.confirmed_purchases, 150)
+        self.assertEqual(summary.pending_purchases, 100)
+        self.assertEqual(summary.refunds, 0)
+        self.assertEqual(summary.net_amount, 250)
+        self.assertEqual(summary.fees, 6)
+        self.assertEqual(summary.attendee_count, 2)
+        self.assertEqual(summary.attendee_need_count, 1)
+        self.assertEqual(summary.attendee_home_count, 1)
+        self.assertEqual(self.get_summary_values()['bought_counts'], {
+            self.item_option1.pk: 2,
+            self.item_option2.pk: 1,
+        })
+
+    def test_incremental_updates_match_rebuild(self):
+        EventSummary.objects.rebuild(self.event)
+
+        order, transaction, attendee = self.buy([self.item_option1, self.item_option1])
+        self.buy([self.item_option2], is_confirmed=False, amount=50)
+        item_option3 = ItemOptionFactory(price=10, item=self.item_option1.item)
+        order3, _, attendee3 = self.buy([item_option3], housing_status=Attendee.HAVE, amount=10)
+
+        # Refund one item.
+        transaction.refund(
+            amount=Decimal('100'),
+            bought_items=order.bought_items.filter(pk=order.bought_items.all()[0].pk),
+        )
+        # Toggle confirmation.
+        transaction.is_confirmed = False
+        transaction.save()
+        # Change housing status.
+        attendee.housing_status = Attendee.HOME
+        attendee.save()
+        # Transfer an item to another attendee.
+        bought_item = order3.bought_items.get()
+        bought_item.attendee = attendee
+        bought_item.save()
+        # Delete an attendee without items and a bought item.
+        attendee3.delete()
+        order.bought_items.filter(status=BoughtItem.BOUGHT).get().delete()
+        # Other transaction types.
+        TransactionFactory(event=self.event, transaction_type=Transaction.OTHER, amount=5)
+
+        incremental = self.get_summary_values()
+        EventSummary.objects.rebuild(self.event)
+        self.assertEqual(incremental, self.get_summary_values())
+        self.assertEqual(incremental['bought_counts'], {
+            self.item_option1.pk: 0,
+            self.item_option2.pk: 1,
+            item_option3.pk: 1,
+        })
+        self.assertEqual(incremental['attendee_count'], 2)
+
+    def test_incremental_updates__no_recount(self):
+        """Saving bought items and attendees doesn't recount the event's attendees."""
+        EventSummary.objects.rebuild(self.event)
+        with patch.object(EventSummary, 'set_attendee_counts') as set_attendee_counts:
+            order, transaction, attendee = self.buy([self.item_option1, self.item_option2], amount=150)
+            self.buy([self.item_option1], housing_status=Attendee.HOME)
+            attendee.housing_status = Attendee.HAVE
+            attendee.save()
+            # The attendee still has a bought item.
+            transaction.refund(
+                amount=Decimal('100'),
+                bought_items=order.bought_items.filter(item_option=self.item_option1),
+            )
+        self.assertFalse(set_attendee_counts.called)
+
+        incremental = self.get_summary_values()
+        self.assertEqual(incremental['attendee_count'], 2)
+        self.assertEqual(incremental['attendee_have_count'], 1)
+        self.assertEqual(incremental['attendee_home_count'], 1)
+        EventSummary.objects.rebuild(self.event)
+        self.assertEqual(incremental, self.get_summary_values())
+
+    def test_rebuild__existing(self):
+        """Rebuilding updates the existing summary in place."""
+        summary = EventSummary.objects.rebuild(self.event)
+        self.buy([self.item_option1])
+        EventSummary.objects.filter(pk=summary.pk).update(attendee_count=5)
+        rebuilt = EventSummary.objects.rebuild(self.event)
+        self.assertEqual(rebuilt.pk, summary.pk)
+        self.assertEqual(EventSummary.objects.get(pk=summary.pk).attendee_count, 1)
+
+    def test_no_summary(self):
+        self.buy([self.item_option1])
+        self.assertFalse(EventSummary.objects.filter(event=self.event).exists())
+        summary = EventSummary.objects.for_event(self.event)
+        self.assertEqual(summary.attendee_count, 1)
+
+    def test_for_event__unfinished(self):
+        """Summaries which were never filled in are rebuilt."""
+        self.buy([self.item_option1])
+        EventSummary.objects.create(event=self.event, last_rebuilt=None)
+        summary = EventSummary.objects.for_event(self.event)
+        self.assertEqual(summary.attendee_count, 1)
+        self.assertIsNotNone(summary.last_rebuilt)
+
+    def test_loaded_instances__not_tracked(self):
+        """Saved values are only looked up when saving."""
+        EventSummary.objects.rebuild(self.event)
+        order, transaction, attendee = self.buy([self.item_option1])
+        bought_item = BoughtItem.objects.get(order=order)
+        for model in (Transaction, BoughtItem, Attendee):
+            self.assertFalse(hasattr(model.objects.get(order=order), '_summary_state'))
+        bought_item.status = BoughtItem.REFUNDED
+        bought_item.save()
+        self.assertEqual(self.get_summary_values()['bought_counts'][self.item_option1.pk], 0)
+
+    def test_command(self):
+        EventSummary.objects.rebuild(self.event)
+        order = OrderFactory(event=self.event)
+        order.add_to_cart(self.item_option1)
+        # Queryset updates aren't tracked.
+        order.bought_items.update(status=BoughtItem.BOUGHT)
+        self.assertEqual(self.get_summary_values()['bought_counts'][self.item_option1.pk], 0)
+        call_command('rebuild_event_summaries', str(self.event.pk))
+        self.assertEqual(self.get_summary_values()['bought_counts'][self.item_option1.pk], 1)
+
+    def test_view__queries(self):
+        """The summary page's queries don't depend on the size of the event."""
+        view = EventSummaryView()
+        view.request = RequestFactory().get('/')
+        view.request.user = AnonymousUser()
+        view.event = self.event
+        EventSummary.objects.rebuild(self.event)
+
+        with self.assertNumQueries(4):
+            view.get_context_data()
+        for i in range(3):
+            self.buy([self.item_option1, self.item_option2])
+        with self.assertNumQueries(4):
+            context = view.get_context_data()
+        self.assertEqual(context['attendee_count'], 3)
+        self.assertEqual(context['attendee_requesting_count'], 3)
+        self.assertEqual(context['confirmed_purchases'], 300)
+        self.assertEqual(context['net_total'], 291)
+        self.assertEqual(
+            [option.boughtitem__count for option in context['itemoptions']],
+            [3, 3],
+        )
+
+
+class EventSummaryConcurrencyTestCase(TransactionTestCase):
+    @skipIf(connection.vendor == "sqlite", "SQLite doesn't support concurrent writes.")
+    def test_for_event__concurrent(self):
+        """Summaries built by several requests at once are only created once."""
+        event = EventFactory()
+        TransactionFactory(event=event, amount=100)
+        errors = []
+        summaries = []
+
+        def for_event():
+            try:
+                summaries.append(EventSummary.objects.for_event(event))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=for_event) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        # Requests which found the summary being built waited for it.
+        self.assertEqual([summary.net_amount for summary in summaries], [100] * 5)
+        summary = EventSummary.objects.get(event=event)
+        self.assertEqual(summary.net_amount, 100)
@@ -0,0 +1,153 @@
+from io import BytesIO
+import shutil
+import tempfile
+
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages.middleware import MessageMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.management import call_command
+from django.http import QueryDict
+from django.test import TestCase, RequestFactory, override_settings
+from django.utils.six import StringIO
+from openpyxl import load_workbook
+
+from brambling.models import Attendee, Event, ExportJob
+from brambling.tests.factories import (
+    AttendeeFactory,
+    EventFactory,
+    ItemFactory,
+    ItemOptionFactory,
+    OrderFactory,
+    TransactionFactory,
+)
+from brambling.utils.exports import normalize_querystring, render_export_job
+from brambling.views.organizer import AttendeeFilterView
+
+
+class ExportJobTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(PRIVATE_MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+        self.event = EventFactory(collect_housing_data=False)
+        order = OrderFactory(event=self.event)
+        transaction = TransactionFactory(event=self.event, order=order,
+                                         api_type=self.event.api_type)
+        item = ItemFactory(event=self.event)
+        item_option = ItemOptionFactory(price=100, item=item)
+        order.add_to_cart(item_option)
+        order.mark_cart_paid(transaction)
+        self.attendee = AttendeeFactory(
+            order=order,
+            bought_items=order.bought_items.all(),
+            housing_status=Attendee.HOME,
+            first_name='Leia',
+        )
+        self.event.refresh_from_db()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_normalize_querystring(self):
+        qd = QueryDict('format=csv&o=last_name&column=pk&column=email&report=1')
+        self.assertEqual(normalize_querystring(qd), 'column=email&column=pk&o=last_name')
+
+    def test_enqueue__same_report(self):
+        job1 = ExportJob.objects.enqueue(self.event, ExportJob.ATTENDEE, ExportJob.CSV, '')
+        job2 = ExportJob.objects.enqueue(self.event, ExportJob.ATTENDEE, ExportJob.CSV, '')
+        job3 = ExportJob.objects.enqueue(self.event, ExportJob.ATTENDEE, ExportJob.XLSX, '')
+        self.assertEqual(job1.pk, job2.pk)
+        self.assertNotEqual(job1.pk, job3.pk)
+        self.assertEqual(job1.status, ExportJob.PENDING)
+
+    def test_claim(self):
+        job = ExportJob.objects.enqueue(self.event, ExportJob.ATTENDEE, ExportJob.CSV, '')
+        claimed = ExportJob.objects.claim()
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertEqual(claimed.status, ExportJob.RUNNING)
+        self.assertIsNone(ExportJob.objects.claim())
+
+    def test_render__csv(self):
+        job = ExportJob.objects.enqueue(self.event, ExportJob.ATTENDEE, ExportJob.CSV,
+                                        'column-columns=pk&column-columns=get_full_name')
+        render_export_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.DONE)
+        self.assertTrue(job.is_fresh(self.event))
+        job.file.open('rb')
+        content = job.file.read()
+        self.assertEqual(content.splitlines(), [
+            b'Id,Name',
+            '{},{}'.format(self.attendee.pk, self.attendee.get_full_name()).encode('utf-8'),
+        ])
+
+    def test_render__private_file(self):
+        job = ExportJob.objects.enqueue(self.event, ExportJob.ATTENDEE, ExportJob.CSV, '')
+        render_export_job(job)
+        self.assertNotIn(self.event.slug, job.file.name)
+        self.assertRegexpMatches(job.file.name, r'^exports/[a-zA-Z0-9]{32}\.csv$')
+        self.assertTrue(job.file.path.startswith(self.media_root))
+        with self.assertRaises(NotImplementedError):
+            job.file.url
+
+    def test_render__xlsx(self):
+        job = ExportJob.objects.enqueue(self.event, ExportJob.FINANCE, ExportJob.XLSX, '')
+        render_export_job(job)
+        job.file.open('rb')
+        ws = load_workbook(BytesIO(job.file.read())).active
+        self.assertEqual(ws.title, 'Finances')
+        self.assertEqual(len(list(ws.rows)), 2)
+
+    def test_stale_job_requeued(self):
+        job = ExportJob.objects.enqueue(self.event, ExportJob.ORDER, ExportJob.CSV, '')
+        render_export_job(job)
+        job = ExportJob.objects.enqueue(self.event, ExportJob.ORDER, ExportJob.CSV, '')
+        self.assertEqual(job.status, ExportJob.DONE)
+
+        # Saving a transaction bumps the event's last_modified.
+        TransactionFactory(event=self.event)
+        event = Event.objects.get(pk=self.event.pk)
+        job = ExportJob.objects.enqueue(event, ExportJob.ORDER, ExportJob.CSV, '')
+        self.assertEqual(job.status, ExportJob.PENDING)
+        self.assertFalse(job.is_fresh(event))
+
+    def test_command(self):
+        job = ExportJob.objects.enqueue(self.event, ExportJob.ORDER, ExportJob.CSV, '')
+        failing = ExportJob.objects.enqueue(self.event, 'bogus', ExportJob.CSV, '')
+        stderr = StringIO()
+        call_command('run_export_jobs', stderr=stderr)
+        job.refresh_from_db()
+        failing.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.DONE)
+        self.assertEqual(failing.status, ExportJob.FAILED)
+        self.assertIn('Unknown report type', failing.error)
+        self.assertIn('Export job {}'.format(failing.pk), stderr.getvalue())
+
+    @override_settings(BACKGROUND_EXPORTS=True)
+    def test_view(self):
+        factory = RequestFactory()
+
+        def get_response():
+            view = AttendeeFilterView()
+            view.event = self.event
+            view.request = factory.get('/', {'format': 'csv', 'column-columns': 'pk'})
+            view.request.user = AnonymousUser()
+            SessionMiddleware().process_request(view.request)
+            MessageMiddleware().process_request(view.request)
+            return view.render_to_response({})
+
+        response = get_response()
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['location'], '/?column-columns=pk')
+
+        call_command('run_export_jobs')
+
+        response = get_response()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['content-disposition'], 'attachment; filename="export.csv"')
+        self.assertEqual(b''.join(response.streaming_content).splitlines(), [
+            b'Id',
+            str(self.attendee.pk).encode('utf-8'),
+        ])
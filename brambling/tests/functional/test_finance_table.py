@@ -1,6 +1,6 @@
 from django.test import TestCase
 
-from brambling.views.utils import FinanceTable
+from brambling.utils.model_tables import FinanceTable
 from brambling.tests.factories import (TransactionFactory, EventFactory,
                                        PersonFactory, OrderFactory)
 
@@ -0,0 +1,90 @@
+import threading
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+
+from brambling.models import BoughtItem, ItemOption
+from brambling.tests.factories import (
+    EventFactory,
+    ItemFactory,
+    ItemOptionFactory,
+    OrderFactory,
+)
+
+
+class ReserveTestCase(TestCase):
+    def setUp(self):
+        self.event = EventFactory()
+        item = ItemFactory(event=self.event)
+        self.item_option = ItemOptionFactory(price=100, item=item, total_number=2)
+        self.order = OrderFactory(event=self.event)
+
+    def test_add_to_cart__sold_out(self):
+        bought_item = self.order.add_to_cart(self.item_option)
+        self.assertEqual(bought_item.status, BoughtItem.RESERVED)
+        self.assertEqual(bought_item.item_option_name, self.item_option.name)
+        self.assertIsNotNone(self.order.add_to_cart(self.item_option))
+        self.assertIsNone(self.order.add_to_cart(self.item_option))
+        self.assertEqual(self.order.bought_items.count(), 2)
+
+    def test_reserve__released(self):
+        self.order.add_to_cart(self.item_option)
+        bought_item = self.order.add_to_cart(self.item_option)
+        bought_item.status = BoughtItem.REFUNDED
+        bought_item.save()
+        self.assertIsNotNone(self.order.add_to_cart(self.item_option))
+
+    def test_reserve__uses_saved_total_number(self):
+        self.order.add_to_cart(self.item_option)
+        ItemOption.objects.filter(pk=self.item_option.pk).update(total_number=1)
+        self.assertIsNone(self.order.add_to_cart(self.item_option))
+
+    def test_reserve__unlimited(self):
+        self.item_option.total_number = None
+        self.item_option.save()
+        # Creating the item, then starting the cart.
+        with self.assertNumQueries(2):
+            self.order.add_to_cart(self.item_option)
+        for i in range(3):
+            self.assertIsNotNone(self.order.add_to_cart(self.item_option))
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentReserveTestCase(TransactionTestCase):
+    """
+    Fires many simultaneous reservations at a limited item option, each
+    from its own thread and database connection.
+
+    """
+    capacity = 5
+    requests = 20
+
+    def test_concurrent_reservations(self):
+        event = EventFactory()
+        item = ItemFactory(event=event)
+        item_option = ItemOptionFactory(price=100, item=item, total_number=self.capacity)
+        orders = [OrderFactory(event=event) for i in range(self.requests)]
+        start = threading.Event()
+        results = []
+
+        def reserve(order):
+            try:
+                start.wait()
+                results.append(order.add_to_cart(item_option))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=reserve, args=(order,)) for order in orders]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), self.requests)
+        reserved = [bought_item for bought_item in results if bought_item is not None]
+        self.assertEqual(len(reserved), self.capacity)
+        self.assertEqual(
+            BoughtItem.objects.filter(item_option=item_option).count(),
+            self.capacity,
+        )
@@ -242,6 +242,32 @@ class EventRegistrationFormTestCase(TestCase):
         self.assertEqual(len(mail.outbox), 2)
 
 
+class InviteManagerTestCase(TestCase):
+    def test_get_or_create_invite__code_collision(self):
+        InviteFactory(code='taken', content_id=1)
+        codes = iter(['taken', 'fresh'])
+        with mock.patch('brambling.models.get_random_string', side_effect=lambda **kwargs: next(codes)):
+            invite, created = Invite.objects.get_or_create_invite(
+                email='test@test.com',
+                user=None,
+                kind=EventEditInvite.slug,
+                content_id=2,
+            )
+        self.assertTrue(created)
+        self.assertEqual(invite.code, 'fresh')
+
+    def test_get_or_create_invite__existing(self):
+        existing = InviteFactory(email='test@test.com', content_id=1)
+        invite, created = Invite.objects.get_or_create_invite(
+            email='test@test.com',
+            user=None,
+            kind=existing.kind,
+            content_id=existing.content_id,
+        )
+        self.assertFalse(created)
+        self.assertEqual(invite, existing)
+
+
 class InviteAcceptViewTestCase(TestCase):
     def setUp(self):
         self.factory = RequestFactory()
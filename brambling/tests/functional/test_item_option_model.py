@@ -0,0 +1,54 @@
+from django.test import TestCase
+
+from brambling.models import BoughtItem, ItemOption
+from brambling.tests.factories import (
+    EventFactory,
+    ItemFactory,
+    ItemOptionFactory,
+    OrderFactory,
+)
+
+
+class ItemOptionSalesTestCase(TestCase):
+    def setUp(self):
+        self.event = EventFactory()
+        item = ItemFactory(event=self.event)
+        self.item_option1 = ItemOptionFactory(price=100, item=item, total_number=10)
+        self.item_option2 = ItemOptionFactory(price=50, item=item, total_number=10)
+        order = OrderFactory(event=self.event)
+        for status in (BoughtItem.RESERVED, BoughtItem.UNPAID, BoughtItem.BOUGHT,
+                       BoughtItem.BOUGHT, BoughtItem.REFUNDED,
+                       BoughtItem.TRANSFERRED):
+            BoughtItem.objects.create(
+                item_option=self.item_option1,
+                order=order,
+                price=100,
+                status=status,
+                item_name='Item',
+                item_option_name='Option',
+            )
+
+        other_item = ItemFactory(event=EventFactory())
+        self.other_option = ItemOptionFactory(price=100, item=other_item)
+
+    def test_with_sales(self):
+        with self.assertNumQueries(1):
+            item_options = list(ItemOption.objects.with_sales(self.event))
+        self.assertEqual(item_options, [self.item_option1, self.item_option2])
+        item_option1, item_option2 = item_options
+        self.assertEqual(item_option1.reserved_count, 1)
+        self.assertEqual(item_option1.unpaid_count, 1)
+        self.assertEqual(item_option1.bought_count, 2)
+        self.assertEqual(item_option1.refunded_count, 1)
+        self.assertEqual(item_option1.transferred_count, 1)
+        self.assertEqual(item_option1.taken, 4)
+        self.assertEqual(item_option2.bought_count, 0)
+        self.assertEqual(item_option2.taken, 0)
+        with self.assertNumQueries(0):
+            self.assertEqual(item_option1.remaining, 6)
+
+    def test_remaining(self):
+        item_option = ItemOption.objects.get(pk=self.item_option1.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(item_option.remaining, 6)
+            self.assertEqual(item_option.remaining, 6)
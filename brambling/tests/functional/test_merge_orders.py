@@ -3,7 +3,7 @@ from django.contrib.messages.storage.fallback import FallbackStorage
 from django.http import Http404
 from django.test import TestCase, RequestFactory
 
-from brambling.models import Transaction, Order, Attendee
+from brambling.models import Transaction, Order, Attendee, SearchToken
 from brambling.tests.factories import (
     TransactionFactory,
     EventHousingFactory,
@@ -122,6 +122,16 @@ class MergeUnclaimableOrderTest(TestCase):
         self.att2 = Attendee.objects.get(pk=self.att2.pk)
         self.assertEqual(self.att2.order, self.order1)
 
+    def test_should_keep_attendees_searchable(self):
+        self.view.post(self.view.request)
+
+        self.assertEqual(
+            list(Attendee.objects.filter(
+                SearchToken.objects.attendee_filter(self.order1.event, 'attendee2@'),
+            )),
+            [self.att2],
+        )
+
     def test_should_delete_old_order(self):
         self.view.post(self.view.request)
 
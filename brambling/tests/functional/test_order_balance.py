@@ -0,0 +1,151 @@
+from decimal import Decimal
+from importlib import import_module
+
+from django.apps import apps
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+from mock import Mock
+
+from brambling.forms.organizer import ManualPaymentForm
+from brambling.models import Order, Transaction
+from brambling.tests.factories import (
+    DiscountFactory,
+    EventFactory,
+    ItemFactory,
+    ItemOptionFactory,
+    OrderFactory,
+    PersonFactory,
+    TransactionFactory,
+)
+from brambling.utils.invites import TransferInvite
+
+
+class OrderBalanceTestCase(TestCase):
+    def setUp(self):
+        self.event = EventFactory()
+        item = ItemFactory(event=self.event)
+        self.item_option = ItemOptionFactory(price=100, item=item)
+        self.discount = DiscountFactory(amount=20, event=self.event,
+                                        item_options=[self.item_option])
+        self.order = OrderFactory(event=self.event, person=PersonFactory())
+
+    def pay(self, amount=80):
+        self.order.add_to_cart(self.item_option)
+        self.order.add_discount(self.discount)
+        transaction = TransactionFactory(
+            event=self.event,
+            order=self.order,
+            amount=amount,
+            is_confirmed=True,
+        )
+        self.order.mark_cart_paid(transaction)
+        return transaction
+
+    def assertBalanceMatchesSummary(self, order):
+        order = Order.objects.get(pk=order.pk)
+        summary_data = order.get_summary_data()
+        self.assertEqual(order.net_cost, summary_data['net_cost'])
+        self.assertEqual(order.total_paid, summary_data['total_payments'])
+        self.assertEqual(order.total_refunded, summary_data['total_refunds'])
+        self.assertEqual(order.balance, summary_data['net_balance'])
+        self.assertEqual(order.transaction_count, len(summary_data['transactions']))
+        return order
+
+    def test_mark_cart_paid(self):
+        transaction = self.pay()
+        order = self.assertBalanceMatchesSummary(self.order)
+        self.assertEqual(order.net_cost, 80)
+        self.assertEqual(order.total_paid, 80)
+        self.assertEqual(order.balance, 0)
+        self.assertEqual(order.transaction_count, 1)
+        self.assertEqual(order.first_transaction_time, transaction.timestamp)
+        self.assertEqual(order.last_transaction_time, transaction.timestamp)
+
+    def test_cart_not_counted(self):
+        self.pay()
+        self.order.add_to_cart(self.item_option)
+        self.order.update_balance()
+        order = Order.objects.get(pk=self.order.pk)
+        self.assertEqual(order.net_cost, 80)
+        self.assertEqual(order.balance, 0)
+
+    def test_refund(self):
+        transaction = self.pay()
+        refund = transaction.refund(amount=Decimal('30'),
+                                    bought_items=transaction.bought_items.none())
+        order = self.assertBalanceMatchesSummary(self.order)
+        self.assertEqual(order.total_refunded, -30)
+        self.assertEqual(order.balance, 30)
+        self.assertEqual(order.transaction_count, 2)
+        self.assertEqual(order.last_transaction_time, refund.timestamp)
+
+        transaction.refund()
+        order = self.assertBalanceMatchesSummary(self.order)
+        self.assertEqual(order.net_cost, 0)
+        self.assertEqual(order.total_refunded, -80)
+        self.assertEqual(order.balance, 0)
+
+    def test_transfer(self):
+        transaction = self.pay()
+        person2 = PersonFactory()
+        invite = TransferInvite.get_or_create(
+            request=Mock(user=person2, session={}),
+            email=person2.email,
+            content=transaction.bought_items.get(),
+        )[0]
+        invite.accept()
+
+        order = self.assertBalanceMatchesSummary(self.order)
+        self.assertEqual(order.transaction_count, 2)
+        self.assertEqual(order.balance, 0)
+        order2 = self.assertBalanceMatchesSummary(Order.objects.get(person=person2))
+        self.assertEqual(order2.transaction_count, 1)
+        self.assertEqual(order2.net_cost, 0)
+
+    def test_manual_payment(self):
+        self.order.add_to_cart(self.item_option)
+        self.order.mark_cart_paid(TransactionFactory(event=self.event, order=self.order))
+        form = ManualPaymentForm(
+            order=self.order,
+            user=self.order.person,
+            data={'amount': '60', 'method': Transaction.CASH},
+        )
+        self.assertTrue(form.is_valid())
+        form.save()
+        order = self.assertBalanceMatchesSummary(self.order)
+        self.assertEqual(order.total_paid, 60)
+        self.assertEqual(order.balance, 40)
+
+    def test_command(self):
+        self.pay()
+        Order.objects.filter(pk=self.order.pk).update(balance=5, transaction_count=0)
+        stdout = StringIO()
+        call_command('check_order_balances', stdout=stdout)
+        self.assertIn('balance, transaction_count', stdout.getvalue())
+        self.assertEqual(Order.objects.get(pk=self.order.pk).balance, 5)
+
+        call_command('check_order_balances', repair=True, stdout=StringIO())
+        self.assertBalanceMatchesSummary(self.order)
+
+        stdout = StringIO()
+        call_command('check_order_balances', stdout=stdout)
+        self.assertEqual(stdout.getvalue(), '')
+
+    def test_backfill_migration(self):
+        transaction = self.pay()
+        transaction.refund(amount=Decimal('30'),
+                           bought_items=transaction.bought_items.none())
+        self.order.add_to_cart(self.item_option)
+        expected = Order.objects.get(pk=self.order.pk).get_balance_data()
+        Order.objects.filter(pk=self.order.pk).update(
+            net_cost=0, total_paid=0, total_refunded=0, balance=0,
+            first_transaction_time=None, last_transaction_time=None,
+            transaction_count=0,
+        )
+
+        migration = import_module('brambling.migrations.0068_backfill_order_balance')
+        migration.backfill_order_balances(apps, None)
+        order = Order.objects.get(pk=self.order.pk)
+        for field, value in expected.items():
+            self.assertEqual(getattr(order, field), value, field)
@@ -143,6 +143,7 @@ class OneTimePaymentFormTestCase(TestCase):
             amount=Decimal('42.15'),
             event=self.event,
             order=self.order,
+            idempotency_key=None,
         )
         txn = form.save()
         self.assertIsInstance(txn, Transaction)
@@ -151,6 +152,15 @@ class OneTimePaymentFormTestCase(TestCase):
         self.assertEqual(txn.application_fee, Decimal('1.05'))
         self.assertEqual(txn.processing_fee, Decimal('1.52'))
 
+    @patch('brambling.forms.orders.stripe_charge')
+    def test_idempotency_key(self, stripe_charge):
+        stripe_charge.return_value = STRIPE_CHARGE
+        form = OneTimePaymentForm(order=self.order, amount=Decimal('42.15'),
+                                  idempotency_key='checkout-1-abc',
+                                  data={'token': self.token}, user=self.person)
+        self.assertFalse(form.errors)
+        self.assertEqual(stripe_charge.call_args[1]['idempotency_key'], 'checkout-1-abc')
+
     def test_negative_charge_adds_errors(self):
         form = OneTimePaymentForm(order=self.order, amount=Decimal('-1.00'),
                                   data={'token': self.token}, user=self.person)
@@ -230,7 +240,8 @@ class SavedCardPaymentFormTestCase(TestCase):
             amount=Decimal('42.15'),
             event=self.event,
             order=self.order,
-            customer='FAKE_CUSTOMER_ID'
+            customer='FAKE_CUSTOMER_ID',
+            idempotency_key=None,
         )
         txn = form.save()
         self.assertIsInstance(txn, Transaction)
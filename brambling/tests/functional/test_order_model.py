@@ -1,10 +1,18 @@
+from decimal import Decimal
+import threading
+from unittest import skipIf
+
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.sessions.middleware import SessionMiddleware
-from django.test import TestCase, RequestFactory
-from mock import Mock
+from django.db import IntegrityError, connection
+from django.db.transaction import atomic
+from django.test import TestCase, TransactionTestCase, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from mock import Mock, patch
 
 from brambling.models import (
     BoughtItemDiscount,
+    Discount,
     Order,
     Transaction,
 )
@@ -75,6 +83,63 @@ class AddDiscountTestCase(TestCase):
         self.assertEqual(bought_item_discount.discount, self.discount)
 
 
+class BoughtItemDiscountManagerTestCase(TestCase):
+    def setUp(self):
+        self.event = EventFactory()
+        self.order = OrderFactory(event=self.event)
+        item = ItemFactory(event=self.event)
+        self.item_option1 = ItemOptionFactory(price=100, item=item)
+        self.item_option2 = ItemOptionFactory(price=40, item=item)
+        self.order.add_to_cart(self.item_option1)
+        self.order.add_to_cart(self.item_option2)
+        self.discount1 = DiscountFactory(amount=20, event=self.event,
+                                         item_options=[self.item_option1, self.item_option2])
+        self.discount2 = DiscountFactory(amount=Decimal('50'), event=self.event,
+                                         discount_type=Discount.PERCENT,
+                                         item_options=[self.item_option2])
+
+    def test_get_applicable(self):
+        with self.assertNumQueries(3):
+            applicable = BoughtItemDiscount.objects.get_applicable(
+                self.order, [self.discount1, self.discount2])
+        with self.assertNumQueries(0):
+            savings = sorted((d.bought_item.item_option_id, d.code, d.savings())
+                             for d in applicable)
+        self.assertEqual(savings, sorted([
+            (self.item_option1.pk, self.discount1.code, 20),
+            (self.item_option2.pk, self.discount1.code, 20),
+            (self.item_option2.pk, self.discount2.code, 20),
+        ]))
+        self.assertFalse(BoughtItemDiscount.objects.exists())
+
+    def test_apply(self):
+        applied = BoughtItemDiscount.objects.apply(self.order, [self.discount1, self.discount2])
+        self.assertEqual(len(applied), 3)
+        self.assertEqual(BoughtItemDiscount.objects.count(), 3)
+        self.assertEqual(BoughtItemDiscount.objects.apply(self.order, [self.discount1, self.discount2]), [])
+
+    def test_same_code(self):
+        """Items don't get a second discount with a code they already have."""
+        BoughtItemDiscount.objects.create(
+            bought_item=self.order.bought_items.get(item_option=self.item_option1),
+            name='Deleted discount',
+            code=self.discount1.code,
+            amount=10,
+        )
+        applied = BoughtItemDiscount.objects.apply(self.order, [self.discount1])
+        self.assertEqual([d.bought_item.item_option_id for d in applied],
+                         [self.item_option2.pk])
+
+    def test_paid_items(self):
+        self.order.mark_cart_paid(TransactionFactory(event=self.event, order=self.order))
+        self.assertEqual(BoughtItemDiscount.objects.apply(self.order, [self.discount1]), [])
+
+    def test_wrong_event(self):
+        discount = DiscountFactory(event=EventFactory())
+        with self.assertRaises(ValueError):
+            BoughtItemDiscount.objects.apply(self.order, [self.discount1, discount])
+
+
 class OrderModelTestCase(TestCase):
     def test_summary_data__base(self):
         """
@@ -652,3 +717,91 @@ class OrderManagerTestCase(TestCase):
         self.assertTrue(created)
         self.assertIsNone(Order.objects._get_session_code(request, event))
         self.assertEqual(fetched.person_id, person.id)
+
+
+class OrderCodeTestCase(TransactionTestCase):
+    def setUp(self):
+        self.event = EventFactory()
+        # Queries made by saving a new order with a known code.
+        with CaptureQueriesContext(connection) as queries:
+            Order.objects.create(event=self.event, code='known123')
+        self.create_queries = len(queries)
+
+    def test_create_with_code(self):
+        # No queries are spent checking the code first.
+        with self.assertNumQueries(self.create_queries):
+            order = Order.objects.create_with_code(event=self.event)
+        self.assertEqual(len(order.code), 8)
+
+    def test_create_with_code__collision(self):
+        OrderFactory(event=self.event, code='taken123')
+        codes = iter(['taken123', 'taken123', 'fresh123'])
+        with patch('brambling.models.get_random_string', side_effect=lambda *args: next(codes)):
+            with CaptureQueriesContext(connection) as queries:
+                order = Order.objects.create_with_code(event=self.event)
+        self.assertEqual(order.code, 'fresh123')
+        # Each collision costs one failed insert, and nothing is read.
+        order_queries = [query['sql'] for query in queries if '"brambling_order"' in query['sql']]
+        self.assertEqual(len(order_queries), 3)
+        self.assertTrue(all(sql.startswith('INSERT') for sql in order_queries))
+
+    def test_create_with_code__collision_in_transaction(self):
+        OrderFactory(event=self.event, code='taken123')
+        codes = iter(['taken123', 'fresh123'])
+        with patch('brambling.models.get_random_string', side_effect=lambda *args: next(codes)):
+            with atomic():
+                order = Order.objects.create_with_code(event=self.event)
+                # The transaction is still usable.
+                self.assertEqual(Order.objects.filter(event=self.event).count(), 3)
+        self.assertEqual(order.code, 'fresh123')
+
+    def test_create_with_code__gives_up(self):
+        OrderFactory(event=self.event, code='taken123')
+        with patch('brambling.models.get_random_string', return_value='taken123'):
+            with self.assertRaises(IntegrityError):
+                Order.objects.create_with_code(event=self.event)
+
+    def test_create_with_code__same_code_other_event(self):
+        OrderFactory(code='shared12')
+        with patch('brambling.models.get_random_string', return_value='shared12'):
+            order = Order.objects.create_with_code(event=self.event)
+        self.assertEqual(order.code, 'shared12')
+
+    @skipIf(connection.vendor == "sqlite", "SQLite doesn't support concurrent writes.")
+    def test_create_with_code__concurrent(self):
+        """
+        Concurrent creates that draw the same codes all succeed, each
+        with a different code.
+
+        """
+        sequences = {}
+        lock = threading.Lock()
+
+        def get_code(*args):
+            # Every thread draws the same sequence of codes.
+            with lock:
+                key = threading.current_thread().ident
+                sequences[key] = sequences.get(key, 0) + 1
+                return 'code{:04d}'.format(sequences[key])
+
+        orders = []
+        errors = []
+
+        def create():
+            try:
+                orders.append(Order.objects.create_with_code(event=self.event))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        with patch('brambling.models.get_random_string', side_effect=get_code):
+            threads = [threading.Thread(target=create) for i in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(errors, [])
+        codes = [order.code for order in orders]
+        self.assertEqual(len(codes), 5)
+        self.assertEqual(len(set(codes)), 5)
@@ -0,0 +1,240 @@
+from collections import OrderedDict
+from datetime import timedelta
+from decimal import Decimal
+import itertools
+import random
+
+from django.test import TestCase
+from django.utils import timezone
+
+from brambling.models import BoughtItem, BoughtItemDiscount, Order, Transaction
+from brambling.tests.factories import (
+    EventFactory,
+    ItemFactory,
+    ItemOptionFactory,
+    OrderFactory,
+    TransactionFactory,
+)
+
+
+def get_summary_data_in_python(order):
+    """
+    The original implementation of Order.get_summary_data, which walks
+    every item and discount in Python. Kept as a reference for the
+    grouped queries which compute the totals now.
+
+    """
+    transactions_qs = order.transactions.order_by('-timestamp')
+    bought_items_qs = order.bought_items.prefetch_related(
+        'discounts',
+        'transactions',
+    ).order_by('-added')
+    if order.cart_is_expired():
+        bought_items_qs = bought_items_qs.exclude(status=BoughtItem.RESERVED)
+
+    transactions = OrderedDict()
+    for txn in itertools.chain([None], transactions_qs):
+        transactions[txn] = {
+            'items': [],
+            'discounts': [],
+            'gross_cost': 0,
+            'total_savings': 0,
+            'net_cost': 0,
+        }
+
+    def add_item(txn, item):
+        txn_dict = transactions[txn]
+        txn_dict['items'].append(item)
+        multiplier = -1 if txn and txn.transaction_type == Transaction.REFUND else 1
+        if not txn or txn.transaction_type != Transaction.TRANSFER:
+            txn_dict['gross_cost'] += multiplier * item.price
+            for discount in item.discounts.all():
+                txn_dict['discounts'].append(discount)
+                txn_dict["total_savings"] -= multiplier * discount.savings()
+            txn_dict['net_cost'] = txn_dict['gross_cost'] + txn_dict['total_savings']
+
+    for item in bought_items_qs:
+        if not item.transactions.all():
+            add_item(None, item)
+        else:
+            for txn in item.transactions.all():
+                add_item(txn, item)
+
+    if not transactions[None]['items']:
+        del transactions[None]
+
+    gross_cost = 0
+    total_savings = 0
+    net_cost = 0
+    total_payments = 0
+    total_refunds = 0
+    unconfirmed_check_payments = False
+
+    for txn, txn_dict in transactions.iteritems():
+        gross_cost += txn_dict['gross_cost']
+        total_savings += txn_dict['total_savings']
+        net_cost += txn_dict['net_cost']
+        if txn:
+            if txn.transaction_type == Transaction.REFUND:
+                total_refunds += txn.amount
+            else:
+                total_payments += txn.amount
+                if txn.method == Transaction.CHECK and not txn.is_confirmed:
+                    unconfirmed_check_payments = True
+
+    return {
+        'transactions': transactions,
+        'gross_cost': gross_cost,
+        'total_savings': total_savings,
+        'total_refunds': total_refunds,
+        'total_payments': total_payments,
+        'net_cost': net_cost,
+        'net_balance': net_cost - (total_payments + total_refunds),
+        'unconfirmed_check_payments': unconfirmed_check_payments
+    }
+
+
+def get_net_cost_in_python(order):
+    """
+    The net cost of the order's items which aren't in the cart, summed
+    in Python with BoughtItemDiscount.savings().
+
+    """
+    net_cost = 0
+    for item in order.bought_items.exclude(status=BoughtItem.RESERVED):
+        for txn in item.transactions.all() or [None]:
+            if txn and txn.transaction_type == Transaction.TRANSFER:
+                continue
+            multiplier = -1 if txn and txn.transaction_type == Transaction.REFUND else 1
+            net_cost += multiplier * (item.price - sum(
+                discount.savings() for discount in item.discounts.all()
+            ))
+    return Decimal(net_cost).quantize(Decimal('0.01'))
+
+
+class SummaryDataEquivalenceTestCase(TestCase):
+    """
+    Checks get_summary_data against the reference implementation over
+    randomly generated orders.
+
+    """
+    ORDER_COUNT = 30
+
+    def setUp(self):
+        self.random = random.Random(1729)
+        self.event = EventFactory(cart_timeout=15)
+        item = ItemFactory(event=self.event)
+        self.item_options = [ItemOptionFactory(item=item) for i in range(3)]
+
+    def random_amount(self, high):
+        return Decimal(self.random.randint(0, high * 100)) / 100
+
+    def make_order(self):
+        rand = self.random
+        now = timezone.now()
+        order = OrderFactory(event=self.event)
+        if rand.random() < 0.3:
+            order.cart_start_time = now - timedelta(minutes=rand.choice((1, 60)))
+            order.save()
+
+        transactions = []
+        for i in range(rand.randint(0, 4)):
+            transaction_type = rand.choice((
+                Transaction.PURCHASE,
+                Transaction.REFUND,
+                Transaction.TRANSFER,
+            ))
+            amount = self.random_amount(200)
+            transactions.append(TransactionFactory(
+                event=self.event,
+                order=order,
+                transaction_type=transaction_type,
+                amount=-amount if transaction_type == Transaction.REFUND else amount,
+                method=rand.choice((Transaction.STRIPE, Transaction.CHECK)),
+                is_confirmed=rand.random() < 0.5,
+                timestamp=now - timedelta(minutes=i),
+            ))
+
+        for i in range(rand.randint(0, 6)):
+            bought_item = BoughtItem.objects.create(
+                order=order,
+                item_option=rand.choice(self.item_options),
+                item_name='Item',
+                item_option_name='Option',
+                price=self.random_amount(100),
+                status=rand.choice([status for status, _ in BoughtItem.STATUS_CHOICES]),
+            )
+            # Give every item its own time so the ordering is stable.
+            BoughtItem.objects.filter(pk=bought_item.pk).update(
+                added=now - timedelta(seconds=i),
+            )
+            for j in range(rand.choice((0, 0, 1, 2))):
+                discount_type = rand.choice((BoughtItemDiscount.FLAT,
+                                             BoughtItemDiscount.PERCENT))
+                BoughtItemDiscount.objects.create(
+                    bought_item=bought_item,
+                    name='Discount',
+                    code='code{}'.format(j),
+                    discount_type=discount_type,
+                    # Allow discounts bigger than the price to be capped.
+                    amount=self.random_amount(120),
+                )
+            for transaction in transactions:
+                if rand.random() < 0.4:
+                    transaction.bought_items.add(bought_item)
+        return Order.objects.get(pk=order.pk)
+
+    def assertSummaryDataEqual(self, data, expected):
+        self.assertEqual(list(data['transactions']), list(expected['transactions']))
+        for txn, txn_dict in expected['transactions'].items():
+            self.assertEqual(data['transactions'][txn], txn_dict)
+        self.assertEqual(data, expected)
+
+    def test_random_orders(self):
+        for i in range(self.ORDER_COUNT):
+            order = self.make_order()
+            self.assertSummaryDataEqual(
+                order.get_summary_data(),
+                get_summary_data_in_python(order),
+            )
+            # The balance fields use the same grouped queries.
+            self.assertEqual(order.get_balance_data()['net_cost'],
+                             get_net_cost_in_python(order))
+
+    def test_empty_order(self):
+        order = OrderFactory(event=self.event)
+        data = order.get_summary_data()
+        self.assertEqual(data, get_summary_data_in_python(order))
+        self.assertEqual(data['transactions'], OrderedDict())
+        self.assertEqual(data['net_balance'], 0)
+
+    def test_queries(self):
+        """
+        Summaries take five queries, however big the order is: the
+        transactions, the items with their transactions, the items'
+        discounts, and the grouped totals of prices and of discounts.
+
+        """
+        order = OrderFactory(event=self.event)
+        transaction = TransactionFactory(event=self.event, order=order)
+        for i in range(3):
+            bought_item = BoughtItem.objects.create(
+                order=order,
+                item_option=self.item_options[0],
+                item_name='Item',
+                item_option_name='Option',
+                price=10,
+                status=BoughtItem.BOUGHT,
+            )
+            BoughtItemDiscount.objects.create(
+                bought_item=bought_item,
+                name='Discount',
+                code='code',
+                discount_type=BoughtItemDiscount.FLAT,
+                amount=2,
+            )
+            transaction.bought_items.add(bought_item)
+            order = Order.objects.get(pk=order.pk)
+            with self.assertNumQueries(5):
+                data = order.get_summary_data()
+            self.assertEqual(data['net_cost'], 8 * (i + 1))
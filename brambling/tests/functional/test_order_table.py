@@ -1,11 +1,15 @@
 from datetime import timedelta
 
 from django.contrib.contenttypes.models import ContentType
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils.timezone import now
+from mock import patch
 
 from brambling.models import CustomFormEntry
-from brambling.utils.model_tables import OrderTable
+from brambling.utils.model_tables import (OrderTable, PAGE_FIELD,
+                                          TABLE_COLUMN_FIELD)
 from brambling.tests.factories import (
     TransactionFactory, EventFactory, OrderFactory, ItemFactory,
     ItemOptionFactory, AttendeeFactory, EnvironmentalFactorFactory,
@@ -116,3 +120,108 @@ class OrderTableTestCase(TestCase):
                     self.assertNotEqual(row[field].value, '')
                 if field.startswith('hosting_max'):
                     self.assertNotEqual(row[field].value, '')
+
+    def test_hosting_fields__queries(self):
+        """
+        Housing slots are loaded in a single query rather than once per
+        order and date.
+
+        """
+        self.order.providing_housing = True
+        self.order.save()
+        self.event.start_date -= timedelta(days=2)
+        self.event.save()
+        dates = self.event.get_housing_dates()
+        self.assertEqual(len(dates), 4)
+
+        table = OrderTable(self.event)
+        hosting_fields = [field for field in table.get_list_display()
+                          if field.startswith('hosting_')]
+        data = {TABLE_COLUMN_FIELD: ['code'] + hosting_fields}
+
+        def count_queries():
+            table = OrderTable(self.event, data=data)
+            table.get_list_display()
+            with CaptureQueriesContext(connection) as context:
+                rows = list(table)
+            return rows, len(context.captured_queries)
+
+        rows, single_order_queries = count_queries()
+        self.assertEqual(rows[0]['hosting_spaces_{}'.format(
+            self.event.end_date.strftime('%Y%m%d'))].value, 1)
+        self.assertEqual(rows[0]['hosting_max_{}'.format(
+            dates[0].strftime('%Y%m%d'))].value, '')
+
+        for i in range(3):
+            order = OrderFactory(event=self.event, providing_housing=True)
+            TransactionFactory(event=self.event, order=order)
+            housing = EventHousingFactory(event=self.event, order=order)
+            for date in dates:
+                HousingSlotFactory(eventhousing=housing, date=date,
+                                   spaces=i, spaces_max=i + 1)
+
+        rows, many_orders_queries = count_queries()
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(many_orders_queries, single_order_queries)
+
+    def test_pagination(self):
+        for i in range(2):
+            order = OrderFactory(event=self.event)
+            TransactionFactory(event=self.event, order=order)
+        # Orders without transactions have no completed date, and come
+        # last.
+        for i in range(2):
+            OrderFactory(event=self.event)
+
+        for ordering in ('-completed_date', 'code', '-code'):
+            data = {'o': ordering, TABLE_COLUMN_FIELD: ['pk', 'code']}
+            unpaginated = [[cell.value for cell in row]
+                           for row in OrderTable(self.event, data=data)]
+            self.assertEqual(len(unpaginated), 5)
+            rows = []
+            cursors = []
+            table = OrderTable(self.event, data=data, page_size=2)
+            while True:
+                rows.extend([cell.value for cell in row] for row in table)
+                if table.next_cursor is None:
+                    break
+                cursors.append(table.next_cursor)
+                table = OrderTable(self.event, page_size=2, data=dict(
+                    data, **{PAGE_FIELD: str(table.next_cursor)}
+                ))
+            self.assertEqual(len(cursors), 2)
+            if ordering == '-completed_date':
+                self.assertEqual(sorted(rows), sorted(unpaginated))
+                self.assertEqual(sorted(row[0] for row in rows[3:]),
+                                 sorted(row[0] for row in unpaginated[3:]))
+            else:
+                self.assertEqual(rows, unpaginated)
+
+    def test_pagination__null_ordering(self):
+        """Null values are paged through where the database sorts them."""
+        # The order from setUp has a transaction.
+        completed = {self.order.code}
+        order = OrderFactory(event=self.event)
+        TransactionFactory(event=self.event, order=order)
+        order.update_balance()
+        completed.add(order.code)
+        OrderFactory(event=self.event)
+
+        def get_codes(ordering, **kwargs):
+            data = {'o': ordering, TABLE_COLUMN_FIELD: ['code']}
+            codes = []
+            while True:
+                table = OrderTable(self.event, data=data, **kwargs)
+                codes.extend(row[0].value for row in table)
+                if table.next_cursor is None:
+                    return codes
+                data[PAGE_FIELD] = str(table.next_cursor)
+
+        for nulls_largest in (False, True):
+            with patch.object(connection.features, 'nulls_order_largest', nulls_largest):
+                for kwargs in ({'page_size': 1}, {'chunk_size': 1}):
+                    codes = get_codes('-completed_date', **kwargs)
+                    self.assertEqual(len(codes), 3)
+                    # Descending, nulls come first if they're largest.
+                    completed_codes = codes[1:] if nulls_largest else codes[:2]
+                    self.assertEqual(set(completed_codes), completed)
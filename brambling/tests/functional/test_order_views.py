@@ -2,12 +2,18 @@
 from datetime import timedelta
 
 from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages.middleware import MessageMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
 from django.core import mail
 from django.test import TestCase, RequestFactory
 from django.utils import timezone
+from mock import patch
 
-from brambling.models import OrganizationMember, BoughtItem
+from brambling.forms.orders import CheckPaymentForm
+from brambling.models import (Attendee, CheckoutAttempt, OrganizationMember,
+                              BoughtItem, Order)
 from brambling.tests.factories import (
+    AttendeeFactory,
     EventFactory,
     OrderFactory,
     ItemFactory,
@@ -18,7 +24,11 @@ from brambling.tests.factories import (
     TransactionFactory,
 )
 from brambling.views.orders import (
+    AttendeesView,
+    ChooseItemsView,
+    HostingView,
     SummaryView,
+    SurveyDataView,
     TransferView,
     RegistrationWorkflow,
 )
@@ -97,6 +107,205 @@ class SummaryViewTestCase(TestCase):
         self.assertEqual(len(mail.outbox), 2)
 
 
+KEY = 'a' * 32
+OTHER_KEY = 'b' * 32
+
+
+class SummaryViewCheckoutKeyTestCase(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        organization = OrganizationFactory(check_payment_allowed=True)
+        self.event = EventFactory(
+            collect_housing_data=False,
+            organization=organization,
+            check_postmark_cutoff=timezone.now().date(),
+        )
+        self.order = OrderFactory(event=self.event)
+        item_option = ItemOptionFactory(price=100, item=ItemFactory(event=self.event))
+        self.order.add_to_cart(item_option)
+
+    def post(self, data):
+        view = SummaryView()
+        view.request = self.factory.post('/', data)
+        view.request.user = AnonymousUser()
+        SessionMiddleware().process_request(view.request)
+        MessageMiddleware().process_request(view.request)
+        view.event = self.event
+        view.order = self.order
+        view.workflow = RegistrationWorkflow(order=self.order, event=self.event)
+        view.current_step = view.workflow.steps.get(view.current_step_slug)
+        return view.post(view.request)
+
+    def test_retry(self):
+        """A retried submission doesn't pay or send mail again."""
+        response = self.post({'check': 1, 'checkout_key': KEY})
+        self.assertEqual(response.status_code, 302)
+        sent = len(mail.outbox)
+        self.assertGreater(sent, 0)
+        attempt = CheckoutAttempt.objects.get()
+        self.assertEqual(attempt.status, CheckoutAttempt.SUCCEEDED)
+        self.assertEqual(attempt.transaction, self.order.transactions.get())
+
+        self.order.add_to_cart(ItemOptionFactory(price=10, item=ItemFactory(event=self.event)))
+        response = self.post({'check': 1, 'checkout_key': KEY})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(mail.outbox), sent)
+        self.assertEqual(self.order.transactions.count(), 1)
+
+        # A new key is a new payment.
+        self.post({'check': 1, 'checkout_key': OTHER_KEY})
+        self.assertEqual(self.order.transactions.count(), 2)
+
+    def test_in_progress(self):
+        CheckoutAttempt.objects.create(order=self.order, key=KEY)
+        response = self.post({'check': 1, 'checkout_key': KEY})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(self.order.transactions.exists())
+
+    def test_failed(self):
+        with patch.object(CheckPaymentForm, 'is_valid', return_value=False):
+            response = self.post({'check': 1, 'checkout_key': KEY})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(CheckoutAttempt.objects.get().status, CheckoutAttempt.FAILED)
+
+        # The failed attempt can be retried.
+        response = self.post({'check': 1, 'checkout_key': KEY})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(CheckoutAttempt.objects.get().status, CheckoutAttempt.SUCCEEDED)
+
+    def test_error(self):
+        """Unexpected errors release the attempt so it can be retried."""
+        with patch.object(SummaryView, 'complete_payment', side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                self.post({'check': 1, 'checkout_key': KEY})
+        self.assertEqual(CheckoutAttempt.objects.get().status, CheckoutAttempt.FAILED)
+        self.assertFalse(self.order.transactions.exists())
+
+    def test_invalid_key(self):
+        """Keys that weren't generated by us are ignored."""
+        for key in ('abc', 'a' * 40, 'a' * 31 + '-', 'a' * 32 + '\n'):
+            response = self.post({'check': 1, 'checkout_key': key})
+            self.assertEqual(response.status_code, 302)
+        self.assertFalse(CheckoutAttempt.objects.exists())
+        self.assertEqual(self.order.transactions.count(), 4)
+
+
+class CheckoutAttemptManagerTestCase(TestCase):
+    def test_claim(self):
+        order = OrderFactory()
+        attempt, claimed = CheckoutAttempt.objects.claim(order, 'abc')
+        self.assertTrue(claimed)
+        self.assertFalse(CheckoutAttempt.objects.claim(order, 'abc')[1])
+
+        # Pending attempts are claimable once they're stale.
+        CheckoutAttempt.objects.filter(pk=attempt.pk).update(
+            last_modified=timezone.now() - timedelta(minutes=5),
+        )
+        self.assertTrue(CheckoutAttempt.objects.claim(order, 'abc')[1])
+        self.assertFalse(CheckoutAttempt.objects.claim(order, 'abc')[1])
+
+        attempt.succeed(TransactionFactory(order=order, event=order.event))
+        CheckoutAttempt.objects.filter(pk=attempt.pk).update(
+            last_modified=timezone.now() - timedelta(minutes=5),
+        )
+        self.assertFalse(CheckoutAttempt.objects.claim(order, 'abc')[1])
+
+
+class OrderStepQueriesTestCase(TestCase):
+    """
+    The registration steps share one load of the order's items and
+    attendees, so their queries don't depend on the size of the order.
+
+    """
+    def setUp(self):
+        self.event = EventFactory(
+            collect_housing_data=True,
+            collect_survey_data=True,
+            is_published=True,
+        )
+        self.person = PersonFactory()
+        self.order = OrderFactory(
+            event=self.event,
+            person=self.person,
+            survey_completed=True,
+            providing_housing=False,
+        )
+        self.item_option = ItemOptionFactory(price=100, item=ItemFactory(event=self.event))
+        self.add_attendees(2)
+
+    def add_attendees(self, count):
+        for i in range(count):
+            self.order.add_to_cart(self.item_option)
+            AttendeeFactory(
+                order=self.order,
+                housing_status=Attendee.HOME,
+                basic_completed=True,
+                bought_items=self.order.bought_items.filter(attendee__isnull=True),
+            )
+
+    def get(self, view_class, render=True):
+        request = RequestFactory().get('/')
+        request.user = self.person
+        SessionMiddleware().process_request(request)
+        MessageMiddleware().process_request(request)
+        response = view_class.as_view()(
+            request,
+            event_slug=self.event.slug,
+            organization_slug=self.event.organization.slug,
+        )
+        self.assertEqual(response.status_code, 200)
+        if render:
+            response.render()
+        return response
+
+    def assertQueriesConstant(self, num, view_class, render=True):
+        # Warm up caches that aren't specific to the order.
+        self.get(view_class, render)
+        with self.assertNumQueries(num):
+            self.get(view_class, render)
+        self.add_attendees(3)
+        with self.assertNumQueries(num):
+            self.get(view_class, render)
+
+    def test_shop(self):
+        self.assertQueriesConstant(11, ChooseItemsView)
+
+    def test_attendees(self):
+        self.assertQueriesConstant(11, AttendeesView)
+
+    def test_survey(self):
+        self.assertQueriesConstant(6, SurveyDataView, render=False)
+
+    def test_hosting(self):
+        self.assertQueriesConstant(10, HostingView, render=False)
+
+    def test_summary(self):
+        self.assertQueriesConstant(17, SummaryView)
+
+    def test_expired_cart(self):
+        """Expired carts are hidden, but left for expire_carts to delete."""
+        Order.objects.filter(pk=self.order.pk).update(
+            cart_start_time=timezone.now() - timedelta(minutes=self.event.cart_timeout + 1),
+        )
+        response = self.get(ChooseItemsView)
+        order_context = response.context_data['workflow'].order_context
+        self.assertEqual(order_context.bought_items, [])
+        for attendee in order_context.attendees:
+            self.assertEqual(list(attendee.bought_items.all()), [])
+        self.assertEqual(self.order.bought_items.filter(status=BoughtItem.RESERVED).count(), 2)
+
+    def test_order_loaded_once(self):
+        request = RequestFactory().get('/')
+        request.user = self.person
+        SessionMiddleware().process_request(request)
+        order, created = Order.objects.for_request(self.event, request, create=False)
+        self.assertEqual(order, self.order)
+        with self.assertNumQueries(0):
+            self.assertIs(Order.objects.for_request(self.event, request)[0], order)
+            order.cart_is_expired()
+            order.person
+
+
 class TransferViewTestCase(TestCase):
     def setUp(self):
         self.factory = RequestFactory()
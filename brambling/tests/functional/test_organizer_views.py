@@ -1,4 +1,6 @@
 # encoding: utf-8
+from io import BytesIO
+
 import mock
 
 from django.contrib.auth.models import AnonymousUser
@@ -6,8 +8,9 @@ from django.contrib.messages.middleware import MessageMiddleware
 from django.contrib.sessions.middleware import SessionMiddleware
 from django.contrib import messages
 from django.core.urlresolvers import reverse
-from django.http import Http404
+from django.http import Http404, QueryDict
 from django.test import TestCase, RequestFactory
+from openpyxl import load_workbook
 
 from brambling.models import (
     Attendee,
@@ -238,6 +241,35 @@ class ModelTableViewTestCase(TestCase):
         content = list(response)
         self.assertIn('£200.00', content[1])
 
+    def test_unicode_xlsx(self):
+        event = EventFactory(collect_housing_data=True, currency='GBP')
+        order = OrderFactory(event=event)
+        transaction = TransactionFactory(event=event, order=order)
+        item = ItemFactory(event=event)
+        item_option = ItemOptionFactory(price=100, item=item)
+
+        order.add_to_cart(item_option)
+        order.add_to_cart(item_option)
+        order.mark_cart_paid(transaction)
+
+        AttendeeFactory(
+            order=order,
+            bought_items=order.bought_items.all(),
+            housing_status=Attendee.HOME,
+        )
+
+        view = AttendeeFilterView()
+        view.event = event
+        view.request = self.factory.get('/?format=xlsx')
+        view.request.user = AnonymousUser()
+
+        table = view.get_table(Attendee.objects.all())
+        response = view.render_to_response({'table': table})
+        self.assertEqual(response['content-disposition'], 'attachment; filename="export.xlsx"')
+        ws = load_workbook(BytesIO(b''.join(response))).active
+        values = [cell.value for row in ws.rows for cell in row]
+        self.assertIn(u'£200.00', values)
+
 
 class AttendeeFilterViewTest(TestCase):
     def setUp(self):
@@ -279,6 +311,46 @@ class AttendeeFilterViewTest(TestCase):
             [],
         )
 
+    def test_pagination(self):
+        order = OrderFactory(event=self.event)
+        transaction = TransactionFactory(event=self.event, order=order)
+        order.add_to_cart(self.item_option)
+        order.mark_cart_paid(transaction)
+        attendee = AttendeeFactory(order=order, bought_items=order.bought_items.all())
+
+        factory = RequestFactory()
+        self.view.table_page_size = 1
+        self.view.request = factory.get('/attendees/?o=last_name&column-columns=pk')
+        self.view.request.user = AnonymousUser()
+        self.view.object_list = self.view.get_queryset()
+        context = self.view.get_context_data()
+        self.assertNotIn('first_page_url', context)
+        self.assertEqual(
+            [row['pk'].value for row in context['table']],
+            [self.attendee.pk],
+        )
+        path, querystring = context['next_page_url'].split('?')
+        self.assertEqual(path, '/attendees/')
+        self.assertEqual(QueryDict(querystring).dict(), {
+            'o': 'last_name',
+            'column-columns': 'pk',
+            'after': str(self.attendee.pk),
+        })
+
+        self.view.request = factory.get(context['next_page_url'])
+        self.view.request.user = AnonymousUser()
+        context = self.view.get_context_data()
+        path, querystring = context['first_page_url'].split('?')
+        self.assertEqual(QueryDict(querystring).dict(), {
+            'o': 'last_name',
+            'column-columns': 'pk',
+        })
+        self.assertNotIn('next_page_url', context)
+        self.assertEqual(
+            [row['pk'].value for row in context['table']],
+            [attendee.pk],
+        )
+
 
 class OrganizationRemoveMemberViewTestCase(TestCase):
     def setUp(self):
@@ -0,0 +1,141 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages.middleware import MessageMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase, RequestFactory, override_settings
+from django.utils import timezone
+from django.utils.six import StringIO
+from mock import patch
+
+from brambling.mail import OrderReceiptMailer, OutboxSite, queue_mailer
+from brambling.models import OutboxMessage, Transaction
+from brambling.tests.factories import (
+    EventFactory,
+    ItemFactory,
+    ItemOptionFactory,
+    OrderFactory,
+    OrganizationFactory,
+    TransactionFactory,
+)
+from brambling.views.orders import RegistrationWorkflow, SummaryView
+
+
+class OutboxTestCase(TestCase):
+    def setUp(self):
+        self.event = EventFactory(collect_housing_data=False)
+        self.order = OrderFactory(event=self.event, email='dancer@example.com')
+        self.transaction = TransactionFactory(event=self.event, order=self.order)
+        self.site = OutboxSite('example.com', 'Example')
+
+    def test_queue_mailer(self):
+        message = queue_mailer(OrderReceiptMailer, self.site, secure=True,
+                               transaction=self.transaction)
+        self.assertEqual(message.mailer, 'OrderReceiptMailer')
+        self.assertEqual(message.status, OutboxMessage.PENDING)
+        self.assertEqual(message.get_mailer_kwargs(), {'transaction': self.transaction})
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_claim(self):
+        message = queue_mailer(OrderReceiptMailer, self.site, transaction=self.transaction)
+        later = queue_mailer(OrderReceiptMailer, self.site, transaction=self.transaction)
+        OutboxMessage.objects.filter(pk=later.pk).update(
+            next_attempt_at=timezone.now() + timedelta(minutes=1),
+        )
+        claimed = OutboxMessage.objects.claim()
+        self.assertEqual(claimed.pk, message.pk)
+        self.assertEqual(claimed.status, OutboxMessage.SENDING)
+        self.assertIsNone(OutboxMessage.objects.claim())
+
+    def test_command(self):
+        message = queue_mailer(OrderReceiptMailer, self.site, transaction=self.transaction)
+        call_command('send_outbox')
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxMessage.SENT)
+        self.assertEqual(message.attempts, 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['dancer@example.com'])
+        self.assertIn('http://example.com', mail.outbox[0].body)
+
+    def test_command__retry(self):
+        message = queue_mailer(OrderReceiptMailer, self.site, transaction=self.transaction)
+        stderr = StringIO()
+        with patch.object(OrderReceiptMailer, 'send', side_effect=Exception('Boom')):
+            call_command('send_outbox', '--retry-delay=60', stderr=stderr)
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxMessage.PENDING)
+        self.assertEqual(message.attempts, 1)
+        self.assertIn('Boom', message.error)
+        self.assertIn('Outbox message {}'.format(message.pk), stderr.getvalue())
+        self.assertGreater(message.next_attempt_at, timezone.now() + timedelta(seconds=50))
+
+        # Not retried before its backoff is up.
+        call_command('send_outbox')
+        self.assertEqual(len(mail.outbox), 0)
+
+        OutboxMessage.objects.filter(pk=message.pk).update(next_attempt_at=timezone.now())
+        call_command('send_outbox')
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxMessage.SENT)
+        self.assertEqual(message.attempts, 2)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_command__max_attempts(self):
+        message = queue_mailer(OrderReceiptMailer, self.site, transaction=self.transaction)
+        OutboxMessage.objects.filter(pk=message.pk).update(attempts=2)
+        with patch.object(OrderReceiptMailer, 'send', side_effect=Exception('Boom')):
+            call_command('send_outbox', '--max-attempts=3', stderr=StringIO())
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxMessage.FAILED)
+        self.assertEqual(message.attempts, 3)
+
+    def test_command__stale(self):
+        message = queue_mailer(OrderReceiptMailer, self.site, transaction=self.transaction)
+        OutboxMessage.objects.filter(pk=message.pk).update(
+            status=OutboxMessage.SENDING,
+            last_modified=timezone.now() - timedelta(hours=1),
+        )
+        call_command('send_outbox')
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxMessage.SENT)
+
+
+@override_settings(BACKGROUND_MAIL=True)
+class SummaryViewOutboxTestCase(TestCase):
+    def setUp(self):
+        organization = OrganizationFactory(check_payment_allowed=True)
+        self.event = EventFactory(
+            collect_housing_data=False,
+            organization=organization,
+            check_postmark_cutoff=timezone.now().date(),
+        )
+        self.order = OrderFactory(event=self.event, email='dancer@example.com')
+        item_option = ItemOptionFactory(price=100, item=ItemFactory(event=self.event))
+        self.order.add_to_cart(item_option)
+
+    def test_payment__queues_email(self):
+        view = SummaryView()
+        view.request = RequestFactory().post('/', {'check': 1})
+        view.request.user = AnonymousUser()
+        SessionMiddleware().process_request(view.request)
+        MessageMiddleware().process_request(view.request)
+        view.event = self.event
+        view.order = self.order
+        view.workflow = RegistrationWorkflow(order=self.order, event=self.event)
+        view.current_step = view.workflow.steps.get(view.current_step_slug)
+        response = view.post(view.request)
+        self.assertEqual(response.status_code, 302)
+
+        transaction = self.order.transactions.get()
+        self.assertEqual(transaction.transaction_type, Transaction.PURCHASE)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(
+            sorted(OutboxMessage.objects.values_list('mailer', flat=True)),
+            ['OrderAlertMailer', 'OrderReceiptMailer'],
+        )
+
+        call_command('send_outbox')
+        self.assertFalse(OutboxMessage.objects.exclude(status=OutboxMessage.SENT).exists())
+        self.assertEqual(mail.outbox[0].to, ['dancer@example.com'])
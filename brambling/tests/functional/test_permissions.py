@@ -1,14 +1,27 @@
+import os
+import tempfile
+
 from django.contrib.auth.models import AnonymousUser
-from django.test import TestCase
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db.transaction import atomic
+from django.test import TestCase, TransactionTestCase, RequestFactory, override_settings
 
 from brambling.models import (
     EventMember,
     OrganizationMember,
+    Person,
 )
 from brambling.tests.factories import (
     EventFactory,
+    InviteFactory,
+    OrganizationFactory,
     PersonFactory,
 )
+from brambling.utils.invites import EventEditInvite
+from brambling.utils.permissions import prime_permissions, resolve_permissions
+from brambling.views.invites import InviteAcceptView
 
 
 class EventPermissionsTestCase(TestCase):
@@ -295,3 +308,174 @@ class OrganizationPermissionsTestCase(TestCase):
             self.assertTrue(person.has_perm('view', event.organization))
             self.assertTrue(person.has_perm('edit', event.organization))
             self.assertTrue(person.has_perm('change_permissions', event.organization))
+
+
+class ResolvePermissionsTestCase(TestCase):
+    def setUp(self):
+        self.person = PersonFactory()
+        self.organizations = [OrganizationFactory() for i in range(4)]
+        self.events = []
+        for organization in self.organizations:
+            self.events += [EventFactory(organization=organization) for i in range(3)]
+        org_roles = (OrganizationMember.OWNER, OrganizationMember.EDIT, OrganizationMember.VIEW)
+        for organization, role in zip(self.organizations, org_roles):
+            OrganizationMember.objects.create(person=self.person, organization=organization, role=role)
+        # One event per organization is edited by the person, and one
+        # viewed.
+        for i, event in enumerate(self.events):
+            if i % 3 == 0:
+                EventMember.objects.create(person=self.person, event=event, role=EventMember.EDIT)
+            elif i % 3 == 1:
+                EventMember.objects.create(person=self.person, event=event, role=EventMember.VIEW)
+
+    def test_resolve_permissions(self):
+        objs = self.events + self.organizations
+        with self.assertNumQueries(2):
+            permissions = resolve_permissions(self.person, objs)
+        for obj in objs:
+            self.assertEqual(permissions[obj], set(obj.get_permissions(self.person)))
+
+    def test_resolve_permissions__superuser(self):
+        person = PersonFactory(is_superuser=True)
+        with self.assertNumQueries(0):
+            permissions = resolve_permissions(person, self.events)
+        self.assertEqual(permissions[self.events[-1]], set(('view', 'edit', 'change_permissions')))
+
+    def test_prime_permissions(self):
+        with self.assertNumQueries(2):
+            prime_permissions(self.person, self.events + self.organizations)
+        with self.assertNumQueries(0):
+            # Every event in an organization the person belongs to.
+            for event in self.events[:9]:
+                self.assertTrue(self.person.has_perm('view', event))
+            self.assertFalse(self.person.has_perm('view', self.events[-1]))
+            self.assertTrue(self.person.has_perm('change_permissions', self.organizations[0]))
+            # Already loaded.
+            prime_permissions(self.person, self.events)
+
+    def test_prime_permissions__anonymous(self):
+        user = AnonymousUser()
+        with self.assertNumQueries(0):
+            prime_permissions(user, self.events)
+            self.assertFalse(user.has_perm('view', self.events[0]))
+
+
+# The shared cache needs a backend which processes share.
+SHARED_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'brambling-permission-tests'),
+    },
+}
+
+
+@override_settings(PERMISSION_CACHE_TIMEOUT=60, CACHES=SHARED_CACHES)
+class SharedPermissionCacheTestCase(TransactionTestCase):
+    # Memberships are only invalidated once their changes commit, so
+    # these tests need real transactions.
+    def setUp(self):
+        cache.clear()
+        self.person = PersonFactory()
+        self.event = EventFactory()
+
+    def tearDown(self):
+        cache.clear()
+
+    def get_permissions(self, obj):
+        # A fresh instance, as on a new request.
+        person = Person.objects.get(pk=self.person.pk)
+        return person.get_all_permissions(obj)
+
+    def test_shared_between_requests(self):
+        member = OrganizationMember.objects.create(
+            person=self.person,
+            organization=self.event.organization,
+            role=OrganizationMember.VIEW,
+        )
+        self.assertEqual(self.get_permissions(self.event), set(('view',)))
+        with self.assertNumQueries(1):
+            # Only the person is fetched.
+            self.assertEqual(self.get_permissions(self.event), set(('view',)))
+
+        member.role = OrganizationMember.EDIT
+        member.save()
+        self.assertEqual(self.get_permissions(self.event), set(('view', 'edit', 'change_permissions')))
+        self.assertEqual(self.get_permissions(self.event.organization), set(('view', 'edit')))
+
+        member.delete()
+        self.assertEqual(self.get_permissions(self.event), set())
+        self.assertEqual(self.get_permissions(self.event.organization), set())
+
+    def test_event_member(self):
+        self.assertEqual(self.get_permissions(self.event), set())
+        member = EventMember.objects.create(person=self.person, event=self.event, role=EventMember.VIEW)
+        self.assertEqual(self.get_permissions(self.event), set(('view',)))
+        member.delete()
+        self.assertEqual(self.get_permissions(self.event), set())
+
+    def test_prime_permissions(self):
+        EventMember.objects.create(person=self.person, event=self.event, role=EventMember.EDIT)
+        prime_permissions(self.person, [self.event])
+        person = Person.objects.get(pk=self.person.pk)
+        with self.assertNumQueries(0):
+            prime_permissions(person, [self.event])
+            self.assertTrue(person.has_perm('edit', self.event))
+
+    def test_superuser(self):
+        self.person.is_superuser = True
+        self.person.save()
+        self.assertEqual(self.get_permissions(self.event), set(('view', 'edit', 'change_permissions')))
+        self.person.is_superuser = False
+        self.person.save()
+        self.assertEqual(self.get_permissions(self.event), set())
+
+    def test_unrelated_change(self):
+        self.get_permissions(self.event)
+        # Other people's memberships and other fields don't invalidate
+        # the person's permissions.
+        OrganizationMember.objects.create(
+            person=PersonFactory(),
+            organization=self.event.organization,
+            role=OrganizationMember.OWNER,
+        )
+        self.person.first_name = 'Changed'
+        self.person.save()
+        with self.assertNumQueries(1):
+            self.get_permissions(self.event)
+
+    def test_invite_accepted(self):
+        invite = InviteFactory(
+            email=self.person.email,
+            kind=EventEditInvite.slug,
+            content_id=self.event.pk,
+        )
+        request = RequestFactory().get('/')
+        request.user = self.person
+        SessionMiddleware().process_request(request)
+        self.assertFalse(self.person.has_perm('edit', self.event))
+        InviteAcceptView.as_view()(request, code=invite.code)
+        self.assertTrue(self.person.has_perm('edit', self.event))
+        self.assertEqual(self.get_permissions(self.event), set(('view', 'edit')))
+
+    def test_invalidated_on_commit(self):
+        self.get_permissions(self.event)
+        with atomic():
+            EventMember.objects.create(person=self.person, event=self.event, role=EventMember.VIEW)
+            # Until the change commits, other requests may still see
+            # the old memberships, so the cache isn't invalidated yet.
+            with self.assertNumQueries(1):
+                self.assertEqual(self.get_permissions(self.event), set())
+        self.assertEqual(self.get_permissions(self.event), set(('view',)))
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }})
+    def test_local_memory_cache(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.get_permissions(self.event)
+
+    @override_settings(PERMISSION_CACHE_TIMEOUT=0)
+    def test_disabled(self):
+        self.get_permissions(self.event)
+        with self.assertNumQueries(3):
+            self.get_permissions(self.event)
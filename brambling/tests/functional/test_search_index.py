@@ -0,0 +1,131 @@
+from importlib import import_module
+
+from django.apps import apps
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+
+from brambling.models import Attendee, Order, SearchToken, get_search_tokens
+from brambling.tests.factories import (
+    AttendeeFactory,
+    EventFactory,
+    OrderFactory,
+    PersonFactory,
+)
+from brambling.utils.model_tables import (AttendeeTable, OrderTable,
+                                          SEARCH_FIELD, TABLE_COLUMN_FIELD)
+
+
+class SearchIndexTestCase(TestCase):
+    def setUp(self):
+        self.event = EventFactory()
+        self.person = PersonFactory(first_name='Leia', last_name='Organa',
+                                    email='leia@alderaan.gov')
+        self.order = OrderFactory(event=self.event, person=self.person, code='ABCD1234')
+        self.attendee = AttendeeFactory(order=self.order, first_name='Han',
+                                        last_name='Solo', email='han@falcon.com')
+        self.order2 = OrderFactory(event=self.event, email='chewie@falcon.com')
+        self.attendee2 = AttendeeFactory(order=self.order2, first_name='Chewbacca',
+                                         last_name='Wookiee')
+        # Orders from other events don't match.
+        other_order = OrderFactory(event=EventFactory(), code='ABCD9999')
+        AttendeeFactory(order=other_order, first_name='Han', last_name='Solo')
+
+    def search_attendees(self, term):
+        return set(Attendee.objects.filter(
+            SearchToken.objects.attendee_filter(self.event, term),
+        ))
+
+    def search_orders(self, term):
+        return set(Order.objects.filter(
+            SearchToken.objects.order_filter(self.event, term),
+        ))
+
+    def get_tokens(self):
+        return sorted(SearchToken.objects.filter(event=self.event).values_list(
+            'order', 'attendee', 'token',
+        ))
+
+    def test_get_search_tokens(self):
+        self.assertEqual(
+            get_search_tokens('Han  Solo', 'HAN@Falcon.com', '', None),
+            {'han', 'solo', 'han@falcon.com', 'falcon.com'},
+        )
+
+    def test_attendee_filter(self):
+        self.assertEqual(self.search_attendees('so'), {self.attendee})
+        self.assertEqual(self.search_attendees('FALCON'), {self.attendee, self.attendee2})
+        # Through the order.
+        self.assertEqual(self.search_attendees('abcd'), {self.attendee})
+        self.assertEqual(self.search_attendees('chewie@'), {self.attendee2})
+        self.assertEqual(self.search_attendees('organa'), {self.attendee})
+        # Only prefixes of words match.
+        self.assertEqual(self.search_attendees('olo'), set())
+
+    def test_order_filter(self):
+        self.assertEqual(self.search_orders('wook'), {self.order2})
+        self.assertEqual(self.search_orders('abcd1234'), {self.order})
+        self.assertEqual(self.search_orders('leia'), {self.order})
+        self.assertEqual(self.search_orders('falcon.com'), {self.order, self.order2})
+
+    def test_updated_on_save(self):
+        self.attendee.last_name = 'Skywalker'
+        self.attendee.save()
+        self.assertEqual(self.search_attendees('solo'), set())
+        self.assertEqual(self.search_attendees('sky'), {self.attendee})
+
+        self.person.last_name = 'Solo'
+        self.person.save()
+        self.assertEqual(self.search_orders('organa'), set())
+        self.assertEqual(self.search_orders('solo'), {self.order})
+
+        self.order2.code = 'WXYZ0000'
+        self.order2.save()
+        self.assertEqual(self.search_orders('wxyz'), {self.order2})
+
+        self.attendee2.delete()
+        self.assertEqual(self.search_orders('chewbacca'), set())
+
+    def test_unchanged_save(self):
+        attendee = Attendee.objects.get(pk=self.attendee.pk)
+        # Loading the attendee's saved summary values, then saving.
+        with self.assertNumQueries(2):
+            attendee.save()
+
+    def test_indexes(self):
+        """Tokens are indexed within their event, not on their own."""
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, SearchToken._meta.db_table)
+        indexes = [constraint['columns'] for constraint in constraints.values()
+                   if constraint['index']]
+        self.assertIn(['event_id', 'token'], indexes)
+        self.assertNotIn(['token'], indexes)
+
+    def test_rebuild(self):
+        tokens = self.get_tokens()
+        SearchToken.objects.filter(event=self.event).delete()
+        call_command('rebuild_search_index', str(self.event.pk))
+        self.assertEqual(self.get_tokens(), tokens)
+
+    def test_build_migration(self):
+        tokens = self.get_tokens()
+        SearchToken.objects.all().delete()
+        migration = import_module('brambling.migrations.0070_build_search_index')
+        migration.build_search_index(apps, None)
+        self.assertEqual(self.get_tokens(), tokens)
+
+    def test_attendee_table(self):
+        table = AttendeeTable(self.event, queryset=Attendee.objects.all(),
+                              data={SEARCH_FIELD: 'han sol', TABLE_COLUMN_FIELD: ['pk']})
+        self.assertEqual([row['pk'].value for row in table], [self.attendee.pk])
+
+    def test_order_table(self):
+        table = OrderTable(self.event, data={
+            SEARCH_FIELD: 'falcon',
+            TABLE_COLUMN_FIELD: ['code'],
+        })
+        self.assertEqual(
+            sorted(row['code'].value for row in table),
+            sorted([self.order.code, self.order2.code]),
+        )
@@ -0,0 +1,233 @@
+from datetime import timedelta
+from importlib import import_module
+import threading
+from unittest import skipIf
+
+from django.apps import apps
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core import signing
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, RequestFactory
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from brambling.models import Event, WaitingRoom, WaitingRoomTicket
+from brambling.tests.factories import EventFactory
+from brambling.utils.waiting_room import (
+    SALT,
+    SESSION_KEY,
+    get_admit_at,
+    get_session_ticket,
+    get_ticket_token,
+    issue_session_ticket,
+    session_is_admitted,
+)
+from brambling.views.orders import ChooseItemsView, WaitingRoomView
+
+
+class WaitingRoomTestCase(TestCase):
+    def setUp(self):
+        self.event = EventFactory(is_published=True,
+                                  waiting_room_enabled=True,
+                                  waiting_room_admit_rate=2)
+        self.factory = RequestFactory()
+
+    def get_request(self):
+        request = self.factory.get('/')
+        request.user = AnonymousUser()
+        SessionMiddleware().process_request(request)
+        return request
+
+    def get_view_kwargs(self):
+        return {
+            'event_slug': self.event.slug,
+            'organization_slug': self.event.organization.slug,
+        }
+
+    def test_issue__spacing(self):
+        before = timezone.now()
+        tickets = [WaitingRoomTicket.objects.issue(self.event) for i in range(5)]
+        self.assertGreaterEqual(tickets[0].admit_at, before)
+        self.assertLessEqual(tickets[0].admit_at, timezone.now())
+        for previous, ticket in zip(tickets, tickets[1:]):
+            self.assertEqual(ticket.admit_at - previous.admit_at,
+                             timedelta(seconds=0.5))
+
+    def test_issue__empty_room(self):
+        WaitingRoomTicket.objects.create(event=self.event,
+                                         admit_at=timezone.now() - timedelta(hours=1))
+        ticket = WaitingRoomTicket.objects.issue(self.event)
+        self.assertGreater(ticket.admit_at, timezone.now() - timedelta(minutes=1))
+
+    def test_issue__other_event(self):
+        WaitingRoomTicket.objects.create(event=EventFactory(),
+                                         admit_at=timezone.now() + timedelta(hours=1))
+        ticket = WaitingRoomTicket.objects.issue(self.event)
+        self.assertLessEqual(ticket.admit_at, timezone.now())
+
+    def test_prune(self):
+        old = WaitingRoomTicket.objects.create(event=self.event,
+                                               admit_at=timezone.now() - timedelta(hours=2))
+        waiting = WaitingRoomTicket.objects.issue(self.event)
+        self.assertEqual(WaitingRoomTicket.objects.prune(), 1)
+        self.assertFalse(WaitingRoomTicket.objects.filter(pk=old.pk).exists())
+        self.assertTrue(WaitingRoomTicket.objects.filter(pk=waiting.pk).exists())
+
+    def test_prune__command(self):
+        WaitingRoomTicket.objects.create(event=self.event,
+                                         admit_at=timezone.now() - timedelta(hours=2))
+        call_command('expire_carts')
+        self.assertFalse(WaitingRoomTicket.objects.exists())
+
+    def test_get_position(self):
+        tickets = [WaitingRoomTicket.objects.issue(self.event) for i in range(4)]
+        # The first ticket is admitted right away, so it isn't waiting.
+        self.assertEqual(
+            [WaitingRoomTicket.objects.get_position(self.event, t.admit_at)
+             for t in tickets],
+            [0, 0, 1, 2],
+        )
+
+    def test_token(self):
+        ticket = WaitingRoomTicket.objects.issue(self.event)
+        data = signing.loads(get_ticket_token(ticket), salt=SALT)
+        self.assertEqual(data['ticket'], ticket.pk)
+        self.assertEqual(get_admit_at(data), ticket.admit_at)
+
+    def test_session_ticket__tampered(self):
+        request = self.get_request()
+        request.session[SESSION_KEY] = {str(self.event.pk): 'bogus'}
+        self.assertIsNone(get_session_ticket(request, self.event))
+        self.assertFalse(session_is_admitted(request, self.event))
+
+    def test_session_ticket__other_event(self):
+        request = self.get_request()
+        other = EventFactory(waiting_room_enabled=True)
+        ticket = WaitingRoomTicket.objects.issue(other)
+        request.session[SESSION_KEY] = {str(self.event.pk): get_ticket_token(ticket)}
+        self.assertIsNone(get_session_ticket(request, self.event))
+
+    def test_issue_session_ticket(self):
+        request = self.get_request()
+        data = issue_session_ticket(request, self.event)
+        self.assertTrue(session_is_admitted(request, self.event))
+        # The same ticket is reused.
+        self.assertEqual(issue_session_ticket(request, self.event), data)
+        self.assertEqual(WaitingRoomTicket.objects.count(), 1)
+
+        # Later visitors wait their turn.
+        request = self.get_request()
+        issue_session_ticket(request, self.event)
+        self.assertFalse(session_is_admitted(request, self.event))
+
+    def test_session_is_admitted__disabled(self):
+        self.event.waiting_room_enabled = False
+        self.assertTrue(session_is_admitted(self.get_request(), self.event))
+
+    def test_order_view__redirects(self):
+        request = self.get_request()
+        response = ChooseItemsView.as_view()(request, **self.get_view_kwargs())
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['location'], reverse(
+            'brambling_event_waiting_room', kwargs=self.get_view_kwargs()))
+
+    def test_view__waiting(self):
+        WaitingRoomTicket.objects.issue(self.event)
+        WaitingRoomTicket.objects.issue(self.event)
+        request = self.get_request()
+        response = WaitingRoomView.as_view()(request, **self.get_view_kwargs())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context_data['position'], 1)
+        self.assertEqual(response.context_data['wait_seconds'], 1)
+        self.assertEqual(WaitingRoomTicket.objects.count(), 3)
+        self.assertFalse(session_is_admitted(request, self.event))
+
+    def test_view__admitted(self):
+        request = self.get_request()
+        response = WaitingRoomView.as_view()(request, **self.get_view_kwargs())
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['location'], reverse(
+            'brambling_event_shop', kwargs=self.get_view_kwargs()))
+        self.assertTrue(session_is_admitted(request, self.event))
+
+    def test_view__disabled(self):
+        self.event.waiting_room_enabled = False
+        self.event.save()
+        response = WaitingRoomView.as_view()(self.get_request(), **self.get_view_kwargs())
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(WaitingRoomTicket.objects.exists())
+
+    def test_issue__waiting_room(self):
+        """Places are kept on the event's waiting room rather than the event."""
+        ticket = WaitingRoomTicket.objects.issue(self.event)
+        room = WaitingRoom.objects.get(event=self.event)
+        self.assertEqual(room.next_admit_at, ticket.admit_at + timedelta(seconds=0.5))
+
+    def test_simulate_command(self):
+        ticket = WaitingRoomTicket.objects.issue(self.event)
+        stdout = StringIO()
+        call_command('simulate_waiting_room', str(self.event.pk),
+                     visitors=7, admit_rate=3, concurrency=1, stdout=stdout)
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(lines[0][:17], 'Issued 7 tickets ')
+        self.assertEqual([line.split() for line in lines[2:]],
+                         [['0', '3'], ['1', '3'], ['2', '1']])
+        # The simulation queued for a copy of the event, which is gone.
+        self.assertEqual(list(WaitingRoomTicket.objects.all()), [ticket])
+        self.assertEqual(list(Event.objects.all()), [self.event])
+        self.assertEqual(WaitingRoom.objects.get().next_admit_at,
+                         ticket.admit_at + timedelta(seconds=0.5))
+
+    def test_migration(self):
+        admit_at = timezone.now()
+        WaitingRoomTicket.objects.create(event=self.event, admit_at=admit_at)
+        module = import_module('brambling.migrations.0071_waitingroom')
+        module.create_waiting_rooms(apps, None)
+        self.assertEqual(WaitingRoom.objects.get(event=self.event).next_admit_at,
+                         admit_at + timedelta(seconds=0.5))
+
+
+class WaitingRoomConcurrencyTestCase(TransactionTestCase):
+    @skipIf(connection.vendor == "sqlite", "SQLite doesn't support concurrent writes.")
+    def test_issue__concurrent(self):
+        """
+        Visitors arriving at the same time are still spaced out at the
+        admit rate.
+
+        """
+        event = EventFactory(waiting_room_enabled=True, waiting_room_admit_rate=2)
+        errors = []
+
+        def issue():
+            try:
+                WaitingRoomTicket.objects.issue(event)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=issue) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        admit_ats = sorted(WaitingRoomTicket.objects.values_list('admit_at', flat=True))
+        self.assertEqual(len(admit_ats), 5)
+        for previous, admit_at in zip(admit_ats, admit_ats[1:]):
+            self.assertGreaterEqual(admit_at - previous, timedelta(seconds=0.5))
+
+    @skipIf(connection.vendor == "sqlite", "SQLite doesn't support concurrent writes.")
+    def test_simulate_command__concurrent(self):
+        event = EventFactory(waiting_room_enabled=True, waiting_room_admit_rate=10)
+        stdout = StringIO()
+        call_command('simulate_waiting_room', str(event.pk),
+                     visitors=50, concurrency=10, stdout=stdout)
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(lines[0][:18], 'Issued 50 tickets ')
+        self.assertEqual([int(line.split()[1]) for line in lines[2:]], [10] * 5)
+        self.assertFalse(WaitingRoomTicket.objects.exists())
@@ -0,0 +1,61 @@
+# encoding: utf-8
+from io import BytesIO
+from unittest import TestCase
+import zipfile
+
+from openpyxl import load_workbook
+
+from brambling.utils.xlsx import StreamingXLSXWriter
+
+
+class StreamingXLSXWriterTestCase(TestCase):
+    def get_workbook(self, chunks):
+        return load_workbook(BytesIO(b''.join(chunks)))
+
+    def test_stream__valid_zip(self):
+        writer = StreamingXLSXWriter()
+        archive = zipfile.ZipFile(BytesIO(b''.join(writer.stream([[u'a']]))))
+        self.assertIsNone(archive.testzip())
+        self.assertIn('xl/worksheets/sheet1.xml', archive.namelist())
+
+    def test_stream__roundtrip(self):
+        rows = [
+            [u'Name', u'Amount'],
+            [u'Zoë', u'£200.00'],
+            [u'<Lando> & "Han"', u'  padded  '],
+        ]
+        writer = StreamingXLSXWriter(sheet_title='Data')
+        wb = self.get_workbook(writer.stream(rows))
+        self.assertEqual(wb.get_sheet_names(), ['Data'])
+        ws = wb.active
+        self.assertEqual(
+            [[cell.value for cell in row] for row in ws.rows],
+            rows,
+        )
+
+    def test_stream__illegal_characters_dropped(self):
+        writer = StreamingXLSXWriter()
+        ws = self.get_workbook(writer.stream([[u'bell\x07']])).active
+        self.assertEqual(ws.cell(row=1, column=1).value, u'bell')
+
+    def test_stream__lazy(self):
+        consumed = []
+
+        def rows():
+            for i in range(5000):
+                consumed.append(i)
+                yield [unicode(i), u'x' * 50]
+
+        writer = StreamingXLSXWriter()
+        stream = writer.stream(rows())
+        # The first chunk is sent before any row has been rendered.
+        next(stream)
+        self.assertEqual(consumed, [])
+        chunks = list(stream)
+        self.assertEqual(len(consumed), 5000)
+        self.assertGreater(len(chunks), 5)
+
+    def test_stream__many_columns(self):
+        row = [unicode(i) for i in range(30)]
+        ws = self.get_workbook(StreamingXLSXWriter().stream([row])).active
+        self.assertEqual(ws.cell(row=1, column=28).value, u'27')
@@ -25,6 +25,7 @@ from brambling.views.orders import (
     SummaryView,
     TransferView,
     OrderCodeRedirectView,
+    WaitingRoomView,
 )
 from brambling.views.core import (
     ExceptionView,
@@ -108,6 +109,9 @@ order_urlpatterns = [
     url(r'^remove/(?P<pk>\d+)/$',
         RemoveFromOrderView.as_view(),
         name="brambling_event_shop_remove"),
+    url(r'^waiting-room/$',
+        WaitingRoomView.as_view(),
+        name="brambling_event_waiting_room"),
 
     url(r'^attendees/$',
         AttendeesView.as_view(),
@@ -0,0 +1,142 @@
+import itertools
+import tempfile
+
+from django.core.files import File
+from django.http import QueryDict
+from django.utils.crypto import get_random_string
+import unicodecsv as csv
+
+from brambling.models import (Attendee, BoughtItem, Event, ExportJob, Order,
+                              Transaction)
+from brambling.utils.model_tables import (Echo, AttendeeTable, FinanceTable,
+                                          OrderTable, PAGE_FIELD)
+from brambling.utils.xlsx import StreamingXLSXWriter
+
+
+#: Query parameters which control the view rather than the report.
+CONTROL_PARAMETERS = ('format', 'report', 'choose_report', 'delete_report',
+                      'save_report', PAGE_FIELD)
+
+#: Number of rows fetched at a time when rendering model tables.
+EXPORT_CHUNK_SIZE = 500
+
+CONTENT_TYPES = {
+    ExportJob.CSV: 'text/csv',
+    ExportJob.XLSX: 'application/vnd.ms-excel',
+}
+
+
+def normalize_querystring(query_dict):
+    """
+    Returns a canonical querystring for the report described by
+    query_dict, without any of the view's control parameters.
+
+    """
+    qd = QueryDict('', mutable=True)
+    for key in sorted(query_dict.keys()):
+        if key not in CONTROL_PARAMETERS:
+            qd.setlist(key, sorted(query_dict.getlist(key)))
+    return qd.urlencode()
+
+
+def get_attendee_queryset(event):
+    return Attendee.objects.filter(
+        order__event=event,
+        bought_items__status=BoughtItem.BOUGHT,
+    ).distinct()
+
+
+def get_order_queryset(event):
+    return Order.objects.filter(
+        event=event,
+        transaction_count__gt=0,
+    )
+
+
+def get_transaction_queryset(event):
+    return Transaction.objects.filter(
+        event=event,
+        api_type=event.api_type,
+    ).select_related('created_by', 'order', 'related_transaction').order_by('-timestamp')
+
+
+def get_table_rows(table):
+    "Returns the table's header and rows as lists of unicode values."
+    return ([unicode(cell) for cell in row]
+            for row in itertools.chain((table.header_row(),), table))
+
+
+def get_finance_rows(table):
+    return ([unicode(cell.value) for cell in row]
+            for row in table.get_rows(include_headers=True))
+
+
+def get_report_rows(event, report_type, querystring, form_prefix='column'):
+    data = QueryDict(querystring) if querystring else None
+    if report_type == ExportJob.ATTENDEE:
+        return get_table_rows(AttendeeTable(
+            event,
+            queryset=get_attendee_queryset(event),
+            data=data,
+            form_prefix=form_prefix,
+            chunk_size=EXPORT_CHUNK_SIZE,
+        ))
+    if report_type == ExportJob.ORDER:
+        return get_table_rows(OrderTable(
+            event,
+            queryset=get_order_queryset(event),
+            data=data,
+            form_prefix=form_prefix,
+            chunk_size=EXPORT_CHUNK_SIZE,
+        ))
+    if report_type == ExportJob.FINANCE:
+        transactions = get_transaction_queryset(event).iterator()
+        return get_finance_rows(FinanceTable(event, transactions))
+    raise ValueError("Unknown report type: {}".format(report_type))
+
+
+def stream_csv(rows):
+    writer = csv.writer(Echo())
+    return (writer.writerow(row) for row in rows)
+
+
+def stream_xlsx(rows, sheet_title):
+    return StreamingXLSXWriter(sheet_title=sheet_title).stream(rows)
+
+
+def stream_export(rows, format, sheet_title='Data'):
+    if format == ExportJob.CSV:
+        return stream_csv(rows)
+    if format == ExportJob.XLSX:
+        return stream_xlsx(rows, sheet_title)
+    raise ValueError("Unknown format: {}".format(format))
+
+
+def render_export_job(job):
+    """
+    Renders the job's report to a file in the default storage and marks
+    the job as done. The event's last_modified is read before rendering,
+    so changes made while rendering leave the job stale.
+
+    """
+    event = Event.objects.get(pk=job.event_id)
+    event_last_modified = event.last_modified
+    rows = get_report_rows(event, job.report_type, job.querystring)
+    sheet_title = 'Finances' if job.report_type == ExportJob.FINANCE else 'Data'
+
+    with tempfile.TemporaryFile() as f:
+        for chunk in stream_export(rows, job.format, sheet_title):
+            f.write(chunk)
+        f.seek(0)
+        if job.file:
+            job.file.delete(save=False)
+        # The name mustn't be guessable, even though the storage is
+        # private.
+        name = u'{}.{}'.format(get_random_string(32), job.format)
+        job.file.save(name, File(f), save=False)
+
+    job.status = ExportJob.DONE
+    job.event_last_modified = event_last_modified
+    job.error = ''
+    job.save()
+    return job
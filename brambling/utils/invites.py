@@ -1,6 +1,7 @@
 from django.contrib import messages
 from django.contrib.sites.shortcuts import get_current_site
 from django.db.models import NOT_PROVIDED
+from django.db.transaction import atomic
 from django.db.models.query import QuerySet
 from django.core.urlresolvers import reverse
 from django.http import Http404
@@ -403,6 +404,7 @@ class TransferInvite(BaseInvite):
         else:
             return self.get_content().order.email
 
+    @atomic
     def accept(self):
         content = self.get_content()
         if content.status != BoughtItem.BOUGHT:
@@ -476,6 +478,10 @@ class TransferInvite(BaseInvite):
             if not content.attendee.bought_items.exclude(status__in=(BoughtItem.REFUNDED, BoughtItem.TRANSFERRED)).exists():
                 content.attendee.delete()
 
+        # Step seven: Update both orders' balances.
+        content.order.update_balance()
+        order.update_balance()
+
     def post_accept_url(self):
         event = self.order.event
         return reverse('brambling_event_order_summary', kwargs={
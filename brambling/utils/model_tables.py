@@ -4,24 +4,124 @@ import operator
 
 from django.contrib.admin.utils import (lookup_field, lookup_needs_distinct,
                                         label_for_field)
-from django.core.exceptions import ImproperlyConfigured
-from django.db.models import Q, Min, Prefetch
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db import connections
+from django.db.models import F, Q, Prefetch
 from django.forms.forms import pretty_name
 from django.utils.text import capfirst
 import floppyforms as forms
 import six
 
 from brambling.filters import FloppyFilterSet, AttendeeFilterSet, OrderFilterSet
-from brambling.models import Attendee, Order, BoughtItem, Transaction
+from brambling.models import (Attendee, Order, BoughtItem, CustomFormEntry,
+                              SearchToken)
 from brambling.templatetags.zenaida import format_money
 from brambling.utils.timezones import format_as_localtime
 
 
-__all__ = ('ModelTable', 'AttendeeTable', 'OrderTable')
+__all__ = ('ModelTable', 'AttendeeTable', 'OrderTable', 'FinanceTable')
 
 
 TABLE_COLUMN_FIELD = 'columns'
 SEARCH_FIELD = 'search'
+PAGE_FIELD = 'after'
+
+
+def get_seek_ordering(queryset):
+    """
+    Returns the field that the queryset can be seeked on, or None if
+    its ordering is too complex to seek on. Unordered querysets are
+    seeked on pk.
+
+    """
+    order_by = queryset.query.order_by
+    if not order_by:
+        return 'pk'
+    if len(order_by) != 1:
+        return None
+    field = order_by[0]
+    if not isinstance(field, six.string_types) or '__' in field or field == '?':
+        return None
+    return field
+
+
+def seek_querysets(queryset, ordering):
+    """
+    Returns a list of (queryset, ordering) pairs which, chained
+    together, contain every row of the queryset in a deterministic
+    order: rows ordered by (ordering, pk), and the rows where the
+    ordering field is null, ordered by pk. The null rows go first or
+    last to match where the database puts nulls when ordering by the
+    field alone.
+
+    """
+    name = ordering.lstrip('-')
+    if name in ('pk', 'id'):
+        return [(queryset.order_by('pk'), 'pk')]
+    if name not in queryset.query.annotations:
+        try:
+            nullable = queryset.model._meta.get_field(name).null
+        except FieldDoesNotExist:
+            nullable = True
+        if not nullable:
+            return [(queryset.order_by(ordering, 'pk'), ordering)]
+    querysets = [
+        (queryset.filter(**{name + '__isnull': False}).order_by(ordering, 'pk'), ordering),
+        (queryset.filter(**{name + '__isnull': True}).order_by('pk'), 'pk'),
+    ]
+    # e.g. PostgreSQL sorts nulls as larger than any value, SQLite and
+    # MySQL as smaller.
+    nulls_largest = connections[queryset.db].features.nulls_order_largest
+    if nulls_largest == ordering.startswith('-'):
+        querysets.reverse()
+    return querysets
+
+
+def seek(queryset, ordering, last):
+    """
+    Filters one of the querysets from seek_querysets to the rows which
+    follow the object `last`.
+
+    """
+    if last is None:
+        return queryset
+    name = ordering.lstrip('-')
+    if name in ('pk', 'id'):
+        return queryset.filter(pk__gt=last.pk)
+    value = getattr(last, name)
+    lookup = '{}__{}'.format(name, 'lt' if ordering.startswith('-') else 'gt')
+    return queryset.filter(
+        Q(**{lookup: value}) |
+        Q(**{name: value, 'pk__gt': last.pk})
+    )
+
+
+def get_custom_data(related_ids, custom_fields):
+    """
+    Loads custom form data for many objects at once. related_ids maps
+    content types to collections of object ids; only entries for the
+    given custom_fields are fetched and decoded, with one query per
+    content type.
+
+    Returns a dictionary mapping (content type id, object id) to a
+    dictionary of {field key: value}.
+
+    """
+    keys = {field.pk: field.key for field in custom_fields}
+    custom_data = {}
+    if not keys:
+        return custom_data
+    for ct, ids in related_ids.items():
+        entries = CustomFormEntry.objects.filter(
+            related_ct=ct,
+            related_id__in=ids,
+            form_field__in=list(keys),
+        ).values_list('related_id', 'form_field_id', 'value')
+        for related_id, form_field_id, value in entries:
+            data = custom_data.setdefault((ct.pk, related_id), {})
+            data[keys[form_field_id]] = CustomFormEntry.decode_value(value)
+    return custom_data
 
 
 class Echo(object):
@@ -87,11 +187,16 @@ class ModelTable(object):
     customizable selection of fields. If data is not required, it will
     not be queried.
 
-    The class takes three optional arguments on instantiation:
+    The class takes four optional arguments on instantiation:
 
     1. Queryset
     2. Data
     3. A form prefix
+    4. A chunk size
+
+    If a chunk size is given, iterating over the table fetches at most
+    that many objects (and their related data) at a time instead of
+    evaluating the whole queryset at once.
 
     """
 
@@ -108,11 +213,14 @@ class ModelTable(object):
     filterset_class = FloppyFilterSet
     model = None
 
-    def __init__(self, queryset=None, data=None, form_prefix=None):
+    def __init__(self, queryset=None, data=None, form_prefix=None,
+                 chunk_size=None, page_size=None):
         # Simple assignment:
         self.queryset = queryset
         self.data = data
         self.form_prefix = form_prefix
+        self.chunk_size = chunk_size
+        self.page_size = page_size
         self.filterset = self.get_filterset()
 
         # More complex properties:
@@ -120,16 +228,148 @@ class ModelTable(object):
 
     def __iter__(self):
         fields = self.get_fields()
-        object_list = self.get_queryset(fields)
-        for obj in object_list:
-            yield Row(((field, self.get_field_val(obj, field))
-                       for field in fields),
-                      obj=obj)
+        if self.page_size:
+            batches = (self._get_page(fields)[0],)
+        elif self.chunk_size:
+            batches = self._iter_chunked(fields)
+        else:
+            batches = (list(self.get_queryset(fields)),)
+        for batch in batches:
+            self._add_batch_data(batch, fields)
+            for obj in batch:
+                yield Row(((field, self.get_field_val(obj, field))
+                           for field in fields),
+                          obj=obj)
+
+    def _iter_chunked(self, fields):
+        """
+        Yields lists of at most chunk_size objects from the filtered
+        queryset. Each chunk is a separate query (with its own
+        prefetches), and is released once it has been yielded.
+
+        Querysets ordered by a single field are paged through by
+        (field, pk) keyset; rows where the field is null are paged
+        through separately, by pk.
+        For other orderings, the ordered primary keys are fetched first
+        and the objects are then loaded a chunk at a time.
+
+        """
+        queryset = self.get_queryset(fields)
+        ordering = get_seek_ordering(queryset)
+        if ordering is not None:
+            for seek_qs, seek_ordering in seek_querysets(queryset, ordering):
+                last = None
+                while True:
+                    chunk = list(seek(seek_qs, seek_ordering, last)[:self.chunk_size])
+                    if chunk:
+                        yield chunk
+                    if len(chunk) < self.chunk_size:
+                        break
+                    last = chunk[-1]
+        else:
+            pks = list(queryset.values_list('pk', flat=True))
+            for i in xrange(0, len(pks), self.chunk_size):
+                chunk_pks = pks[i:i + self.chunk_size]
+                chunk = {
+                    obj.pk: obj
+                    for obj in queryset.order_by().filter(pk__in=chunk_pks)
+                }
+                yield [chunk[pk] for pk in chunk_pks if pk in chunk]
+
+    def _get_page_start(self, queryset, after):
+        """
+        Returns the object that the current page starts after, or None
+        for the first page. Unknown cursors also give the first page.
+
+        """
+        if not after:
+            return None
+        try:
+            return queryset.prefetch_related(None).order_by().get(pk=after)
+        except (ValueError, self.model.DoesNotExist):
+            return None
+
+    def _get_page(self, fields):
+        """
+        Returns a list of at most page_size objects following the
+        cursor in self.data, and the cursor for the next page (or None
+        if this is the last page.)
+
+        Pages are seeked on the same (field, pk) keyset as chunked
+        iteration, so each page is a constant amount of work no matter
+        how far into the table it is. Orderings which can't be seeked
+        on fall back to finding the cursor in the ordered primary keys.
+
+        """
+        if hasattr(self, '_page'):
+            return self._page
+        queryset = self.get_queryset(fields)
+        after = self.data.get(PAGE_FIELD) if self.data else None
+        ordering = get_seek_ordering(queryset)
+        if ordering is not None:
+            last = self._get_page_start(queryset, after)
+            querysets = seek_querysets(queryset, ordering)
+            if last is not None and len(querysets) > 1:
+                # Start from the queryset the cursor is in; the one for
+                # null values is ordered by pk.
+                last_is_null = getattr(last, ordering.lstrip('-')) is None
+                while (querysets[0][1] == 'pk') != last_is_null:
+                    querysets = querysets[1:]
+            objects = []
+            for seek_qs, seek_ordering in querysets:
+                limit = self.page_size + 1 - len(objects)
+                objects.extend(seek(seek_qs, seek_ordering, last)[:limit])
+                if len(objects) > self.page_size:
+                    break
+                last = None
+        else:
+            pks = list(queryset.values_list('pk', flat=True))
+            start = 0
+            if after:
+                try:
+                    start = [unicode(pk) for pk in pks].index(unicode(after)) + 1
+                except ValueError:
+                    pass
+            page_pks = pks[start:start + self.page_size + 1]
+            by_pk = {
+                obj.pk: obj
+                for obj in queryset.order_by().filter(pk__in=page_pks)
+            }
+            objects = [by_pk[pk] for pk in page_pks if pk in by_pk]
+
+        next_cursor = None
+        if len(objects) > self.page_size:
+            objects = objects[:self.page_size]
+            next_cursor = objects[-1].pk
+        self._page = (objects, next_cursor)
+        return self._page
+
+    @property
+    def is_paginated(self):
+        return bool(self.page_size)
+
+    @property
+    def next_cursor(self):
+        """
+        The value of the PAGE_FIELD parameter for the next page of the
+        table, or None if there isn't one.
+
+        """
+        if not self.page_size:
+            return None
+        return self._get_page(self.get_fields())[1]
+
+    def count(self):
+        """
+        Returns the number of rows in the table. This doesn't add the
+        data needed to display the selected columns, so it stays cheap
+        however many columns are shown.
+
+        """
+        return self.get_queryset(()).order_by().count()
 
     def __len__(self):
-        fields = self.get_fields()
-        object_list = self.get_queryset(fields)
-        return object_list.count()
+        return self.count()
 
     def __nonzero__(self):
         # Prevents infinite recursion from calling __len__ - label_for_field
@@ -210,6 +450,14 @@ class ModelTable(object):
         use_distinct = False
         return queryset, use_distinct
 
+    def _add_batch_data(self, objects, fields):
+        """
+        Load data for a batch of objects which can't be added to the
+        queryset, before their rows are built.
+
+        """
+        pass
+
     def _search(self, queryset):
         # Originally from django.contrib.admin.options
         def construct_search(field_name):
@@ -353,25 +601,43 @@ class CustomDataTable(ModelTable):
                     self.label_overrides[field.key] = field.name
         return tuple(field.key for field in self.custom_fields)
 
-    def _get_custom_data(self, obj):
-        return {
-            entry.form_field_id: entry.get_value()
-            for entry in obj.custom_data.all()
-        }
-
     def _get_custom_fields(self):
         raise NotImplementedError
 
+    def _get_custom_field(self, key):
+        for field in self.custom_fields:
+            if field.key == key:
+                return field
+        return None
+
+    def _get_custom_data_objects(self, obj):
+        """
+        Returns the objects whose custom form entries are shown in obj's
+        row, in order of precedence.
+
+        """
+        return (obj,)
+
+    def _add_batch_data(self, objects, fields):
+        super(CustomDataTable, self)._add_batch_data(objects, fields)
+        custom_fields = [field for field in self.custom_fields
+                         if field.key in fields]
+        related_ids = {}
+        if custom_fields:
+            for obj in objects:
+                for related_obj in self._get_custom_data_objects(obj):
+                    ct = ContentType.objects.get_for_model(related_obj)
+                    related_ids.setdefault(ct, set()).add(related_obj.pk)
+        self._custom_data = get_custom_data(related_ids, custom_fields)
+
     def get_field_val(self, obj, key):
         if key.startswith('custom_'):
-            if not hasattr(obj, '_custom_data'):
-                raw_data = self._get_custom_data(obj)
-                obj._custom_data = {
-                    field.key: raw_data[field.pk]
-                    for field in self.custom_fields
-                    if field.pk in raw_data
-                }
-            return obj._custom_data.get(key, '')
+            for related_obj in self._get_custom_data_objects(obj):
+                ct = ContentType.objects.get_for_model(related_obj)
+                data = self._custom_data.get((ct.pk, related_obj.pk), {})
+                if key in data:
+                    return data[key]
+            return ''
         return super(CustomDataTable, self).get_field_val(obj, key)
 
 
@@ -406,8 +672,6 @@ class AttendeeTable(CustomDataTable):
         'liability_waiver': 'Liability Waiver Signed',
         'photo_consent': 'Consent to be Photographed',
     }
-    search_fields = ('first_name', 'middle_name', 'last_name', 'order__code',
-                     'email', 'order__email', 'order__person__email')
     filterset_class = AttendeeFilterSet
     model = Attendee
 
@@ -424,31 +688,66 @@ class AttendeeTable(CustomDataTable):
         from brambling.models import CustomForm, CustomFormField
         qs = CustomFormField.objects.filter(
             form__event=self.event,
-        ).order_by('index')
+        ).select_related('form').order_by('index')
         if self.event.collect_housing_data:
             return qs.filter(form__form_type__in=(CustomForm.ATTENDEE, CustomForm.HOUSING))
         else:
             return qs.filter(form__form_type=CustomForm.ATTENDEE)
 
+    # Sum of the attendee's bought items' prices, less discount savings
+    # (see BoughtItemDiscount.savings), for items which do / don't have
+    # a confirmed transaction. Formatted with the confirmed condition.
+    item_total_sql = """
+        SELECT COALESCE(SUM(
+            brambling_boughtitem.price - COALESCE((
+                SELECT SUM(CASE
+                    WHEN brambling_boughtitemdiscount.discount_type = 'flat'
+                    THEN CASE
+                        WHEN brambling_boughtitemdiscount.amount < brambling_boughtitem.price
+                        THEN brambling_boughtitemdiscount.amount
+                        ELSE brambling_boughtitem.price END
+                    ELSE CASE
+                        WHEN brambling_boughtitemdiscount.amount * brambling_boughtitem.price / 100.0 < brambling_boughtitem.price
+                        THEN brambling_boughtitemdiscount.amount * brambling_boughtitem.price / 100.0
+                        ELSE brambling_boughtitem.price END
+                    END)
+                FROM brambling_boughtitemdiscount WHERE
+                brambling_boughtitemdiscount.bought_item_id = brambling_boughtitem.id
+            ), 0)
+        ), 0)
+        FROM brambling_boughtitem WHERE
+        brambling_boughtitem.attendee_id = brambling_attendee.id AND
+        brambling_boughtitem.status = 'bought' AND
+        {} EXISTS (
+            SELECT 1 FROM brambling_transaction_bought_items
+            INNER JOIN brambling_transaction ON
+            brambling_transaction.id = brambling_transaction_bought_items.transaction_id
+            WHERE brambling_transaction_bought_items.boughtitem_id = brambling_boughtitem.id AND
+            brambling_transaction.is_confirmed = %s
+        )
+    """
+
     def _add_data(self, queryset, fields):
         use_distinct = False
-        queryset = queryset.prefetch_related(
-            Prefetch(
-                'bought_items',
-                queryset=BoughtItem.objects.filter(status=BoughtItem.BOUGHT).prefetch_related(
+        for field in fields:
+            if field == 'items':
+                queryset = queryset.prefetch_related(
                     Prefetch(
-                        'transactions',
-                        queryset=Transaction.objects.filter(is_confirmed=True),
-                        to_attr='confirmed_transactions',
+                        'bought_items',
+                        queryset=BoughtItem.objects.filter(status=BoughtItem.BOUGHT),
+                        to_attr='items'
                     ),
-                ),
-                to_attr='items'
-            ),
-            'items__discounts',
-        )
-        for field in fields:
-            if field.startswith('custom_'):
-                queryset = queryset.prefetch_related('custom_data')
+                )
+            elif field == 'pending':
+                queryset = queryset.extra(
+                    select={'pending_amount': self.item_total_sql.format('NOT')},
+                    select_params=(True,),
+                )
+            elif field == 'confirmed':
+                queryset = queryset.extra(
+                    select={'confirmed_amount': self.item_total_sql.format('')},
+                    select_params=(True,),
+                )
             elif field == 'housing_nights':
                 queryset = queryset.prefetch_related('nights')
             elif field == 'housing_preferences':
@@ -468,45 +767,40 @@ class AttendeeTable(CustomDataTable):
         )
         if uses_purchase_date:
             queryset = queryset.annotate(
-                purchase_date=Min('order__transactions__timestamp')
+                purchase_date=F('order__first_transaction_time')
             )
         return queryset, use_distinct
 
-    def _show_housing_data(self, attendee, form_entry):
-        if form_entry.form_field.form.form_type != 'housing':
+    def _search(self, queryset):
+        search_term = self.data.get(SEARCH_FIELD, '') if self.data else ''
+        for bit in search_term.split():
+            queryset = queryset.filter(SearchToken.objects.attendee_filter(self.event, bit))
+        return queryset, False
+
+    def _show_housing_data(self, attendee, form_field):
+        if form_field.form.form_type != 'housing':
             return True
         if attendee.needs_housing():
             return True
         else:
             return False
 
-    def _get_custom_data(self, attendee):
-        return {
-            entry.form_field_id: (entry.get_value() if self._show_housing_data(attendee, entry) else '')
-            for entry in attendee.custom_data.select_related('form_field__form').all()
-        }
+    def get_field_val(self, obj, key):
+        if key.startswith('custom_'):
+            form_field = self._get_custom_field(key)
+            if form_field is None or not self._show_housing_data(obj, form_field):
+                return ''
+        return super(AttendeeTable, self).get_field_val(obj, key)
 
     # Methods to be used as fields
     def order_code(self, obj):
         return obj.order.code
 
     def pending(self, obj):
-        pending = 0
-        for item in obj.items:
-            if not item.confirmed_transactions:
-                pending += item.price
-                for discount in item.discounts.all():
-                    pending -= discount.savings()
-        return format_money(pending, self.event.currency)
+        return format_money(obj.pending_amount, self.event.currency)
 
     def confirmed(self, obj):
-        confirmed = 0
-        for item in obj.items:
-            if item.confirmed_transactions:
-                confirmed += item.price
-                for discount in item.discounts.all():
-                    confirmed -= discount.savings()
-        return format_money(confirmed, self.event.currency)
+        return format_money(obj.confirmed_amount, self.event.currency)
 
     def housing_nights(self, attendee):
         return attendee.nights.all() if attendee.needs_housing() else ''
@@ -564,11 +858,6 @@ class OrderTable(CustomDataTable):
         'heard_through_other': 'heard through (other)',
         'send_flyers_full_address': 'flyers address',
     }
-    search_fields = (
-        'code', 'email', 'person__first_name', 'person__middle_name',
-        'person__last_name', 'person__email', 'attendees__first_name',
-        'attendees__middle_name', 'attendees__last_name',
-    )
     filterset_class = OrderFilterSet
     model = Order
 
@@ -627,9 +916,20 @@ class OrderTable(CustomDataTable):
             )
         return super(OrderTable, self)._label(field)
 
+    def _get_hosting_slots(self, obj):
+        """
+        Returns a dictionary mapping dates to the order's housing slots.
+        Relies on the slots prefetched in _add_data.
+
+        """
+        if not hasattr(obj, '_hosting_slots'):
+            eventhousing = obj.get_eventhousing()
+            slots = eventhousing.housingslot_set.all() if eventhousing else ()
+            obj._hosting_slots = {slot.date: slot for slot in slots}
+        return obj._hosting_slots
+
     def get_field_val(self, obj, key):
         date_str = None
-        from brambling.models import HousingSlot
 
         if key.startswith('hosting_max'):
             date_str = key[-8:]
@@ -641,46 +941,39 @@ class OrderTable(CustomDataTable):
         if date_str:
             if obj.get_eventhousing() and obj.providing_housing:
                 hosting_date = datetime.datetime.strptime(date_str, "%Y%m%d").date()
-                try:
-                    slot = HousingSlot.objects.get(eventhousing__order=obj, date=hosting_date)
-                except HousingSlot.DoesNotExist:
-                    pass
-                else:
+                slot = self._get_hosting_slots(obj).get(hosting_date)
+                if slot is not None:
                     return getattr(slot, field, '')
             return ''
 
-        if key.startswith('custom_') and self.event.collect_housing_data and obj.providing_housing:
-            if not hasattr(obj, '_custom_data'):
-                super(OrderTable, self).get_field_val(obj, key)
-                # Also include event_housing data.
-                eventhousing = obj.get_eventhousing()
-                if eventhousing:
-                    raw_data = {
-                        entry.form_field_id: entry.get_value()
-                        for entry in eventhousing.custom_data.all()
-                    }
-                    obj._custom_data.update({
-                        field.key: raw_data[field.pk]
-                        for field in self.custom_fields
-                        if field.pk in raw_data
-                    })
-            return obj._custom_data.get(key, '')
         return super(OrderTable, self).get_field_val(obj, key)
 
+    def _get_custom_data_objects(self, obj):
+        # Also include event_housing data.
+        if self.event.collect_housing_data and obj.providing_housing:
+            eventhousing = obj.get_eventhousing()
+            if eventhousing:
+                return (eventhousing, obj)
+        return (obj,)
+
     def _add_data(self, queryset, fields):
         use_distinct = False
         queryset = queryset.annotate(
-            completed_date=Min('transactions__timestamp'),
+            completed_date=F('first_transaction_time'),
         ).prefetch_related('transactions')
         for field in fields:
             if field.startswith('custom_'):
-                queryset = queryset.prefetch_related('custom_data')
+                if self.event.collect_housing_data:
+                    queryset = queryset.select_related('eventhousing')
             elif field == 'ef_present':
                 queryset = queryset.prefetch_related('eventhousing__ef_present')
             elif field == 'ef_avoid':
                 queryset = queryset.prefetch_related('eventhousing__ef_avoid')
             elif field == 'housing_categories':
                 queryset = queryset.prefetch_related('eventhousing__housing_categories')
+            elif field.startswith('hosting_'):
+                # Repeated lookups are ignored by prefetch_related.
+                queryset = queryset.prefetch_related('eventhousing__housingslot_set')
             elif field == 'person':
                 queryset = queryset.select_related('person')
             elif field == 'purchased_items':
@@ -701,6 +994,12 @@ class OrderTable(CustomDataTable):
                 })
         return queryset, use_distinct
 
+    def _search(self, queryset):
+        search_term = self.data.get(SEARCH_FIELD, '') if self.data else ''
+        for bit in search_term.split():
+            queryset = queryset.filter(SearchToken.objects.order_filter(self.event, bit))
+        return queryset, False
+
     def send_flyers_full_address(self, obj):
         if obj.send_flyers:
             return u", ".join((
@@ -784,3 +1083,62 @@ class OrderTable(CustomDataTable):
                                        self.event.timezone)
         else:
             return 'N/A'
+
+
+class FinanceTable(object):
+
+    def __init__(self, event, transactions):
+        self.event = event
+        self.transactions = transactions
+
+    def headers(self):
+        return [
+            'Timestamp (%s)' % self.event.timezone,
+            'Created By',
+            'Method',
+            'Type',
+            'Order',
+            'Amount',
+            'Dancerfly Fee',
+            'Payment Fee',
+        ]
+
+    def header_cells(self):
+        return [Cell(field='header', value=col) for col in self.headers()]
+
+    def get_rows(self, include_headers=False):
+        if include_headers:
+            yield self.header_cells()
+        for transaction in self.transactions:
+            yield self.format_transaction(transaction)
+
+    def money(self, amount):
+        return format_money(amount, self.event.currency)
+
+    def format_transaction(self, transaction):
+        return Row((
+            ('timestamp', self.format_timestamp(transaction)),
+            ('created_by', self.created_by_name(transaction)),
+            ('method', transaction.get_method_display()),
+            ('type', transaction.get_transaction_type_display()),
+            ('order', self.order_code(transaction)),
+            ('amount', self.money(transaction.amount)),
+            ('application_fee', self.money(transaction.application_fee)),
+            ('processing_fee', self.money(transaction.processing_fee)),
+        ), obj=transaction)
+
+    def format_timestamp(self, transaction):
+        return format_as_localtime(transaction.timestamp, "%B %d, %Y %H:%M:%S",
+                                   self.event.timezone)
+
+    def order_code(self, transaction):
+        if transaction.order:
+            return transaction.order.code
+        else:
+            return ''
+
+    def created_by_name(self, transaction):
+        if transaction.created_by:
+            return transaction.created_by.get_full_name()
+        else:
+            return ''
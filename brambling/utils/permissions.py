@@ -0,0 +1,224 @@
+import time
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+
+from brambling.models import Event, EventMember, Organization, OrganizationMember
+
+
+CACHE_KEY = 'brambling.permissions:{person}:{version}:{model}:{pk}'
+VERSION_KEY = 'brambling.permissions.version:{person}'
+
+
+def get_cache_timeout():
+    """
+    Returns how many seconds permissions are shared between requests
+    for, or 0 if they aren't. Sharing them needs a cache that all the
+    processes use, or one process would keep permissions which another
+    had revoked.
+
+    """
+    timeout = getattr(settings, 'PERMISSION_CACHE_TIMEOUT', 0)
+    if timeout and isinstance(caches[DEFAULT_CACHE_ALIAS], LocMemCache):
+        raise ImproperlyConfigured(
+            "PERMISSION_CACHE_TIMEOUT requires a cache shared between "
+            "processes, such as memcached, not the local-memory cache."
+        )
+    return timeout
+
+
+def get_request_cache(user):
+    "Returns the per-request permission cache on the user object."
+    if not hasattr(user, '_brambling_perm_cache'):
+        user._brambling_perm_cache = {}
+    return user._brambling_perm_cache
+
+
+def get_membership_version(person):
+    """
+    Returns the version of the person's memberships. Cached permissions
+    are stored under this version, so changing it makes them all stale
+    at once. It's read once per request.
+
+    """
+    if not hasattr(person, '_brambling_perm_version'):
+        key = VERSION_KEY.format(person=person.pk)
+        version = cache.get(key)
+        if version is None:
+            # Start from the time rather than 1 so that an evicted
+            # version is never reused.
+            version = int(time.time() * 1000)
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+        person._brambling_perm_version = version
+    return person._brambling_perm_version
+
+
+def get_cache_key(person, model, pk):
+    return CACHE_KEY.format(
+        person=person.pk,
+        version=get_membership_version(person),
+        model=model.__name__,
+        pk=pk,
+    )
+
+
+def get_shared_permissions(person, objs):
+    """
+    Returns a dictionary mapping each of the objects found in the
+    cross-request cache to the person's permissions for it.
+
+    """
+    if not get_cache_timeout():
+        return {}
+    keys = {get_cache_key(person, obj.__class__, obj.pk): obj for obj in objs}
+    cached = cache.get_many(list(keys))
+    return {keys[key]: perms for key, perms in cached.items()}
+
+
+def set_shared_permissions(person, permissions):
+    """
+    Stores a dictionary mapping objects to the person's permissions
+    for them in the cross-request cache.
+
+    """
+    timeout = get_cache_timeout()
+    if not timeout:
+        return
+    cache.set_many({
+        get_cache_key(person, obj.__class__, obj.pk): perms
+        for obj, perms in permissions.items()
+    }, timeout)
+
+
+def invalidate_permissions(person_id):
+    """
+    Makes all the person's cached permissions stale by bumping their
+    membership version once the current transaction commits. Bumping it
+    any earlier would let a request which still sees the old
+    memberships cache them under the new version.
+
+    """
+    if not get_cache_timeout():
+        return
+
+    def bump():
+        try:
+            cache.incr(VERSION_KEY.format(person=person_id))
+        except ValueError:
+            # The version isn't set, so nothing is cached under it.
+            pass
+    transaction.on_commit(bump)
+
+
+def clear_request_permissions(user):
+    "Clears the permissions cached on the user object for this request."
+    for attr in ('_brambling_perm_cache', '_brambling_perm_version', '_brambling_event_perms'):
+        if hasattr(user, attr):
+            delattr(user, attr)
+
+
+def resolve_permissions(person, objs):
+    """
+    Returns a dictionary mapping each of the given events and
+    organizations to the person's permissions for it, using at most
+    two queries however many objects there are.
+
+    """
+    events = [obj for obj in objs if isinstance(obj, Event)]
+    organizations = [obj for obj in objs if isinstance(obj, Organization)]
+    if person.is_superuser:
+        return {obj: set(('view', 'edit', 'change_permissions'))
+                for obj in events + organizations}
+
+    organization_ids = set(org.pk for org in organizations)
+    organization_ids.update(event.organization_id for event in events)
+    organization_roles = {}
+    if organization_ids:
+        organization_roles = dict(OrganizationMember.objects.filter(
+            person=person,
+            organization__in=organization_ids,
+        ).values_list('organization', 'role'))
+
+    event_roles = {}
+    if events:
+        event_roles = dict(EventMember.objects.filter(
+            person=person,
+            event__in=[event.pk for event in events],
+        ).values_list('event', 'role'))
+
+    permissions = {}
+    for org in organizations:
+        permissions[org] = set(Organization.get_role_permissions(organization_roles.get(org.pk)))
+    for event in events:
+        permissions[event] = set(Event.get_role_permissions(
+            organization_roles.get(event.organization_id),
+            event_roles.get(event.pk),
+        ))
+    return permissions
+
+
+def prime_permissions(user, objs):
+    """
+    Loads the user's permissions for all the given events and
+    organizations into the permission cache, so that checking them
+    afterwards doesn't query the database once per object.
+
+    """
+    if not user.is_authenticated() or not user.is_active:
+        return
+    perm_cache = get_request_cache(user)
+    missing = [obj for obj in objs
+               if obj.pk not in perm_cache.get(obj.__class__.__name__, {})]
+    if not missing:
+        return
+
+    permissions = get_shared_permissions(user, missing)
+    resolved = resolve_permissions(user, [obj for obj in missing if obj not in permissions])
+    set_shared_permissions(user, resolved)
+    permissions.update(resolved)
+
+    for obj, perms in permissions.items():
+        perm_cache.setdefault(obj.__class__.__name__, {})[obj.pk] = perms
+
+
+def get_event_permissions(user):
+    """
+    Returns a dictionary mapping the id of every event the user has
+    permissions for (through the event or its organization) to those
+    permissions, using at most three queries. Computed once per
+    request; the results are also loaded into the permission cache.
+
+    """
+    if not hasattr(user, '_brambling_event_perms'):
+        organization_roles = dict(OrganizationMember.objects.filter(
+            person=user,
+        ).values_list('organization', 'role'))
+        event_roles = {}
+        event_organizations = {}
+        for event_id, organization_id, role in EventMember.objects.filter(
+                person=user).values_list('event', 'event__organization', 'role'):
+            event_roles[event_id] = role
+            event_organizations[event_id] = organization_id
+        if organization_roles:
+            event_organizations.update(Event.objects.filter(
+                organization__in=list(organization_roles),
+            ).values_list('pk', 'organization'))
+
+        event_perms = {}
+        for event_id, organization_id in event_organizations.items():
+            perms = set(Event.get_role_permissions(
+                organization_roles.get(organization_id),
+                event_roles.get(event_id),
+            ))
+            if perms:
+                event_perms[event_id] = perms
+        user._brambling_event_perms = event_perms
+
+        perm_cache = get_request_cache(user).setdefault('Event', {})
+        for event_id, perms in event_perms.items():
+            perm_cache.setdefault(event_id, perms)
+    return user._brambling_event_perms
@@ -0,0 +1,77 @@
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, Storage, get_storage_class
+from django.core.signals import setting_changed
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class PrivateStorage(Storage):
+    """
+    Storage for files which must not be publicly readable, such as
+    rendered exports. Delegates to settings.PRIVATE_FILE_STORAGE, which
+    is read when the storage is first used, and doesn't give out URLs:
+    the files are only served through views which check permissions.
+
+    """
+    def __init__(self):
+        self._storage = None
+        setting_changed.connect(self._setting_changed)
+
+    def _setting_changed(self, setting, **kwargs):
+        if setting in ('PRIVATE_FILE_STORAGE', 'PRIVATE_MEDIA_ROOT'):
+            self._storage = None
+
+    @property
+    def storage(self):
+        if self._storage is None:
+            self._storage = self._get_storage()
+        return self._storage
+
+    def _get_storage(self):
+        storage_class = get_storage_class(getattr(
+            settings, 'PRIVATE_FILE_STORAGE',
+            'django.core.files.storage.FileSystemStorage',
+        ))
+        if issubclass(storage_class, FileSystemStorage):
+            # Keep the files out of MEDIA_ROOT, which may be served.
+            return storage_class(location=settings.PRIVATE_MEDIA_ROOT)
+        return storage_class()
+
+    def _open(self, name, mode='rb'):
+        return self.storage.open(name, mode)
+
+    def _save(self, name, content):
+        return self.storage.save(name, content)
+
+    def get_available_name(self, name, max_length=None):
+        return self.storage.get_available_name(name, max_length=max_length)
+
+    def path(self, name):
+        return self.storage.path(name)
+
+    def delete(self, name):
+        return self.storage.delete(name)
+
+    def exists(self, name):
+        return self.storage.exists(name)
+
+    def listdir(self, path):
+        return self.storage.listdir(path)
+
+    def size(self, name):
+        return self.storage.size(name)
+
+    def url(self, name):
+        raise NotImplementedError("Private files don't have public URLs.")
+
+    def accessed_time(self, name):
+        return self.storage.accessed_time(name)
+
+    def created_time(self, name):
+        return self.storage.created_time(name)
+
+    def modified_time(self, name):
+        return self.storage.modified_time(name)
+
+
+private_storage = PrivateStorage()
@@ -0,0 +1,79 @@
+import datetime
+
+from django.core import signing
+from django.utils import timezone
+
+from brambling.models import WaitingRoomTicket
+
+
+SESSION_KEY = '_brambling_waiting_room'
+SALT = 'brambling.waiting_room'
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def get_ticket_token(ticket):
+    """
+    Returns a signed token for the ticket. The token carries the
+    ticket's admission time, so checking it doesn't need the database.
+
+    """
+    return signing.dumps({
+        'event': ticket.event_id,
+        'ticket': ticket.pk,
+        'admit_at': (ticket.admit_at - EPOCH).total_seconds(),
+    }, salt=SALT)
+
+
+def get_session_ticket(request, event):
+    """
+    Returns the data from the session's ticket for the event, or None
+    if it doesn't have a valid one.
+
+    """
+    token = request.session.get(SESSION_KEY, {}).get(str(event.pk))
+    if token is None:
+        return None
+    try:
+        data = signing.loads(token, salt=SALT)
+    except signing.BadSignature:
+        return None
+    if data.get('event') != event.pk:
+        return None
+    return data
+
+
+def issue_session_ticket(request, event):
+    """
+    Returns the data from the session's ticket for the event, issuing
+    a new ticket first if the session doesn't have one.
+
+    """
+    data = get_session_ticket(request, event)
+    if data is None:
+        ticket = WaitingRoomTicket.objects.issue(event)
+        tokens = request.session.get(SESSION_KEY, {})
+        tokens[str(event.pk)] = get_ticket_token(ticket)
+        request.session[SESSION_KEY] = tokens
+        data = get_session_ticket(request, event)
+    return data
+
+
+def get_admit_at(data):
+    "Returns the admission time from a ticket's data."
+    return EPOCH + datetime.timedelta(seconds=data['admit_at'])
+
+
+def is_admitted(data):
+    return data is not None and get_admit_at(data) <= timezone.now()
+
+
+def session_is_admitted(request, event):
+    """
+    Returns True if the session may use the event's registration
+    workflow: either the event has no waiting room, or the session
+    holds a ticket whose time has come.
+
+    """
+    if not event.waiting_room_enabled:
+        return True
+    return is_admitted(get_session_ticket(request, event))
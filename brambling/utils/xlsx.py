@@ -0,0 +1,209 @@
+import re
+import struct
+import time
+import zlib
+from xml.sax.saxutils import escape, quoteattr
+
+from openpyxl.utils import get_column_letter
+
+
+__all__ = ('StreamingXLSXWriter',)
+
+
+# Characters which are not allowed in XML 1.0 documents. openpyxl refuses
+# to write them; we just drop them.
+ILLEGAL_CHARACTERS_RE = re.compile(r'[\000-\010]|[\013-\014]|[\016-\037]')
+
+CONTENT_TYPES_XML = (
+    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    b'<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    b'<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    b'<Default Extension="xml" ContentType="application/xml"/>'
+    b'<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    b'<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    b'</Types>'
+)
+
+ROOT_RELS_XML = (
+    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    b'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    b'<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    b'</Relationships>'
+)
+
+WORKBOOK_XML = (
+    u'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    u'<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    u'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    u'<sheets><sheet name={title} sheetId="1" r:id="rId1"/></sheets>'
+    u'</workbook>'
+)
+
+WORKBOOK_RELS_XML = (
+    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    b'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    b'<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    b'</Relationships>'
+)
+
+SHEET_HEADER_XML = (
+    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    b'<sheetData>'
+)
+
+SHEET_FOOTER_XML = b'</sheetData></worksheet>'
+
+
+def _clean(value):
+    return escape(ILLEGAL_CHARACTERS_RE.sub(u'', value))
+
+
+class _ZipEntry(object):
+    """
+    Compresses a single zip member incrementally. Sizes and CRC are
+    written after the data in a data descriptor, so nothing needs to
+    be seeked back to.
+
+    """
+    def __init__(self, name, offset, date_time):
+        self.name = name.encode('utf-8')
+        self.offset = offset
+        self.date_time = date_time
+        self.crc = 0
+        self.compressed_size = 0
+        self.uncompressed_size = 0
+        self._compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+
+    def local_header(self):
+        dos_time, dos_date = self.date_time
+        return struct.pack(
+            b'<IHHHHHIIIHH',
+            0x04034b50, 20, 0x08, 8, dos_time, dos_date,
+            0, 0, 0, len(self.name), 0,
+        ) + self.name
+
+    def compress(self, data):
+        self.crc = zlib.crc32(data, self.crc)
+        self.uncompressed_size += len(data)
+        compressed = self._compressor.compress(data)
+        self.compressed_size += len(compressed)
+        return compressed
+
+    def flush(self):
+        compressed = self._compressor.flush()
+        self.compressed_size += len(compressed)
+        return compressed
+
+    def data_descriptor(self):
+        return struct.pack(
+            b'<IIII',
+            0x08074b50, self.crc & 0xffffffff,
+            self.compressed_size, self.uncompressed_size,
+        )
+
+    def central_directory_header(self):
+        dos_time, dos_date = self.date_time
+        return struct.pack(
+            b'<IHHHHHHIIIHHHHHII',
+            0x02014b50, 20, 20, 0x08, 8, dos_time, dos_date,
+            self.crc & 0xffffffff, self.compressed_size,
+            self.uncompressed_size, len(self.name), 0, 0, 0, 0, 0,
+            self.offset,
+        ) + self.name
+
+
+class StreamingXLSXWriter(object):
+    """
+    Writes a single-sheet xlsx workbook as an iterable of byte strings,
+    so that it can be handed directly to a StreamingHttpResponse.
+
+    Unlike building an openpyxl Workbook and calling
+    save_virtual_workbook, rows are serialized, compressed and yielded
+    as they are consumed from the input iterable, so memory use stays
+    constant regardless of the number of rows and the first bytes are
+    sent before the last row is rendered.
+
+    Cells are written as inline strings; each row should be an iterable
+    of unicode values.
+
+    """
+    #: Minimum number of compressed bytes to accumulate before yielding.
+    chunk_size = 16 * 1024
+
+    def __init__(self, sheet_title='Sheet'):
+        self.sheet_title = sheet_title
+
+    def _dos_date_time(self):
+        now = time.localtime()
+        dos_date = (now.tm_year - 1980) << 9 | now.tm_mon << 5 | now.tm_mday
+        dos_time = now.tm_hour << 11 | now.tm_min << 5 | (now.tm_sec // 2)
+        return dos_time, dos_date
+
+    def row_xml(self, index, row):
+        cells = []
+        for column, value in enumerate(row, 1):
+            cells.append(
+                u'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{value}</t></is></c>'.format(
+                    ref=u'{}{}'.format(get_column_letter(column), index),
+                    value=_clean(value),
+                )
+            )
+        return u'<row r="{}">{}</row>'.format(index, u''.join(cells)).encode('utf-8')
+
+    def stream(self, rows):
+        """
+        Yields the bytes of an xlsx file containing the given rows.
+
+        """
+        date_time = self._dos_date_time()
+        workbook_xml = WORKBOOK_XML.format(
+            title=quoteattr(_clean(self.sheet_title[:31])),
+        ).encode('utf-8')
+        files = (
+            ('[Content_Types].xml', (CONTENT_TYPES_XML,)),
+            ('_rels/.rels', (ROOT_RELS_XML,)),
+            ('xl/workbook.xml', (workbook_xml,)),
+            ('xl/_rels/workbook.xml.rels', (WORKBOOK_RELS_XML,)),
+            ('xl/worksheets/sheet1.xml', self._sheet_parts(rows)),
+        )
+
+        entries = []
+        offset = 0
+        for name, parts in files:
+            entry = _ZipEntry(name, offset, date_time)
+            entries.append(entry)
+            header = entry.local_header()
+            offset += len(header)
+            yield header
+
+            buf = []
+            buf_size = 0
+            for part in parts:
+                compressed = entry.compress(part)
+                if compressed:
+                    buf.append(compressed)
+                    buf_size += len(compressed)
+                if buf_size >= self.chunk_size:
+                    yield b''.join(buf)
+                    buf = []
+                    buf_size = 0
+            buf.append(entry.flush())
+            buf.append(entry.data_descriptor())
+            tail = b''.join(buf)
+            offset += entry.compressed_size + 16
+            yield tail
+
+        central_directory = b''.join(entry.central_directory_header()
+                                     for entry in entries)
+        yield central_directory + struct.pack(
+            b'<IHHHHIIH',
+            0x06054b50, 0, 0, len(entries), len(entries),
+            len(central_directory), offset, 0,
+        )
+
+    def _sheet_parts(self, rows):
+        yield SHEET_HEADER_XML
+        for index, row in enumerate(rows, 1):
+            yield self.row_xml(index, row)
+        yield SHEET_FOOTER_XML
@@ -4,6 +4,7 @@ from django.utils import timezone
 from django.views.generic import TemplateView, View
 
 from brambling.models import Event, BoughtItem, Order, Transaction
+from brambling.utils.permissions import prime_permissions
 
 
 class DashboardView(TemplateView):
@@ -28,6 +29,7 @@ class DashboardView(TemplateView):
                 Q(organization__members=user) |
                 Q(members=user)
             ).order_by('-last_modified').distinct()
+            prime_permissions(user, admin_events)
 
             # Registered events is upcoming things you are / might be going to.
             # So you've paid for something or you're going to.
@@ -5,6 +5,7 @@ from django.views.generic import TemplateView, View
 from brambling.models import Invite, Person
 from brambling.forms.user import SignUpForm, FloppyAuthenticationForm
 from brambling.utils.invites import get_invite_or_404, get_invite
+from brambling.utils.permissions import clear_request_permissions
 
 
 class InviteAcceptView(TemplateView):
@@ -22,6 +23,10 @@ class InviteAcceptView(TemplateView):
                     request.user.save()
                 self.invite.accept()
                 self.invite.invite.delete()
+                # Membership changes made by the invite have already
+                # invalidated the shared cache; the user object's own
+                # cache still needs clearing.
+                clear_request_permissions(request.user)
                 return HttpResponseRedirect(self.get_success_url())
         return super(InviteAcceptView, self).get(request, *args, **kwargs)
 
@@ -1,14 +1,20 @@
+import math
+import re
+
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.sites.shortcuts import get_current_site
 from django.core.urlresolvers import reverse
 from django.db.models import Q, Prefetch
+from django.db.transaction import atomic
 from django.forms.models import model_to_dict
 from django.http import HttpResponseRedirect, Http404, JsonResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.crypto import get_random_string
 from django.utils.decorators import method_decorator
+from django.utils.functional import cached_property
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.views.generic import TemplateView, View, UpdateView, FormView
 import floppyforms.__future__ as floppyforms
@@ -21,14 +27,69 @@ from brambling.forms.orders import OneTimePaymentForm
 from brambling.forms.orders import SavedCardPaymentForm
 from brambling.forms.orders import SurveyDataForm
 from brambling.forms.orders import TransferForm
-from brambling.mail import OrderReceiptMailer, OrderAlertMailer
-from brambling.models import (BoughtItem, ItemOption, Discount, Order,
+from brambling.mail import (OrderReceiptMailer, OrderAlertMailer,
+                            outbox_enabled, queue_mailer)
+from brambling.models import (BoughtItem, CheckoutAttempt, ItemOption, Discount, Order,
                               Attendee, EventHousing, Event, Transaction,
-                              Person, SavedAttendee, CustomForm)
+                              Person, SavedAttendee, CustomForm,
+                              WaitingRoomTicket)
 from brambling.utils.invites import TransferInvite
+from brambling.utils.waiting_room import (get_admit_at, is_admitted,
+                                          issue_session_ticket,
+                                          session_is_admitted)
 from brambling.views.utils import (get_event_admin_nav, ajax_required,
-                                   clear_expired_carts, Workflow, Step,
-                                   WorkflowMixin)
+                                   Workflow, Step, WorkflowMixin)
+
+
+#: Checkout keys are rendered into the payment forms with
+#: get_random_string's default characters.
+CHECKOUT_KEY_LENGTH = 32
+CHECKOUT_KEY_RE = re.compile(r'^[a-zA-Z0-9]{%d}\Z' % CHECKOUT_KEY_LENGTH)
+
+
+class OrderContext(object):
+    """
+    The parts of an order that the registration workflow's steps and
+    views all look at, loaded at most once per request.
+
+    """
+    def __init__(self, event, order):
+        self.event = event
+        self.order = order
+
+    def _get_bought_items(self):
+        bought_items = BoughtItem.objects.all()
+        if self.order.cart_is_expired():
+            # Expired carts are left for the expire_carts command to
+            # delete, so leave out their reserved items.
+            bought_items = bought_items.exclude(status=BoughtItem.RESERVED)
+        return bought_items
+
+    @cached_property
+    def bought_items(self):
+        if not self.order:
+            return []
+        return list(self._get_bought_items().filter(order=self.order).order_by(
+            'item_name', 'item_option_name',
+        ))
+
+    @cached_property
+    def attendees(self):
+        if not self.order:
+            return []
+        return list(self.order.attendees.order_by('pk').select_related(
+            'saved_attendee',
+        ).prefetch_related(Prefetch('bought_items', queryset=self._get_bought_items())))
+
+    def get_bought_items(self, statuses):
+        return [item for item in self.bought_items if item.status in statuses]
+
+
+class OrderWorkflow(Workflow):
+    def __init__(self, **kwargs):
+        if 'order_context' not in kwargs:
+            kwargs['order_context'] = OrderContext(kwargs['event'], kwargs.get('order'))
+        super(OrderWorkflow, self).__init__(**kwargs)
 
 
 class OrderStep(Step):
@@ -52,7 +113,8 @@ class ShopStep(OrderStep):
         order = self.workflow.order
         if not order:
             return False
-        return order.cart_start_time is not None or order.bought_items.exists()
+        has_cart = order.cart_start_time is not None and not order.cart_is_expired()
+        return has_cart or bool(self.workflow.order_context.bought_items)
 
 
 class AttendeeStep(OrderStep):
@@ -60,16 +122,14 @@ class AttendeeStep(OrderStep):
     slug = 'attendees'
     view_name = 'brambling_event_attendee_list'
 
-    def __init__(self, *args, **kwargs):
-        super(AttendeeStep, self).__init__(*args, **kwargs)
-        order = self.workflow.order
+    @cached_property
+    def bought_items(self):
         valid_statuses = (BoughtItem.RESERVED, BoughtItem.UNPAID, BoughtItem.BOUGHT)
-        if order:
-            self.bought_items = order.bought_items.filter(status__in=valid_statuses).order_by('item_name', 'item_option_name')
-            self.attendees = order.attendees.order_by('pk').select_related('saved_attendee')
-        else:
-            self.bought_items = []
-            self.attendees = []
+        return self.workflow.order_context.get_bought_items(valid_statuses)
+
+    @property
+    def attendees(self):
+        return self.workflow.order_context.attendees
 
     def _is_completed(self):
         if not self.workflow.order:
@@ -143,9 +203,8 @@ class HostingStep(OrderStep):
     def is_active(self):
         if not self.workflow.order:
             return False
-        if not hasattr(self, '_active'):
-            self._active = self.workflow.order.attendees.exclude(housing_status=Attendee.NEED).exists()
-        return self._active
+        return any(attendee.housing_status != Attendee.NEED
+                   for attendee in self.workflow.order_context.attendees)
 
     def _is_completed(self):
         if not self.workflow.order:
@@ -163,7 +222,7 @@ class OrderEmailStep(OrderStep):
 
     @classmethod
     def include_in(cls, workflow):
-        return workflow.order is None or workflow.order.person is None
+        return workflow.order is None or workflow.order.person_id is None
 
     def _is_completed(self):
         if not self.workflow.order:
@@ -180,20 +239,20 @@ class PaymentStep(OrderStep):
         return False
 
 
-class RegistrationWorkflow(Workflow):
+class RegistrationWorkflow(OrderWorkflow):
     step_classes = [ShopStep, AttendeeStep, SurveyStep,
                     HostingStep, OrderEmailStep, PaymentStep]
 
 
-class ShopWorkflow(Workflow):
+class ShopWorkflow(OrderWorkflow):
     step_classes = [ShopStep, AttendeeStep, HostingStep, PaymentStep]
 
 
-class SurveyWorkflow(Workflow):
+class SurveyWorkflow(OrderWorkflow):
     step_classes = [SurveyStep, PaymentStep]
 
 
-class HostingWorkflow(Workflow):
+class HostingWorkflow(OrderWorkflow):
     step_classes = [HostingStep, PaymentStep]
 
 
@@ -206,13 +265,17 @@ class OrderMixin(object):
                                        organization__slug=kwargs['organization_slug'])
         if not self.event.viewable_by(request.user):
             raise Http404
+        if not session_is_admitted(request, self.event):
+            return HttpResponseRedirect(reverse('brambling_event_waiting_room', kwargs={
+                'event_slug': self.event.slug,
+                'organization_slug': self.event.organization.slug,
+            }))
         try:
             self.order = self.get_order()
         except Order.DoesNotExist:
             raise Http404
 
-        if self.order and self.order.cart_is_expired():
-            self.order.delete_cart()
+        self.order_context = OrderContext(self.event, self.order)
         return super(OrderMixin, self).dispatch(request, *args, **kwargs)
 
     def get_order(self, create=False):
@@ -247,7 +310,8 @@ class OrderMixin(object):
         # Only used if this is combined with WorkflowMixin.
         return {
             'event': self.event,
-            'order': self.order
+            'order': self.order,
+            'order_context': self.order_context,
         }
 
     def get_reverse_kwargs(self):
@@ -259,6 +323,46 @@ class OrderMixin(object):
         return kwargs
 
 
+class WaitingRoomView(TemplateView):
+    """
+    Holds visitors in line while the event's waiting room is enabled,
+    and sends them on to the shop once their ticket is admitted.
+
+    """
+    template_name = 'brambling/event/order/waiting_room.html'
+
+    def dispatch(self, request, *args, **kwargs):
+        self.event = get_object_or_404(Event.objects.select_related('organization'),
+                                       slug=kwargs['event_slug'],
+                                       organization__slug=kwargs['organization_slug'])
+        if not self.event.viewable_by(request.user):
+            raise Http404
+        self.ticket = None
+        if self.event.waiting_room_enabled:
+            self.ticket = issue_session_ticket(request, self.event)
+        if self.ticket is None or is_admitted(self.ticket):
+            return HttpResponseRedirect(reverse('brambling_event_shop', kwargs={
+                'event_slug': self.event.slug,
+                'organization_slug': self.event.organization.slug,
+            }))
+        return super(WaitingRoomView, self).dispatch(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super(WaitingRoomView, self).get_context_data(**kwargs)
+        admit_at = get_admit_at(self.ticket)
+        wait = int(math.ceil((admit_at - timezone.now()).total_seconds()))
+        context.update({
+            'event': self.event,
+            'site': get_current_site(self.request),
+            'position': WaitingRoomTicket.objects.get_position(self.event, admit_at),
+            'wait_seconds': max(wait, 0),
+            # Check back when the ticket is due, but at least every
+            # ten seconds so the position stays current.
+            'refresh_seconds': min(max(wait, 1), 10),
+        })
+        return context
+
+
 class OrderCodeRedirectView(OrderMixin, View):
 
     def dispatch(self, request, *args, **kwargs):
@@ -305,8 +409,6 @@ class OrderCodeRedirectView(OrderMixin, View):
 class AddToOrderView(OrderMixin, View):
     @method_decorator(ajax_required)
     def post(self, request, *args, **kwargs):
-        clear_expired_carts(self.event)
-
         if self.order is None:
             return JsonResponse({'success': False, 'error': "Registration for this event is restricted."})
 
@@ -316,11 +418,14 @@ class AddToOrderView(OrderMixin, View):
         except ItemOption.DoesNotExist:
             raise Http404
 
-        # If a total number is set and has been reached, the item is sold out.
+        # If a total number is set and has been reached, the item is sold
+        # out. This is checked again while reserving the item, but most
+        # requests for sold out items can be turned away without locking.
         if item_option.total_number is not None and item_option.remaining <= 0:
             return JsonResponse({'success': False, 'error': 'That item is sold out.'})
 
-        self.order.add_to_cart(item_option)
+        if self.order.add_to_cart(item_option) is None:
+            return JsonResponse({'success': False, 'error': 'That item is sold out.'})
         return JsonResponse({'success': True})
 
     def get_order(self, create=True):
@@ -397,19 +502,11 @@ class ChooseItemsView(OrderMixin, WorkflowMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super(ChooseItemsView, self).get_context_data(**kwargs)
-        clear_expired_carts(self.event)
         now = timezone.now()
-        item_options = ItemOption.objects.filter(
+        item_options = ItemOption.objects.with_sales(self.event).filter(
             available_start__lte=now,
             available_end__gte=now,
-            item__event=self.event,
-        ).order_by('item', 'order').extra(select={
-            'taken': """
-SELECT COUNT(*) FROM brambling_boughtitem WHERE
-brambling_boughtitem.item_option_id = brambling_itemoption.id AND
-brambling_boughtitem.status != 'refunded'
-"""
-        })
+        ).order_by('item', 'order')
 
         context['item_options'] = item_options
         return context
@@ -661,73 +758,120 @@ class SummaryView(OrderMixin, WorkflowMixin, TemplateView):
         return self.render_to_response(context)
 
     def post(self, request, *args, **kwargs):
+        self.attempt = None
+        checkout_key = request.POST.get('checkout_key')
+        # Keys come from the client; anything that we didn't generate is
+        # ignored rather than stored and sent on to Stripe.
+        if checkout_key and CHECKOUT_KEY_RE.match(checkout_key):
+            self.attempt, claimed = CheckoutAttempt.objects.claim(self.order, checkout_key)
+            if not claimed:
+                # A retried submission: show the outcome of the original
+                # instead of paying again.
+                if self.attempt.status == CheckoutAttempt.PENDING:
+                    messages.info(request, "Your payment is still being processed.")
+                return self.get_success_response()
+
+        try:
+            payment = self.process_payment()
+        except Exception:
+            if self.attempt is not None:
+                self.attempt.fail()
+            raise
+
+        if payment is None:
+            if self.attempt is not None:
+                self.attempt.fail()
+            context = self.get_context_data(**kwargs)
+            return self.render_to_response(context)
+        if not outbox_enabled():
+            # Only send mail once the payment has been committed.
+            self.send_email(payment)
+        return self.get_success_response()
+
+    def process_payment(self):
+        """
+        Charges the order's balance, if it has one, and saves the
+        payment. Returns the payment, or None if it failed.
+
+        """
         self.summary_data = self.order.get_summary_data()
         self.net_balance = self.summary_data['net_balance']
         if self.net_balance <= 0:
-            valid = True
-            payment = Transaction.objects.create(
-                amount=self.net_balance,
-                method=Transaction.NONE,
-                transaction_type=Transaction.PURCHASE,
-                is_confirmed=True,
-                api_type=self.event.api_type,
-                event=self.event,
-                order=self.order,
-            )
-            self.order.mark_cart_paid(payment)
-            if not self.event.is_frozen:
-                self.event.is_frozen = True
-                self.event.save()
-            self.send_email(payment)
-        else:
-            self.get_forms()
-            form = None
-            valid = False
-            if 'choose_card' in request.POST:
-                # Get a choose form.
-                form = self.choose_card_form
-            if 'new_card' in request.POST:
-                # Get a new form.
-                form = self.new_card_form
-            if 'check' in request.POST:
-                form = self.check_form
-            if form and form.is_valid():
-                valid = True
+            with atomic():
+                payment = Transaction.objects.create(
+                    amount=self.net_balance,
+                    method=Transaction.NONE,
+                    transaction_type=Transaction.PURCHASE,
+                    is_confirmed=True,
+                    api_type=self.event.api_type,
+                    event=self.event,
+                    order=self.order,
+                )
+                self.complete_payment(payment)
+            return payment
+
+        self.get_forms()
+        form = None
+        if 'choose_card' in self.request.POST:
+            # Get a choose form.
+            form = self.choose_card_form
+        if 'new_card' in self.request.POST:
+            # Get a new form.
+            form = self.new_card_form
+        if 'check' in self.request.POST:
+            form = self.check_form
+        # Validating the form makes the charge, so it happens before
+        # the database transaction starts.
+        if form and form.is_valid():
+            with atomic():
                 payment = form.save()
-                self.order.mark_cart_paid(payment)
-                if not self.event.is_frozen:
-                    self.event.is_frozen = True
-                    self.event.save()
-                self.send_email(payment)
-            elif form:
-                for error in form.non_field_errors():
-                    messages.error(request, error)
-
-        if valid:
-            if not self.order.person:
-                url = reverse('brambling_event_order_summary', kwargs={
-                    'event_slug': self.event.slug,
-                    'organization_slug': self.event.organization.slug
-                })
-                return HttpResponseRedirect(url)
-            return HttpResponseRedirect('')
-        context = self.get_context_data(**kwargs)
-        return self.render_to_response(context)
+                self.complete_payment(payment)
+            return payment
+        elif form:
+            for error in form.non_field_errors():
+                messages.error(self.request, error)
+        return None
+
+    def complete_payment(self, payment):
+        self.order.mark_cart_paid(payment)
+        if not self.event.is_frozen:
+            self.event.is_frozen = True
+            self.event.save()
+        if self.attempt is not None:
+            self.attempt.succeed(payment)
+        if outbox_enabled():
+            # Queued with the payment, so the mail goes out if and only
+            # if the payment is committed.
+            self.send_email(payment, queue=True)
+
+    def get_success_response(self):
+        if not self.order.person:
+            url = reverse('brambling_event_order_summary', kwargs={
+                'event_slug': self.event.slug,
+                'organization_slug': self.event.organization.slug
+            })
+            return HttpResponseRedirect(url)
+        return HttpResponseRedirect('')
 
-    def send_email(self, payment):
+    def send_email(self, payment, queue=False):
         email_kwargs = {
             'transaction': payment,
             'site': get_current_site(self.request),
             'secure': self.request.is_secure()
         }
-        OrderReceiptMailer(**email_kwargs).send()
-        OrderAlertMailer(**email_kwargs).send()
+        for mailer_class in (OrderReceiptMailer, OrderAlertMailer):
+            if queue:
+                queue_mailer(mailer_class, **email_kwargs)
+            else:
+                mailer_class(**email_kwargs).send()
 
     def get_forms(self):
         kwargs = {
             'order': self.order,
             'amount': self.net_balance,
         }
+        if getattr(self, 'attempt', None) is not None:
+            kwargs['idempotency_key'] = self.attempt.get_idempotency_key()
         choose_data = None
         new_data = None
         check_data = None
@@ -751,10 +895,11 @@ class SummaryView(OrderMixin, WorkflowMixin, TemplateView):
         context = super(SummaryView, self).get_context_data(**kwargs)
 
         context.update({
-            'attendees': self.order.attendees.all(),
+            'attendees': self.workflow.order_context.attendees,
             'new_card_form': getattr(self, 'new_card_form', None),
             'choose_card_form': getattr(self, 'choose_card_form', None),
             'check_form': getattr(self, 'check_form', None),
+            'checkout_key': get_random_string(CHECKOUT_KEY_LENGTH),
             'net_balance': self.net_balance,
             'STRIPE_PUBLISHABLE_KEY': getattr(settings,
                                               'STRIPE_PUBLISHABLE_KEY',
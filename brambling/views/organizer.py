@@ -1,4 +1,3 @@
-import itertools
 import logging
 import pprint
 
@@ -6,7 +5,7 @@ from django.conf import settings
 from django.contrib import messages
 from django.contrib.sites.shortcuts import get_current_site
 from django.core.urlresolvers import reverse
-from django.db.models import Count, Sum, Q
+from django.db.models import Count, Q
 from django.forms import formset_factory
 from django.http import (Http404, HttpResponseRedirect, JsonResponse,
                          StreamingHttpResponse)
@@ -18,10 +17,7 @@ from django.views.generic import (ListView, CreateView, UpdateView, FormView,
                                   TemplateView, DetailView, View, DeleteView)
 
 from floppyforms.__future__.models import modelform_factory
-from openpyxl import Workbook
-from openpyxl.writer.excel import save_virtual_workbook
 import requests
-import unicodecsv as csv
 
 
 from brambling.forms.invites import (
@@ -42,12 +38,11 @@ from brambling.mail import OrderReceiptMailer
 from brambling.models import (Event, Item, Discount, Transaction,
                               ItemOption, Attendee, Order,
                               BoughtItem, CustomForm, Organization,
-                              SavedReport, EventMember, OrganizationMember)
+                              SavedReport, EventMember, OrganizationMember,
+                              ExportJob, EventSummary, ItemOptionSummary)
 from brambling.templatetags.zenaida import format_money
 from brambling.views.utils import (get_event_admin_nav,
-                                   get_organization_admin_nav,
-                                   clear_expired_carts,
-                                   FinanceTable)
+                                   get_organization_admin_nav)
 from brambling.utils.invites import (
     get_invite_class,
     EventInvite,
@@ -57,7 +52,19 @@ from brambling.utils.invites import (
     OrganizationEditInvite,
     OrganizationViewInvite,
 )
-from brambling.utils.model_tables import Echo, AttendeeTable, OrderTable
+from brambling.utils.exports import (
+    CONTENT_TYPES as EXPORT_CONTENT_TYPES,
+    EXPORT_CHUNK_SIZE,
+    get_attendee_queryset,
+    get_finance_rows,
+    get_order_queryset,
+    get_table_rows,
+    get_transaction_queryset,
+    normalize_querystring,
+    stream_export,
+)
+from brambling.utils.model_tables import (AttendeeTable, FinanceTable,
+                                          OrderTable, PAGE_FIELD)
 from brambling.payment.core import LIVE, TEST
 from brambling.payment.stripe.auth import stripe_organization_oauth_url
 
@@ -334,7 +341,6 @@ class EventSummaryView(TemplateView):
                                        organization__slug=self.kwargs['organization_slug'])
         if not request.user.has_perm('view', self.event):
             raise Http404
-        clear_expired_carts(self.event)
         return super(EventSummaryView, self).get(request, *args, **kwargs)
 
     def get_context_data(self, **kwargs):
@@ -343,80 +349,45 @@ class EventSummaryView(TemplateView):
         # page.
         context = super(EventSummaryView, self).get_context_data(**kwargs)
 
+        summary = EventSummary.objects.for_event(self.event)
+
         itemoptions = ItemOption.objects.filter(
             item__event=self.event
         ).select_related('item').order_by('item')
 
-        gross_sales = 0
-        itemoption_map = {}
-
+        bought_counts = dict(ItemOptionSummary.objects.filter(
+            item_option__item__event=self.event,
+        ).values_list('item_option', 'bought_count'))
         for itemoption in itemoptions:
-            itemoption_map[itemoption.pk] = itemoption
-            itemoption.boughtitem__count = BoughtItem.objects.filter(
-                item_option=itemoption,
-                status=BoughtItem.BOUGHT
-            ).count()
-            gross_sales += itemoption.price * itemoption.boughtitem__count
+            itemoption.boughtitem__count = bought_counts.get(itemoption.pk, 0)
 
         discounts = list(Discount.objects.filter(
             event=self.event
         ).annotate(used_count=Count('boughtitemdiscount')))
 
-        confirmed_purchases = Transaction.objects.filter(
-            transaction_type=Transaction.PURCHASE,
-            event=self.event,
-            is_confirmed=True,
-        ).aggregate(sum=Sum('amount'))['sum'] or 0
-
-        pending_purchases = Transaction.objects.filter(
-            transaction_type=Transaction.PURCHASE,
-            event=self.event,
-            is_confirmed=False,
-        ).aggregate(sum=Sum('amount'))['sum'] or 0
-
-        refunds = Transaction.objects.filter(
-            transaction_type=Transaction.REFUND,
-            event=self.event,
-        ).aggregate(sum=Sum('amount'))['sum'] or 0
-
-        sums = Transaction.objects.filter(
-            event=self.event,
-        ).aggregate(
-            amount=Sum('amount'),
-            application_fee=Sum('application_fee'),
-            processing_fee=Sum('processing_fee'),
-        )
-
-        fees = (sums['application_fee'] or 0) + (sums['processing_fee'] or 0)
-
-        attendees = Attendee.objects.filter(
-            order__event=self.event,
-            bought_items__status=BoughtItem.BOUGHT,
-        ).distinct()
-
         context.update({
             'event': self.event,
             'event_admin_nav': get_event_admin_nav(self.event, self.request),
             'event_permissions': self.request.user.get_all_permissions(self.event),
 
-            'attendee_count': attendees.count(),
+            'attendee_count': summary.attendee_count,
             'itemoptions': itemoptions,
             'discounts': discounts,
 
-            'confirmed_purchases': confirmed_purchases,
-            'pending_purchases': pending_purchases,
+            'confirmed_purchases': summary.confirmed_purchases,
+            'pending_purchases': summary.pending_purchases,
 
-            'refunds': refunds,
-            'fees': -1 * fees,
+            'refunds': summary.refunds,
+            'fees': -1 * summary.fees,
 
-            'net_total': (sums['amount'] or 0) - fees,
+            'net_total': summary.net_amount - summary.fees,
         })
 
         if self.event.collect_housing_data:
             context.update({
-                'attendee_requesting_count': attendees.filter(housing_status=Attendee.NEED).count(),
-                'attendee_arranged_count': attendees.filter(housing_status=Attendee.HAVE).count(),
-                'attendee_home_count': attendees.filter(housing_status=Attendee.HOME).count(),
+                'attendee_requesting_count': summary.attendee_need_count,
+                'attendee_arranged_count': summary.attendee_have_count,
+                'attendee_home_count': summary.attendee_home_count,
             })
         return context
 
@@ -1010,9 +981,52 @@ class CustomFormListView(ListView):
         return context
 
 
+class BackgroundExportMixin(object):
+    """
+    If settings.BACKGROUND_EXPORTS is True, CSV / XLSX exports are
+    rendered by the run_export_jobs management command instead of in
+    the request. Requires self.event to be set.
+
+    """
+    export_report_type = None
+    export_filename = 'export'
+
+    def background_exports_enabled(self):
+        return getattr(settings, 'BACKGROUND_EXPORTS', False)
+
+    def get_export_response(self, format_):
+        querystring = normalize_querystring(self.request.GET)
+        job = ExportJob.objects.enqueue(
+            event=self.event,
+            report_type=self.export_report_type,
+            format=format_,
+            querystring=querystring,
+        )
+        if job.is_fresh(self.event):
+            job.file.open('rb')
+            response = StreamingHttpResponse(job.file.chunks(),
+                                             content_type=EXPORT_CONTENT_TYPES[format_])
+            response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(
+                self.export_filename, format_)
+            return response
+
+        if job.status == ExportJob.FAILED:
+            messages.error(self.request, "Your export could not be prepared. "
+                                         "Please try again.")
+        else:
+            messages.info(self.request, "Your export is being prepared. "
+                                        "Download it again in a minute or two.")
+        return HttpResponseRedirect("{}?{}".format(self.request.path, querystring))
+
+
 class ModelTableView(ListView):
     model_table = None
     form_prefix = 'column'
+    #: Number of rows fetched at a time for CSV / XLSX exports.
+    export_chunk_size = EXPORT_CHUNK_SIZE
+    #: Number of rows shown per page in the HTML table. If None, all
+    #: rows are shown.
+    table_page_size = None
 
     def get_table_kwargs(self, queryset):
         kwargs = {
@@ -1021,8 +1035,20 @@ class ModelTableView(ListView):
         }
         if self.request.GET:
             kwargs['data'] = self.request.GET
+        if self.request.GET.get('format') in ('csv', 'xlsx'):
+            kwargs['chunk_size'] = self.export_chunk_size
+        else:
+            kwargs['page_size'] = self.table_page_size
         return kwargs
 
+    def get_page_url(self, cursor):
+        qd = self.request.GET.copy()
+        qd.pop(PAGE_FIELD, None)
+        if cursor is not None:
+            qd[PAGE_FIELD] = cursor
+        querystring = qd.urlencode()
+        return "{}?{}".format(self.request.path, querystring) if querystring else self.request.path
+
     def get_table(self, queryset):
         if not self.model_table:
             raise ValueError("model_table cannot be None")
@@ -1030,7 +1056,13 @@ class ModelTableView(ListView):
 
     def get_context_data(self, **kwargs):
         context = super(ModelTableView, self).get_context_data(**kwargs)
-        context['table'] = self.get_table(self.object_list)
+        table = self.get_table(self.object_list)
+        context['table'] = table
+        if table.is_paginated:
+            if self.request.GET.get(PAGE_FIELD):
+                context['first_page_url'] = self.get_page_url(None)
+            if table.next_cursor is not None:
+                context['next_page_url'] = self.get_page_url(table.next_cursor)
         return context
 
     def render_to_response(self, context, *args, **kwargs):
@@ -1038,37 +1070,20 @@ class ModelTableView(ListView):
 
         format_ = self.request.GET.get('format', default='html')
 
-        if format_ == 'csv':
-            table = context['table']
-            pseudo_buffer = Echo()
-            writer = csv.writer(pseudo_buffer)
-            response = StreamingHttpResponse((writer.writerow([unicode(cell) for cell in row])
-                                              for row in itertools.chain((table.header_row(),), table)),
-                                             content_type="text/csv")
-            response['Content-Disposition'] = 'attachment; filename="export.csv"'
-            return response
-        elif format_ == 'xlsx':
-            table = context['table']
-            all_rows = itertools.chain((table.header_row(),), table)
-            wb = Workbook(encoding='utf-8')
-            ws = wb.active
-            ws.title = 'Data'
-            for i, row in enumerate(all_rows):
-                for j, cell in enumerate(row):
-                    ws.cell(row=i + 1, column=j + 1, value=unicode(cell))
-            response = StreamingHttpResponse(
-                save_virtual_workbook(wb),
-                content_type='application/vnd.ms-excel')
-            response['Content-Disposition'] = ('attachment; '
-                                               'filename="export.xlsx"')
+        if format_ in ('csv', 'xlsx'):
+            rows = get_table_rows(context['table'])
+            response = StreamingHttpResponse(stream_export(rows, format_, sheet_title='Data'),
+                                             content_type=EXPORT_CONTENT_TYPES[format_])
+            response['Content-Disposition'] = 'attachment; filename="export.{}"'.format(format_)
             return response
 
         # Default to the template.
         return super(ModelTableView, self).render_to_response(context, *args, **kwargs)
 
 
-class EventTableView(ModelTableView):
+class EventTableView(BackgroundExportMixin, ModelTableView):
     report_type = None
+    table_page_size = 100
 
     def get(self, request, *args, **kwargs):
         self.event = get_object_or_404(Event.objects.select_related('organization'),
@@ -1109,7 +1124,7 @@ class EventTableView(ModelTableView):
                 report_type=self.report_type,
                 event=self.event,
                 name=name,
-                querystring=qd.urlencode()
+                querystring=normalize_querystring(qd)
             )
 
         if report is not None:
@@ -1119,6 +1134,12 @@ class EventTableView(ModelTableView):
 
         return super(EventTableView, self).get(request, *args, **kwargs)
 
+    def render_to_response(self, context, *args, **kwargs):
+        format_ = self.request.GET.get('format', default='html')
+        if format_ in ('csv', 'xlsx') and self.background_exports_enabled():
+            return self.get_export_response(format_)
+        return super(EventTableView, self).render_to_response(context, *args, **kwargs)
+
     def get_table_kwargs(self, queryset):
         kwargs = super(EventTableView, self).get_table_kwargs(queryset)
         kwargs['event'] = self.event
@@ -1145,13 +1166,10 @@ class AttendeeFilterView(EventTableView):
     model = Attendee
     model_table = AttendeeTable
     report_type = SavedReport.ATTENDEE
+    export_report_type = ExportJob.ATTENDEE
 
     def get_queryset(self):
-        qs = super(AttendeeFilterView, self).get_queryset()
-        return qs.filter(
-            order__event=self.event,
-            bought_items__status=BoughtItem.BOUGHT,
-        ).distinct()
+        return get_attendee_queryset(self.event)
 
 
 class OrderFilterView(EventTableView):
@@ -1160,13 +1178,10 @@ class OrderFilterView(EventTableView):
     model = Order
     model_table = OrderTable
     report_type = SavedReport.ORDER
+    export_report_type = ExportJob.ORDER
 
     def get_queryset(self):
-        qs = super(OrderFilterView, self).get_queryset()
-        return qs.annotate(transaction_count=Count('transactions')).filter(
-            event=self.event,
-            transaction_count__gt=0,
-        )
+        return get_order_queryset(self.event)
 
 
 class RefundView(FormView):
@@ -1376,10 +1391,12 @@ class SendReceiptView(View):
         ))
 
 
-class FinancesView(ListView):
+class FinancesView(BackgroundExportMixin, ListView):
     model = Transaction
     context_object_name = 'transactions'
     template_name = 'brambling/event/organizer/finances.html'
+    export_report_type = ExportJob.FINANCE
+    export_filename = 'finances'
 
     def get_queryset(self):
         self.event = get_object_or_404(Event.objects.select_related('organization'),
@@ -1387,10 +1404,7 @@ class FinancesView(ListView):
                                        organization__slug=self.kwargs['organization_slug'])
         if not self.request.user.has_perm('view', self.event):
             raise Http404
-        return super(FinancesView, self).get_queryset().filter(
-            event=self.event,
-            api_type=self.event.api_type,
-        ).select_related('created_by', 'order', 'related_transaction').order_by('-timestamp')
+        return get_transaction_queryset(self.event)
 
     def get_context_data(self, **kwargs):
         context = super(FinancesView, self).get_context_data(**kwargs)
@@ -1407,31 +1421,14 @@ class FinancesView(ListView):
 
         format_ = self.request.GET.get('format', default='html')
 
-        if format_ == 'csv':
-            context = super(FinancesView, self).get_context_data(**kwargs)
-            table = FinanceTable(self.event, context['transactions'])
-
-            pseudo_buffer = Echo()
-            writer = csv.writer(pseudo_buffer)
-            response = StreamingHttpResponse((writer.writerow([unicode(cell.value) for cell in row])
-                                              for row in table.get_rows(include_headers=True)),
-                                             content_type="text/csv")
-            response['Content-Disposition'] = 'attachment; filename="finances.csv"'
-            return response
-        elif format_ == 'xlsx':
+        if format_ in ('csv', 'xlsx'):
+            if self.background_exports_enabled():
+                return self.get_export_response(format_)
             context = super(FinancesView, self).get_context_data(**kwargs)
-            table = FinanceTable(self.event, context['transactions'])
-            wb = Workbook(encoding='utf-8')
-            ws = wb.active
-            ws.title = 'Finances'
-            for i, row in enumerate(table.get_rows(include_headers=True)):
-                for j, cell in enumerate(row):
-                    ws.cell(row=i + 1, column=j + 1, value=unicode(cell.value))
-            response = StreamingHttpResponse(
-                save_virtual_workbook(wb),
-                content_type='application/vnd.ms-excel')
-            response['Content-Disposition'] = ('attachment; '
-                                               'filename="finances.xlsx"')
+            rows = get_finance_rows(FinanceTable(self.event, context['transactions']))
+            response = StreamingHttpResponse(stream_export(rows, format_, sheet_title='Finances'),
+                                             content_type=EXPORT_CONTENT_TYPES[format_])
+            response['Content-Disposition'] = 'attachment; filename="finances.{}"'.format(format_)
             return response
 
         # Default to the template.
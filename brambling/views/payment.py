@@ -1,5 +1,6 @@
 import json
 
+from django.db.transaction import atomic
 from django.http import Http404
 from django.http import HttpResponse
 from django.utils.decorators import method_decorator
@@ -110,6 +111,9 @@ class StripeWebhookView(View):
                 'api_type': txn.api_type,
                 'event': txn.event,
             }
-            Transaction.from_stripe_refund(refund_group, **refund_kwargs)
+            with atomic():
+                Transaction.from_stripe_refund(refund_group, **refund_kwargs)
+                if txn.order is not None:
+                    txn.order.update_balance()
 
         return HttpResponse(status=200)
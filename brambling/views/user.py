@@ -2,7 +2,7 @@ from django.conf import settings
 from django.contrib import messages
 from django.contrib.sites.shortcuts import get_current_site
 from django.core.urlresolvers import reverse
-from django.db.models import Max, Sum, Q
+from django.db.models import F, Q
 from django.http import Http404, HttpResponseRedirect, HttpResponse
 from django.utils.http import urlsafe_base64_decode, is_safe_url
 from django.views.generic import (DetailView, CreateView, UpdateView,
@@ -15,7 +15,7 @@ from brambling.forms.user import HomeForm
 from brambling.forms.user import SignUpForm
 from brambling.models import (Person, Home, CreditCard, Order, SavedAttendee,
                               Event, Transaction, BoughtItem,
-                              EventHousing, Attendee)
+                              EventHousing, Attendee, SearchToken)
 from brambling.mail import ConfirmationMailer
 from brambling.payment.stripe.api import (
     stripe_get_customer,
@@ -26,6 +26,7 @@ from brambling.payment.stripe.core import (
     stripe_live_settings_valid,
 )
 from brambling.tokens import token_generators
+from brambling.utils.permissions import prime_permissions
 
 
 class SignUpView(CreateView):
@@ -334,7 +335,12 @@ class MergeOrderView(View):
         Attendee.objects.filter(order=old_order).update(order=new_order)
         Transaction.objects.filter(order=old_order).update(order=new_order)
         BoughtItem.objects.filter(order=old_order).update(order=new_order)
+        SearchToken.objects.filter(
+            order=old_order,
+            attendee__isnull=False,
+        ).update(order=new_order)
         old_order.delete()
+        new_order.update_balance()
 
         messages.add_message(request, messages.SUCCESS,
                              "Orders successfully merged.")
@@ -377,13 +383,12 @@ class OrderHistoryView(TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super(OrderHistoryView, self).get_context_data(**kwargs)
-        orders = Order.objects.annotate(
-            last_transaction_date=Max('transactions__timestamp'),
-            total=Sum('transactions__amount'),
-        ).filter(
+        orders = Order.objects.filter(
             person=self.request.user,
-            total__isnull=False,
-        ).select_related('event__organization').order_by('-last_transaction_date')
+            transaction_count__gt=0,
+        ).annotate(
+            total=F('total_paid') + F('total_refunded'),
+        ).select_related('event__organization').order_by('-last_transaction_time')
         context.update({
             'orders': orders,
             'claimable_orders': self.request.user.get_claimable_orders(),
@@ -406,6 +411,9 @@ class OrganizeEventsView(TemplateView):
             Q(organization__members=self.request.user) |
             Q(members=self.request.user)
         ).order_by('-last_modified').select_related('organization').distinct()
+        # Organizers go on from here to the events' admin pages, which
+        # check permissions; load them for all the events at once.
+        prime_permissions(self.request.user, admin_events)
         context['admin_events'] = admin_events
         return context
 
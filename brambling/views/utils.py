@@ -1,18 +1,13 @@
 from collections import OrderedDict
-from datetime import timedelta
 from functools import wraps
 from itertools import ifilter
 
-import pytz
 from django.core.urlresolvers import reverse
 from django.db.models import Max, Min
 from django.http import HttpResponseRedirect, Http404
 from django.shortcuts import get_object_or_404
-from django.utils import timezone
 
-from brambling.models import Event, BoughtItem
-from brambling.templatetags.zenaida import format_money
-from brambling.utils.model_tables import Cell, Row
+from brambling.models import Event
 
 
 def get_event_or_404(slug):
@@ -99,16 +94,6 @@ def ajax_required(view):
     return wrapped
 
 
-def clear_expired_carts(event):
-    expired_before = timezone.now() - timedelta(minutes=event.cart_timeout)
-    BoughtItem.objects.filter(
-        status=BoughtItem.RESERVED,
-        order__event=event,
-        order__cart_start_time__isnull=False,
-        order__cart_start_time__lte=expired_before
-    ).delete()
-
-
 class Workflow(object):
     step_classes = []
 
@@ -238,63 +223,3 @@ class WorkflowMixin(object):
             'next_step': self.current_step.next_step if self.current_step else None,
         })
         return context
-
-
-class FinanceTable(object):
-
-    def __init__(self, event, transactions):
-        self.event = event
-        self.transactions = transactions
-
-    def headers(self):
-        return [
-            'Timestamp (%s)' % self.event.timezone,
-            'Created By',
-            'Method',
-            'Type',
-            'Order',
-            'Amount',
-            'Dancerfly Fee',
-            'Payment Fee',
-        ]
-
-    def header_cells(self):
-        return [Cell(field='header', value=col) for col in self.headers()]
-
-    def get_rows(self, include_headers=False):
-        if include_headers:
-            yield self.header_cells()
-        for transaction in self.transactions:
-            yield self.format_transaction(transaction)
-
-    def money(self, amount):
-        return format_money(amount, self.event.currency)
-
-    def format_transaction(self, transaction):
-        return Row((
-            ('timestamp', self.format_timestamp(transaction)),
-            ('created_by', self.created_by_name(transaction)),
-            ('method', transaction.get_method_display()),
-            ('type', transaction.get_transaction_type_display()),
-            ('order', self.order_code(transaction)),
-            ('amount', self.money(transaction.amount)),
-            ('application_fee', self.money(transaction.application_fee)),
-            ('processing_fee', self.money(transaction.processing_fee)),
-        ), obj=transaction)
-
-    def format_timestamp(self, transaction):
-        tz = pytz.timezone(self.event.timezone)
-        localtime = timezone.localtime(transaction.timestamp, timezone=tz)
-        return localtime.strftime("%B %d, %Y %H:%M:%S")
-
-    def order_code(self, transaction):
-        if transaction.order:
-            return transaction.order.code
-        else:
-            return ''
-
-    def created_by_name(self, transaction):
-        if transaction.created_by:
-            return transaction.created_by.get_full_name()
-        else:
-            return ''
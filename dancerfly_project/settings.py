@@ -180,6 +180,28 @@ MEDIA_URL = os.environ.get('MEDIA_URL', '/media/')
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 DEFAULT_FILE_STORAGE = os.environ.get('DEFAULT_FILE_STORAGE', 'django.core.files.storage.FileSystemStorage')
 
+# Storage for files which must not be publicly readable, such as
+# rendered exports. On S3, use brambling.storage.PrivateMediaS3Storage.
+PRIVATE_FILE_STORAGE = os.environ.get('PRIVATE_FILE_STORAGE', 'django.core.files.storage.FileSystemStorage')
+PRIVATE_MEDIA_ROOT = os.path.join(BASE_DIR, 'private')
+
+# If True, CSV / XLSX exports are rendered by the run_export_jobs
+# management command rather than during the request.
+BACKGROUND_EXPORTS = bool(os.environ.get('BACKGROUND_EXPORTS', False))
+
+# If True, checkout receipts and alerts are queued in the outbox and
+# sent by the send_outbox management command rather than during the
+# request.
+BACKGROUND_MAIL = bool(os.environ.get('BACKGROUND_MAIL', False))
+
+# Seconds that a person's event and organization permissions are cached
+# between requests. 0 disables the shared cache; permissions are then
+# only cached for the length of a request. Needs a default cache which
+# all the processes share, such as memcached; Django's local-memory
+# cache (the default) is refused, since revoked permissions would stay
+# cached in the other processes.
+PERMISSION_CACHE_TIMEOUT = int(os.environ.get('PERMISSION_CACHE_TIMEOUT', 0))
+
 AWS_ACCESS_KEY_ID = os.environ.get('AWS_ACCESS_KEY_ID', '')
 AWS_SECRET_ACCESS_KEY = os.environ.get('AWS_SECRET_ACCESS_KEY', '')
 AWS_STORAGE_BUCKET_NAME = os.environ.get('AWS_STORAGE_BUCKET_NAME', '')
@@ -206,6 +228,12 @@ STRIPE_TEST_ORGANIZATION_USER_ID = os.environ.get('STRIPE_TEST_ORGANIZATION_USER
 
 GRAPPELLI_ADMIN_TITLE = "Dancerfly"
 
+# API lists are only paginated when a client asks for a page size or
+# passes a cursor; see brambling.api.v1.pagination.
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'brambling.api.v1.pagination.CursorPagination',
+}
+
 STATICFILES_FINDERS = (
     'django.contrib.staticfiles.finders.FileSystemFinder',
     'django.contrib.staticfiles.finders.AppDirectoriesFinder',